@@ -0,0 +1,674 @@
+"""
+Kinneckt KB benchmarks.
+
+    python bench_hr_kb.py chunking [--queries 300] [--top-k 3]
+    python bench_hr_kb.py retrieval [--sizes 10000 100000 1000000]
+    python bench_hr_kb.py ranking [--queries 500] [--top-k 3]
+    python bench_hr_kb.py ann [--sizes 100000 1000000] [--nprobe 1 2 4 8 16 32]
+    python bench_hr_kb.py compact [--queries 500] [--min-df 2] [--max-df 0.5]
+    python bench_hr_kb.py eval [--queries-file labeled.jsonl] [--output run.json] [--baseline old.json]
+
+chunking: compares chunkers on the PDFs in knowledge_base/. Queries are
+sampled sentences with half of their words dropped; a query is a hit when one
+of the top-k retrieved chunks contains the whole source sentence, i.e. the
+passage came back in one coherent piece. Prompt tokens are the estimated
+tokens of the top-k chunks that would be sent to the LLM.
+
+retrieval: search_kb latency on synthetic TF-IDF corpora (Zipfian terms,
+about 52 terms per chunk like the real index), comparing the original
+cosine_similarity + full argsort scan against SparseRetriever, and one
+search() call per query against search_batch().
+
+ranking: TF-IDF cosine against BM25 / BM25+ (and LSA plus BM25+LSA hybrid
+fusion when the index was built with --lsa-dims) on the built index in kb_index/,
+with the same sampled-sentence queries as the chunking benchmark: hit@1,
+hit@k, MRR@k, estimated tokens of the top-k chunks, and per-query latency.
+The "windowed" columns repeat hit@k and prompt tokens after the chat
+prompt's query-focused snippet windows (kb_snippets, --snippet-tokens).
+
+ann: recall/latency tradeoff of the IVF index against exact dense search,
+for a range of nprobe values. Runs on synthetic clustered unit vectors and,
+when kb_index/ was built with --lsa-dims and --ivf-lists, on the real LSA
+vectors. recall@k is the share of the exact top-k the IVF search returns.
+
+compact: re-indexes the chunks of kb_index/ at full precision, as float32,
+float32 with a pruned vocabulary and as pruned uint8, into temporary
+directories. Reports size on disk, load time, TF-IDF and BM25 latency,
+top-k agreement with the full-precision index and hit@k on the sampled
+sentence queries.
+
+eval: retrieval quality and latency of an index against a labeled query
+set, written as JSON so runs can be diffed. The query set is JSON Lines,
+one {"query": ..., "source": "<pdf name>", "page": <int>} per line ("page"
+optional); without --queries-file, --sample sentence queries are labeled
+with the page they came from (--save-queries keeps them as such a file). A
+retrieved chunk is relevant when it is from the expected source and its
+pages (or a deduplicated copy's) include the expected page. Reports
+recall@k (share of queries with a relevant chunk in the top k), MRR,
+p50/p95/p99 search latency (transform + search, no cache), the index size
+on disk and the process RSS growth from opening and querying it;
+--baseline prints the change against an earlier run.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+import build_hr_kb as kb
+import kb_store
+from kb_retrieval import (
+    BM25Retriever,
+    DenseRetriever,
+    HybridRetriever,
+    IVFRetriever,
+    SparseRetriever,
+    build_ivf,
+)
+from kb_snippets import SnippetWindower
+
+
+def load_pages(workers: int | None = None):
+    print("Extracting pages...")
+    extracted = kb.extract_pages(sorted(kb.KB_DIR.glob("*.pdf")), workers=workers, cache=kb.PageTextCache())
+    return list(kb.group_pages(extracted))
+
+
+def sample_sentence_queries(documents, n: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    candidates = []
+    for source, pages in documents:
+        for page, raw_text in pages:
+            for paragraph in kb.split_paragraphs(raw_text):
+                for sentence in kb.split_sentences(paragraph):
+                    if 12 <= len(sentence.split()) <= 40:
+                        candidates.append((source, page, sentence))
+
+    queries = []
+    for source, page, sentence in rng.sample(candidates, min(n, len(candidates))):
+        words = sentence.split()
+        keep = sorted(rng.sample(range(len(words)), len(words) // 2))
+        queries.append(
+            {
+                "query": " ".join(words[i] for i in keep),
+                "sentence": sentence,
+                "source": source,
+                "page": page,
+            }
+        )
+    return queries
+
+
+def evaluate_chunks(chunks: list[dict], queries: list[dict], top_k: int) -> dict:
+    texts = [c["text"] for c in chunks]
+    vectorizer = TfidfVectorizer(stop_words="english")
+    matrix = vectorizer.fit_transform(texts)
+    sims = (vectorizer.transform([q["query"] for q in queries]) @ matrix.T).toarray()
+
+    hits_at_1 = hits_at_k = prompt_tokens = 0
+    for i, q in enumerate(queries):
+        top = np.argsort(-sims[i], kind="stable")[:top_k]
+        found = [q["sentence"] in texts[j] for j in top]
+        hits_at_1 += found[0]
+        hits_at_k += any(found)
+        prompt_tokens += sum(kb.estimate_tokens(texts[j]) for j in top)
+
+    n = len(queries)
+    return {
+        "hit@1": hits_at_1 / n,
+        f"hit@{top_k}": hits_at_k / n,
+        "prompt_tokens": prompt_tokens / n,
+    }
+
+
+def bench_chunking(args):
+    documents = load_pages(args.workers)
+    queries = sample_sentence_queries(documents, args.queries)
+    print(f"{len(queries)} sampled queries, top_k={args.top_k}\n")
+
+    defaults = kb.CHUNKING_DEFAULTS
+    configs = [
+        ("fixed 900 chars", dict(defaults, chunker="fixed")),
+        ("sentence", dict(defaults)),
+        ("sentence, no overlap", dict(defaults, overlap_tokens=0)),
+        ("sentence, per page", dict(defaults, merge_pages=False)),
+    ]
+
+    header = f"{'chunker':<22} {'chunks':>7} {'chunk ms':>9} {'hit@1':>7} {f'hit@{args.top_k}':>7} {'prompt tok':>11}"
+    print(header)
+    print("-" * len(header))
+    for label, chunking in configs:
+        started = time.perf_counter()
+        chunks = []
+        for source, pages in documents:
+            chunks.extend(kb.chunk_document(source, pages, **chunking))
+        chunk_ms = (time.perf_counter() - started) * 1000
+
+        result = evaluate_chunks(chunks, queries, args.top_k)
+        print(
+            f"{label:<22} {len(chunks):>7} {chunk_ms:>9.0f} {result['hit@1']:>7.1%} "
+            f"{result[f'hit@{args.top_k}']:>7.1%} {result['prompt_tokens']:>11.0f}"
+        )
+
+
+def synthetic_index(n_chunks: int, n_terms: int = 50000, terms_per_chunk: int = 52, seed: int = 0):
+    """L2-normalized TF-IDF-like CSR matrix with a Zipfian term distribution."""
+    rng = np.random.default_rng(seed)
+    p = 1.0 / np.arange(1, n_terms + 1) ** 1.05
+    p /= p.sum()
+    idf = np.log(1.0 / p)
+
+    blocks = []
+    for start in range(0, n_chunks, 100_000):
+        rows = min(100_000, n_chunks - start)
+        cols = rng.choice(n_terms, size=rows * terms_per_chunk, p=p).astype(np.int32)
+        data = idf[cols] * (1.0 + rng.random(len(cols)))
+        indptr = np.arange(0, len(cols) + 1, terms_per_chunk)
+        block = csr_matrix((data, cols, indptr), shape=(rows, n_terms))
+        block.sum_duplicates()
+        blocks.append(normalize(block))
+
+    return vstack(blocks, format="csr"), p, idf
+
+
+def synthetic_queries(n: int, p: np.ndarray, idf: np.ndarray, seed: int = 1):
+    """Queries of 2-6 terms, skipping the 50 most common (stop-word-like) terms."""
+    rng = np.random.default_rng(seed)
+    q = p[50:] / p[50:].sum()
+    rows = []
+    for _ in range(n):
+        terms = np.unique(50 + rng.choice(len(q), size=rng.integers(2, 7), p=q))
+        vec = csr_matrix((idf[terms], terms, [0, len(terms)]), shape=(1, len(p)))
+        rows.append(normalize(vec))
+    return rows
+
+
+def _percentiles(samples_ms: list[float]) -> str:
+    p50, p95 = np.percentile(samples_ms, [50, 95])
+    return f"{p50:>8.2f} {p95:>8.2f}"
+
+
+def bench_retrieval(args):
+    print(f"{'chunks':>9} {'engine':<22} {'p50 ms':>8} {'p95 ms':>8} {'top-1 agree':>12}")
+    print("-" * 63)
+    for n_chunks in args.sizes:
+        matrix, p, idf = synthetic_index(n_chunks)
+        queries = synthetic_queries(args.queries, p, idf)
+        retriever = SparseRetriever(matrix)
+
+        baseline_ms, baseline_top = [], []
+        for q in queries[:args.baseline_queries]:
+            started = time.perf_counter()
+            sims = cosine_similarity(q, matrix)[0]
+            top = sims.argsort()[::-1][:args.top_k]
+            baseline_ms.append((time.perf_counter() - started) * 1000)
+            baseline_top.append(int(top[0]))
+
+        engine_ms, engine_top = [], []
+        for q in queries:
+            started = time.perf_counter()
+            hits = retriever.search(q, args.top_k)
+            engine_ms.append((time.perf_counter() - started) * 1000)
+            engine_top.append(hits[0][0] if hits else -1)
+
+        started = time.perf_counter()
+        retriever.search_batch(vstack(queries, format="csr"), args.top_k)
+        batch_qps = len(queries) / (time.perf_counter() - started)
+        loop_qps = len(queries) / (sum(engine_ms) / 1000)
+
+        agree = np.mean([a == b for a, b in zip(baseline_top, engine_top)])
+        print(f"{n_chunks:>9} {'cosine_similarity+sort':<22} {_percentiles(baseline_ms)}")
+        print(f"{n_chunks:>9} {'SparseRetriever':<22} {_percentiles(engine_ms)} {agree:>12.0%}")
+        print(f"{n_chunks:>9} {'throughput':<22} loop {loop_qps:,.0f} q/s, search_batch {batch_qps:,.0f} q/s")
+
+
+def bench_ranking(args):
+    index = kb_store.load_index(kb.INDEX_DIR)
+    if not index["bm25"]:
+        raise SystemExit(f"{kb.INDEX_DIR} has no BM25 term counts. Rebuild with: python build_hr_kb.py")
+    chunks = index["chunks"]
+    queries = sample_sentence_queries(load_pages(args.workers), args.queries)
+    print(f"{len(chunks)} chunks, {len(queries)} sampled queries, top_k={args.top_k}\n")
+
+    rankers = [
+        ("tfidf cosine", SparseRetriever.from_index(index)),
+        (f"bm25 k1={args.k1} b={args.b}", BM25Retriever.from_index(index, k1=args.k1, b=args.b)),
+        ("bm25+ delta=1", BM25Retriever.from_index(index, k1=args.k1, b=args.b, delta=1.0)),
+    ]
+    if index["lsa"]:
+        lsa = DenseRetriever.from_index(index)
+        rankers.append((f"lsa {index['meta']['lsa']['dims']} dims", lsa))
+        pool = ThreadPoolExecutor(max_workers=2)
+        hybrid = HybridRetriever([rankers[1][1], lsa], pool, budget_ms=args.budget_ms)
+        rankers.append(("hybrid bm25+lsa", hybrid))
+
+    windower = SnippetWindower.from_vectorizer(index["vectorizer"], token_budget=args.snippet_tokens)
+
+    k = args.top_k
+    header = (
+        f"{'ranker':<22} {'hit@1':>7} {f'hit@{k}':>7} {f'MRR@{k}':>7} {'prompt tok':>11} "
+        f"{'windowed':>9} {'tok':>5} {'p50 ms':>8} {'p95 ms':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for label, ranker in rankers:
+        hits_at_1 = hits_at_k = reciprocal_ranks = prompt_tokens = 0
+        windowed_hits = windowed_tokens = 0
+        latencies = []
+        for q in queries:
+            started = time.perf_counter()
+            top = ranker.search(ranker.transform([q["query"]]), k)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+            texts = [chunks.text(row) for row, _score in top]
+            found = [q["sentence"] in text for text in texts]
+            hits_at_1 += bool(found) and found[0]
+            hits_at_k += any(found)
+            reciprocal_ranks += 1 / (found.index(True) + 1) if any(found) else 0
+            prompt_tokens += sum(kb.estimate_tokens(text) for text in texts)
+            windows = [windower.window(q["query"], text) for text in texts]
+            windowed_hits += any(q["sentence"] in text for text in windows)
+            windowed_tokens += sum(kb.estimate_tokens(text) for text in windows)
+
+        n = len(queries)
+        print(
+            f"{label:<22} {hits_at_1 / n:>7.1%} {hits_at_k / n:>7.1%} {reciprocal_ranks / n:>7.3f} "
+            f"{prompt_tokens / n:>11.0f} {windowed_hits / n:>9.1%} {windowed_tokens / n:>5.0f} {_percentiles(latencies)}"
+        )
+        if isinstance(ranker, HybridRetriever):
+            stats = ranker.stats()
+            print(
+                f"{'':<22} max {max(latencies):.2f} ms, late rankers: {stats['late'] or 'none'}, "
+                f"queued: {stats['queued'] or 'none'}, over budget: {stats['over_budget']}"
+            )
+
+
+def synthetic_dense(n: int, n_queries: int, dims: int, n_topics: int = 2000, noise: float = 0.6, seed: int = 0):
+    """
+    (vectors, queries): unit vectors scattered around n_topics random
+    directions, like embedded text; queries are drawn the same way.
+    """
+    rng = np.random.default_rng(seed)
+    topics = normalize(rng.standard_normal((n_topics, dims))).astype(np.float32)
+
+    def sample(count: int) -> np.ndarray:
+        out = np.empty((count, dims), dtype=np.float32)
+        for start in range(0, count, 100_000):
+            rows = min(100_000, count - start)
+            block = topics[rng.integers(n_topics, size=rows)]
+            block += noise * rng.standard_normal((rows, dims)).astype(np.float32) / np.sqrt(dims)
+            out[start:start + rows] = normalize(block)
+        return out
+
+    return sample(n), sample(n_queries)
+
+
+def report_ann(label: str, vectors: np.ndarray, queries: np.ndarray, args):
+    k = args.top_k
+    n_lists = args.lists or max(1, int(np.sqrt(len(vectors))))
+    started = time.perf_counter()
+    ivf = build_ivf(vectors, n_lists)
+    build_s = time.perf_counter() - started
+    print(f"\n{label}: {len(vectors)} vectors x {vectors.shape[1]} dims, {n_lists} lists (built in {build_s:.1f}s)")
+
+    exact = DenseRetriever(vectors, projection=None)
+    exact_ms, truth = [], []
+    for q in queries:
+        started = time.perf_counter()
+        hits = exact.search(q, k)
+        exact_ms.append((time.perf_counter() - started) * 1000)
+        truth.append({row for row, _score in hits})
+
+    header = f"{'search':<14} {f'recall@{k}':>9} {'scanned':>8} {'p50 ms':>8} {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    print(f"{'exact':<14} {1:>9.3f} {1:>8.1%} {_percentiles(exact_ms)}")
+    for nprobe in args.nprobe:
+        if nprobe > n_lists:
+            continue
+        ivf_retriever = IVFRetriever(vectors, None, ivf["centroids"], ivf["offsets"], ivf["order"], nprobe=nprobe)
+        ivf_ms, recall, scanned = [], 0.0, 0
+        for q, expected in zip(queries, truth):
+            started = time.perf_counter()
+            hits = ivf_retriever.search(q, k)
+            ivf_ms.append((time.perf_counter() - started) * 1000)
+            recall += len(expected & {row for row, _score in hits}) / max(1, len(expected))
+            scanned += len(ivf_retriever.candidates(q))
+        print(
+            f"{f'ivf nprobe={nprobe}':<14} {recall / len(queries):>9.3f} "
+            f"{scanned / len(queries) / len(vectors):>8.1%} {_percentiles(ivf_ms)}"
+        )
+
+
+def bench_ann(args):
+    for n in args.sizes:
+        vectors, queries = synthetic_dense(n, args.queries, args.dims)
+        report_ann("synthetic", vectors, queries, args)
+        del vectors
+
+    index = kb_store.load_index(kb.INDEX_DIR) if kb_store.read_meta(kb.INDEX_DIR) else None
+    if index and index["lsa"]:
+        dense = DenseRetriever.from_index(index)
+        rng = random.Random(7)
+        chunks = index["chunks"]
+        texts = []
+        for row in rng.sample(range(len(chunks)), min(args.queries, len(chunks))):
+            words = chunks.text(row).split()
+            texts.append(" ".join(rng.sample(words, min(len(words), 8))))
+        queries = dense.transform(texts)
+        report_ann("kb_index LSA", np.asarray(dense.vectors), queries[queries.any(axis=1)], args)
+
+
+def _ranked_rows(ranker, queries: list[dict], k: int) -> tuple[list[list[int]], list[float]]:
+    rows, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        top = ranker.search(ranker.transform([q["query"]]), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rows.append([row for row, _score in top])
+    return rows, latencies
+
+
+def bench_compact(args):
+    source = kb_store.load_index(kb.INDEX_DIR)
+    chunks = [source["chunks"][i] for i in range(len(source["chunks"]))]
+    texts = [c["text"] for c in chunks]
+    del source
+    queries = sample_sentence_queries(load_pages(args.workers), args.queries)
+    pruning = {"min_df": args.min_df, "max_df": args.max_df, "max_features": args.max_features}
+    variants = [
+        ("float64 (full)", None, "float64"),
+        ("float32", None, "float32"),
+        ("float32 pruned", pruning, "float32"),
+        ("uint8 pruned", pruning, "uint8"),
+    ]
+    k = args.top_k
+    print(f"{len(chunks)} chunks, {len(queries)} sampled queries, top_k={k}, pruning={pruning}\n")
+    header = (
+        f"{'index':<16} {'terms':>7} {'MB':>7} {'load ms':>8} {'ranker':<6} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {f'top-{k} agree':>12} {f'hit@{k}':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+
+    baseline = {}
+    with tempfile.TemporaryDirectory(prefix="kb_compact_") as tmp:
+        for label, variant_pruning, values in variants:
+            index_dir = Path(tmp) / values / str(bool(variant_pruning))
+            _counter, vectorizer, matrix, counts = kb.vectorize(texts, variant_pruning)
+            kb_store.write_index(index_dir, chunks, vectorizer, matrix, counts=counts, values=values)
+            del matrix, counts
+
+            started = time.perf_counter()
+            index = kb_store.load_index(index_dir)
+            load_ms = (time.perf_counter() - started) * 1000
+            mb = kb_store.index_size(index_dir) / 1e6
+            n_terms = len(vectorizer.vocabulary_)
+
+            for name, ranker in (
+                ("tfidf", SparseRetriever.from_index(index)),
+                ("bm25", BM25Retriever.from_index(index)),
+            ):
+                rows, latencies = _ranked_rows(ranker, queries, k)
+                baseline.setdefault(name, rows)
+                agree = np.mean([set(a) == set(b) for a, b in zip(rows, baseline[name])])
+                hits = np.mean(
+                    [any(q["sentence"] in texts[row] for row in top) for q, top in zip(queries, rows)]
+                )
+                print(
+                    f"{label:<16} {n_terms:>7} {mb:>7.2f} {load_ms:>8.1f} {name:<6} "
+                    f"{_percentiles(latencies)} {agree:>12.1%} {hits:>7.1%}"
+                )
+            del index
+
+
+def load_labeled_queries(path: Path) -> list[dict]:
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            q = json.loads(line)
+            if not q.get("query") or not q.get("source"):
+                raise SystemExit(f"{path}:{line_no}: each line needs \"query\" and \"source\"")
+            queries.append(q)
+    return queries
+
+
+def is_relevant(chunk: dict, label: dict) -> bool:
+    """chunk (or one of its deduplicated copies) is from the labeled source and page."""
+    for location in [chunk, *chunk.get("also", [])]:
+        if location["source"] != label["source"]:
+            continue
+        page = label.get("page")
+        if page is None or location["page"] <= page <= location.get("page_end", location["page"]):
+            return True
+    return False
+
+
+def eval_rankers(index: dict, names: list[str], args) -> dict:
+    """name -> ranker for the requested names the index supports (as the app builds them)."""
+    available = {"tfidf": lambda: SparseRetriever.from_index(index)}
+    if index["bm25"]:
+        available["bm25"] = lambda: BM25Retriever.from_index(index)
+        available["bm25+"] = lambda: BM25Retriever.from_index(index, delta=1.0)
+    if index["lsa"]:
+        available["lsa"] = lambda: DenseRetriever.from_index(index)
+        if "ivf" in index["lsa"]:
+            available["lsa-ivf"] = lambda: IVFRetriever.from_index(index, nprobe=args.nprobe)
+    if index["bm25"] and index["lsa"]:
+        pool = ThreadPoolExecutor(max_workers=2)
+        available["hybrid"] = lambda: HybridRetriever(
+            [BM25Retriever.from_index(index), DenseRetriever.from_index(index)], pool, budget_ms=args.budget_ms
+        )
+    rankers = {}
+    for name in names or available:
+        if name in available:
+            rankers[name] = available[name]()
+        else:
+            print(f"Skipping {name}: not supported by this index (have {', '.join(available)}).")
+    return rankers
+
+
+def _rss_bytes() -> int | None:
+    """Current resident set size (Linux); None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def evaluate_ranker(ranker, chunks, queries: list[dict], ks: list[int]) -> dict:
+    depth = max(ks)
+    first_relevant, latencies = [], []
+    for q in queries:
+        started = time.perf_counter()
+        top = ranker.search(ranker.transform([q["query"]]), depth)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ranks = [rank for rank, (row, _score) in enumerate(top, 1) if is_relevant(chunks[row], q)]
+        first_relevant.append(ranks[0] if ranks else None)
+
+    n = len(queries)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    result = {f"recall@{k}": round(sum(r is not None and r <= k for r in first_relevant) / n, 4) for k in ks}
+    result[f"mrr@{depth}"] = round(sum(1 / r for r in first_relevant if r is not None) / n, 4)
+    result["latency_ms"] = {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+    return result
+
+
+def _print_eval_deltas(report: dict, baseline: dict):
+    print(f"\nChange against {baseline['created']} (index {baseline['index']['version']}):")
+    for name, metrics in report["rankers"].items():
+        old = baseline["rankers"].get(name)
+        if not old:
+            print(f"  {name:<10} (not in baseline)")
+            continue
+        parts = [
+            f"{key} {metrics[key] - old[key]:+.4f}"
+            for key in metrics
+            if key != "latency_ms" and key in old
+        ]
+        parts += [f"{p} {metrics['latency_ms'][p] - old['latency_ms'][p]:+.3f} ms" for p in ("p50", "p99")]
+        print(f"  {name:<10} " + ", ".join(parts))
+    old_mb, new_mb = baseline["index"]["disk_bytes"] / 1e6, report["index"]["disk_bytes"] / 1e6
+    print(f"  index size {new_mb - old_mb:+.2f} MB")
+
+
+def bench_eval(args):
+    if args.queries_file:
+        queries = load_labeled_queries(args.queries_file)
+    else:
+        queries = sample_sentence_queries(load_pages(args.workers), args.sample)
+        if args.save_queries:
+            with open(args.save_queries, "w", encoding="utf-8") as f:
+                for q in queries:
+                    f.write(json.dumps({"query": q["query"], "source": q["source"], "page": q["page"]}) + "\n")
+            print(f"Saved {len(queries)} labeled queries to {args.save_queries}")
+    ks = sorted(set(args.k))
+
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    index = kb_store.load_index(args.index_dir)
+    load_ms = (time.perf_counter() - started) * 1000
+    chunks = index["chunks"]
+    rankers = eval_rankers(index, args.rankers, args)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "index": {
+            "dir": str(args.index_dir),
+            "version": index["version"],
+            "chunks": len(chunks),
+            "terms": len(index["vectorizer"].vocabulary_),
+            "values": index["meta"].get("values", "float64"),
+            "disk_bytes": kb_store.index_size(args.index_dir),
+            "load_ms": round(load_ms, 2),
+        },
+        "queries": {"file": str(args.queries_file) if args.queries_file else None, "count": len(queries)},
+        "rankers": {},
+    }
+    print(f"{len(chunks)} chunks, {len(queries)} labeled queries\n")
+    header = " ".join(
+        [f"{'ranker':<10}", *(f"{f'R@{k}':>7}" for k in ks), f"{'MRR':>7}", f"{'p50 ms':>8}", f"{'p95 ms':>8}", f"{'p99 ms':>8}"]
+    )
+    print(header)
+    print("-" * len(header))
+    for name, ranker in rankers.items():
+        result = evaluate_ranker(ranker, chunks, queries, ks)
+        report["rankers"][name] = result
+        latency = result["latency_ms"]
+        print(
+            " ".join(
+                [
+                    f"{name:<10}",
+                    *(f"{result[f'recall@{k}']:>7.1%}" for k in ks),
+                    f"{result[f'mrr@{max(ks)}']:>7.3f}",
+                    f"{latency['p50']:>8.2f}",
+                    f"{latency['p95']:>8.2f}",
+                    f"{latency['p99']:>8.2f}",
+                ]
+            )
+        )
+
+    rss_after = _rss_bytes()
+    report["memory"] = {
+        "index_disk_mb": round(report["index"]["disk_bytes"] / 1e6, 2),
+        "rss_growth_mb": round((rss_after - rss_before) / 1e6, 2) if rss_before is not None else None,
+    }
+    print(
+        f"\nindex: {report['memory']['index_disk_mb']} MB on disk, loaded in {load_ms:.1f} ms; "
+        f"RSS growth while querying: {report['memory']['rss_growth_mb']} MB"
+    )
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            _print_eval_deltas(report, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {args.output}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Kinneckt KB benchmarks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    chunking = sub.add_parser("chunking", help="Compare chunkers: retrieval hit rate and prompt tokens.")
+    chunking.add_argument("--queries", type=int, default=300)
+    chunking.add_argument("--top-k", type=int, default=3)
+    chunking.add_argument("--workers", type=int, default=None)
+    chunking.set_defaults(func=bench_chunking)
+
+    retrieval = sub.add_parser("retrieval", help="search_kb latency on synthetic corpora.")
+    retrieval.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    retrieval.add_argument("--queries", type=int, default=200)
+    retrieval.add_argument("--baseline-queries", type=int, default=20)
+    retrieval.add_argument("--top-k", type=int, default=3)
+    retrieval.set_defaults(func=bench_retrieval)
+
+    ranking = sub.add_parser("ranking", help="TF-IDF cosine vs BM25 recall and latency on kb_index/.")
+    ranking.add_argument("--queries", type=int, default=500)
+    ranking.add_argument("--top-k", type=int, default=3)
+    ranking.add_argument("--k1", type=float, default=1.2)
+    ranking.add_argument("--b", type=float, default=0.75)
+    ranking.add_argument("--budget-ms", type=float, default=50.0, help="Hybrid per-query time budget.")
+    ranking.add_argument("--snippet-tokens", type=int, default=120, help="Per-snippet budget of the windowed columns.")
+    ranking.add_argument("--workers", type=int, default=None)
+    ranking.set_defaults(func=bench_ranking)
+
+    ann = sub.add_parser("ann", help="IVF recall/latency tradeoff against exact dense search.")
+    ann.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    ann.add_argument("--dims", type=int, default=128)
+    ann.add_argument("--lists", type=int, default=0, help="IVF lists (default: sqrt(vectors)).")
+    ann.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    ann.add_argument("--queries", type=int, default=200)
+    ann.add_argument("--top-k", type=int, default=10)
+    ann.set_defaults(func=bench_ann)
+
+    compact = sub.add_parser("compact", help="Full-precision vs compact/pruned/quantized index of kb_index/ chunks.")
+    compact.add_argument("--queries", type=int, default=500)
+    compact.add_argument("--top-k", type=int, default=3)
+    compact.add_argument("--min-df", type=kb._df_bound, default=2)
+    compact.add_argument("--max-df", type=kb._df_bound, default=0.5)
+    compact.add_argument("--max-features", type=int, default=None)
+    compact.add_argument("--workers", type=int, default=None)
+    compact.set_defaults(func=bench_compact)
+
+    evaluate = sub.add_parser("eval", help="recall@k, MRR, latency percentiles and memory over a labeled query set (JSON).")
+    evaluate.add_argument("--queries-file", type=Path, default=None, help="JSON Lines of {query, source, page}.")
+    evaluate.add_argument("--sample", type=int, default=500, help="Sampled sentence queries when no --queries-file.")
+    evaluate.add_argument("--save-queries", type=Path, default=None, help="Write the sampled queries as a labeled set.")
+    evaluate.add_argument("--index-dir", type=Path, default=kb.INDEX_DIR)
+    evaluate.add_argument(
+        "--rankers",
+        nargs="+",
+        default=None,
+        help="Any of tfidf, bm25, bm25+, lsa, lsa-ivf, hybrid (default: all the index supports).",
+    )
+    evaluate.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    evaluate.add_argument("--nprobe", type=int, default=8)
+    evaluate.add_argument("--budget-ms", type=float, default=50.0, help="Hybrid per-query time budget.")
+    evaluate.add_argument("--output", type=Path, default=None, help="Write the results here as JSON.")
+    evaluate.add_argument("--baseline", type=Path, default=None, help="Earlier --output to compare against.")
+    evaluate.add_argument("--workers", type=int, default=None)
+    evaluate.set_defaults(func=bench_eval)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.func(args)
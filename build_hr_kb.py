@@ -1,71 +1,1140 @@
-import pickle
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import groupby, islice
+from operator import itemgetter
 from pathlib import Path
 
+import numpy as np
+import pypdf
 from pypdf import PdfReader
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+import kb_store
+from kb_retrieval import build_ivf
+from kb_snippets import SENTENCE_BREAK, estimate_tokens
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 
 BASE_DIR = Path(__file__).resolve().parent
 KB_DIR = BASE_DIR / "knowledge_base"
-INDEX_PATH = BASE_DIR / "kb_index.pkl"
+INDEX_DIR = BASE_DIR / "kb_index"
+# Per-company corpora: knowledge_base/companies/<company_id>/*.pdf, each
+# built into its own index segment kb_tenants/<company_id>/
+COMPANIES_KB_DIR = KB_DIR / "companies"
+TENANTS_INDEX_DIR = BASE_DIR / "kb_tenants"
+PAGE_CACHE_PATH = BASE_DIR / "kb_page_cache.sqlite3"
+MANIFEST_VERSION = 1
 
+# Pages handed to a worker in one task. Small enough that one large handbook
+# is spread across every core, large enough that re-opening the PDF in each
+# task stays cheap.
+PAGES_PER_TASK = 32
 
-def extract_text_from_pdfs(kb_dir: Path):
-    """Read all PDFs and return a list of {'source', 'page', 'text'} chunks."""
-    chunks = []
+# Chunks per block in the streaming build: the unit written to disk and
+# vectorized at once, so it bounds the pipeline's working set.
+STREAM_BLOCK_CHUNKS = 2048
+
+# Default chunking. "sentence" packs whole sentences up to chunk_tokens and
+# prefers paragraph breaks; "fixed" is the original 900-character slicer.
+CHUNKING_DEFAULTS = {
+    "chunker": "sentence",
+    "chunk_tokens": 220,
+    "overlap_tokens": 40,
+    "merge_pages": True,
+}
+
+# Vocabulary pruning (CountVectorizer semantics: ints are document counts,
+# floats are fractions of the chunks). The defaults keep every term.
+PRUNING_DEFAULTS = {
+    "min_df": 1,
+    "max_df": 1.0,
+    "max_features": None,
+}
+
+# Near-duplicate chunk removal (--dedup): chunks whose word 5-gram sets have
+# Jaccard similarity >= threshold are folded into the first one. MinHash with
+# num_perm hashes split into bands LSH bands finds the candidate pairs.
+DEDUP_DEFAULTS = {
+    "threshold": 0.8,
+    "num_perm": 64,
+    "bands": 16,
+    "shingle_words": 5,
+}
+
+
+# =========================
+# PAGE TEXT CACHE
+# =========================
+def file_sha256(path: Path) -> str:
+    stat = path.stat()
+    return _file_sha256(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=1024)
+def _file_sha256(path: str, _size: int, _mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PageTextCache:
+    """
+    Persistent pypdf output keyed by (document sha256, page number).
+
+    Extracted text never changes for an unchanged PDF, so once a document has
+    been read, re-chunking or re-vectorizing it skips pypdf entirely. Entries
+    are also keyed by the pypdf version, since a different extractor can
+    return different text.
+    """
+
+    def __init__(self, path: Path = PAGE_CACHE_PATH):
+        self.path = path
+        self.extractor = f"pypdf {pypdf.__version__}"
+        self.conn = sqlite3.connect(str(path))
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                page_count INTEGER NOT NULL,
+                PRIMARY KEY (doc_hash, extractor)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                doc_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (doc_hash, extractor, page)
+            );
+            """
+        )
+
+    def page_count(self, doc_hash: str) -> int | None:
+        row = self.conn.execute(
+            "SELECT page_count FROM documents WHERE doc_hash = ? AND extractor = ?",
+            (doc_hash, self.extractor),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, doc_hash: str, page_count: int):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                (doc_hash, self.extractor, page_count),
+            )
+
+    def get_pages(self, doc_hash: str, start: int, end: int) -> list[str] | None:
+        """Text of pages [start, end) (0-based), or None unless all are cached."""
+        rows = self.conn.execute(
+            "SELECT text FROM pages WHERE doc_hash = ? AND extractor = ? AND page >= ? AND page < ? ORDER BY page",
+            (doc_hash, self.extractor, start, end),
+        ).fetchall()
+        if len(rows) != end - start:
+            return None
+        return [row[0] for row in rows]
+
+    def put_pages(self, doc_hash: str, start: int, pages: list[str]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                [(doc_hash, self.extractor, start + i, text) for i, text in enumerate(pages)],
+            )
+
+    def prune(self, keep_hashes: set[str]):
+        """Drop entries for documents (or pypdf versions) no longer in use."""
+        with self.conn:
+            for table in ("documents", "pages"):
+                stale = [
+                    row for row in self.conn.execute(f"SELECT DISTINCT doc_hash, extractor FROM {table}")
+                    if row[0] not in keep_hashes or row[1] != self.extractor
+                ]
+                self.conn.executemany(f"DELETE FROM {table} WHERE doc_hash = ? AND extractor = ?", stale)
+
+    def close(self):
+        self.conn.close()
+
+
+# =========================
+# EXTRACTION
+# =========================
+def _extract_page_range(task):
+    """Worker: extract raw text for pages [start, end) of one PDF."""
+    pdf_path, start, end = task
+    started = time.perf_counter()
+
+    reader = PdfReader(str(pdf_path))
+    pages = []
+    for page_num in range(start, end):
+        try:
+            raw_text = reader.pages[page_num].extract_text() or ""
+        except Exception:
+            raw_text = ""
+        pages.append(raw_text)
+
+    elapsed = time.perf_counter() - started
+    return pdf_path.name, start, pages, os.getpid(), elapsed
+
+
+def page_count(pdf_path: Path, cache: PageTextCache | None = None) -> int:
+    if cache:
+        cached = cache.page_count(file_sha256(pdf_path))
+        if cached is not None:
+            return cached
+    count = len(PdfReader(str(pdf_path)).pages)
+    if cache:
+        cache.set_page_count(file_sha256(pdf_path), count)
+    return count
+
+
+def _page_range_tasks(pdf_paths: list[Path], pages_per_task: int, cache: PageTextCache | None = None):
+    tasks = []
+    for pdf_path in pdf_paths:
+        count = page_count(pdf_path, cache)
+        for start in range(0, count, pages_per_task):
+            tasks.append((pdf_path, start, min(start + pages_per_task, count)))
+    return tasks
+
+
+def _report_worker_stats(stats: dict):
+    workers = sorted((pid, v) for pid, v in stats.items() if pid != "cached")
+    for i, (pid, (pages, seconds)) in enumerate(workers, start=1):
+        rate = pages / seconds if seconds else 0.0
+        print(f"  worker {i} (pid {pid}): {int(pages)} pages in {seconds:.1f}s ({rate:.1f} pages/sec)")
+    if stats.get("cached"):
+        print(f"  page cache: {stats['cached']} pages")
+
+
+def iter_pages(
+    pdf_paths: list[Path],
+    workers: int | None = None,
+    pages_per_task: int = PAGES_PER_TASK,
+    stats: dict | None = None,
+    cache: PageTextCache | None = None,
+):
+    """
+    Yield (source, page_number, raw_text) for every page of the given PDFs.
+
+    Work is split into page ranges rather than whole files, so a single large
+    handbook is shared across the process pool. Pages are yielded in a
+    deterministic order (file name, then page), regardless of which worker
+    finished first, and at most two tasks per worker are in flight, so memory
+    stays bounded however many pages there are. Per-worker [pages, seconds]
+    are accumulated into stats when given.
+
+    With a cache, page ranges already extracted for the same file content are
+    served from it and never reach pypdf; newly extracted ranges are added.
+    """
+    tasks = _page_range_tasks(sorted(pdf_paths), pages_per_task, cache)
+    workers = workers or os.cpu_count() or 1
+    stats = {} if stats is None else stats
+    hashes = {p.name: file_sha256(p) for p in pdf_paths} if cache else {}
+    parallel = workers > 1 and len(tasks) > 1
+
+    with (ProcessPoolExecutor(max_workers=workers) if parallel else nullcontext()) as pool:
+
+        def submit(task) -> Future:
+            pdf_path, start, end = task
+            cached = cache.get_pages(hashes[pdf_path.name], start, end) if cache else None
+            if cached is None and pool:
+                return pool.submit(_extract_page_range, task)
+            future = Future()
+            if cached is None:
+                future.set_result(_extract_page_range(task))
+            else:
+                future.set_result((pdf_path.name, start, cached, None, 0.0))
+            return future
 
-    for pdf_path in kb_dir.glob("*.pdf"):
-        reader = PdfReader(str(pdf_path))
-        for page_num, page in enumerate(reader.pages):
-            try:
-                raw_text = page.extract_text() or ""
-            except Exception:
-                raw_text = ""
+        remaining = iter(tasks)
+        pending = deque(submit(t) for t in islice(remaining, workers * 2))
+        while pending:
+            source, start, pages, pid, elapsed = pending.popleft().result()
+            for task in islice(remaining, 1):
+                pending.append(submit(task))
 
-            text = " ".join(raw_text.split())
-            if not text:
+            if pid is None:
+                stats["cached"] = stats.get("cached", 0) + len(pages)
+            else:
+                worker = stats.setdefault(pid, [0, 0.0])
+                worker[0] += len(pages)
+                worker[1] += elapsed
+                if cache:
+                    cache.put_pages(hashes[source], start, pages)
+
+            for offset, raw_text in enumerate(pages):
+                yield source, start + offset + 1, raw_text
+
+
+def extract_pages(
+    pdf_paths: list[Path],
+    workers: int | None = None,
+    pages_per_task: int = PAGES_PER_TASK,
+    cache: PageTextCache | None = None,
+):
+    """Extract every page of the given PDFs as a list; see iter_pages()."""
+    stats: dict = {}
+    extracted = list(
+        iter_pages(pdf_paths, workers=workers, pages_per_task=pages_per_task, stats=stats, cache=cache)
+    )
+    _report_worker_stats(stats)
+    return extracted
+
+
+# =========================
+# CHUNKING
+# =========================
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# Numbered section headings ("7.4.2 Training and Development") and short
+# all-caps lines ("PURPOSE / POLICY") start a new paragraph even without a
+# blank line before them, which is how pypdf usually returns them.
+HEADING_LINE = re.compile(r"^(?:\d+(?:\.\d+)*\.?\s+[A-Z].{0,80}|[A-Z][A-Z0-9 ,/&()'-]{3,80})$")
+HAS_LETTER = re.compile(r"[^\W\d_]")
+
+
+def split_paragraphs(raw_text: str) -> list[str]:
+    """Split extracted page text into whitespace-normalized paragraphs."""
+    paragraphs = []
+    for block in PARAGRAPH_BREAK.split(raw_text):
+        lines: list[str] = []
+        for line in block.splitlines():
+            line = line.strip()
+            if not line:
                 continue
+            if lines and HEADING_LINE.match(line):
+                paragraphs.append(" ".join(lines))
+                lines = []
+            lines.append(line)
+        if lines:
+            paragraphs.append(" ".join(lines))
+
+    merged: list[str] = []
+    heading = ""
+    for paragraph in paragraphs:
+        # Drop bare page numbers and other lines without any words.
+        if not HAS_LETTER.search(paragraph):
+            continue
+        paragraph = " ".join(paragraph.split())
+        if heading:
+            paragraph = f"{heading} {paragraph}"
+            heading = ""
+        # Keep short unpunctuated headings with the text they introduce.
+        if len(paragraph) < 120 and paragraph[-1] not in ".!?:;":
+            heading = paragraph
+            continue
+        merged.append(paragraph)
+    if heading:
+        merged.append(heading)
+    return merged
+
+
+def split_sentences(paragraph: str) -> list[str]:
+    return [s for s in SENTENCE_BREAK.split(paragraph) if s]
+
+
+def _sentence_units(raw_text: str, max_tokens: int):
+    """Yield (starts_paragraph, text, tokens) for each sentence on a page."""
+    for paragraph in split_paragraphs(raw_text):
+        starts_paragraph = True
+        for sentence in split_sentences(paragraph):
+            tokens = estimate_tokens(sentence)
+            if tokens <= max_tokens:
+                yield starts_paragraph, sentence, tokens
+            else:
+                # Run-on text (tables, lists without punctuation): cut on words.
+                words = sentence.split()
+                step = max(1, max_tokens * 4 // 6)  # ~6 characters per word
+                for start in range(0, len(words), step):
+                    piece = " ".join(words[start:start + step])
+                    yield starts_paragraph and start == 0, piece, estimate_tokens(piece)
+            starts_paragraph = False
+
+
+def iter_document_chunks(
+    source: str,
+    pages,
+    chunker: str = CHUNKING_DEFAULTS["chunker"],
+    chunk_tokens: int = CHUNKING_DEFAULTS["chunk_tokens"],
+    overlap_tokens: int = CHUNKING_DEFAULTS["overlap_tokens"],
+    merge_pages: bool = CHUNKING_DEFAULTS["merge_pages"],
+):
+    """
+    Yield the chunks of one document given as an iterable of
+    (page_number, raw_text).
+
+    The sentence chunker packs whole sentences until chunk_tokens is reached,
+    closes a chunk early at a paragraph break once it is three-quarters full,
+    and repeats up to overlap_tokens of trailing sentences at the start of the
+    next chunk (not after a paragraph break). With merge_pages a passage can
+    continue across a page break; such chunks carry "page_end".
+    """
+    if chunker == "fixed":
+        for page, raw_text in pages:
+            yield from chunk_page(source, page, raw_text)
+        return
+    if chunker != "sentence":
+        raise ValueError(f"Unknown chunker: {chunker!r}")
+
+    current: list[tuple[int, str, int]] = []  # (page, text, tokens)
+    current_tokens = 0
+    fresh = 0  # units in current that were not carried over as overlap
+
+    def flush(carry_overlap: bool):
+        """Close the current chunk (returned, or None if empty) and start the next."""
+        nonlocal current, current_tokens, fresh
+        chunk = None
+        if fresh:
+            chunk = {
+                "source": source,
+                "page": current[0][0],
+                "text": " ".join(unit[1] for unit in current),
+            }
+            if current[-1][0] != current[0][0]:
+                chunk["page_end"] = current[-1][0]
+
+        carry: list[tuple[int, str, int]] = []
+        carry_tokens = 0
+        if carry_overlap and fresh:
+            for unit in reversed(current[1:]):
+                if carry_tokens + unit[2] > overlap_tokens:
+                    break
+                carry.insert(0, unit)
+                carry_tokens += unit[2]
+        current, current_tokens, fresh = carry, carry_tokens, 0
+        return chunk
+
+    def closed(chunk):
+        return [chunk] if chunk else []
 
-            # Break long pages into smaller chunks
-            max_len = 900  # characters
-            for start in range(0, len(text), max_len):
-                snippet = text[start:start + max_len]
-                chunks.append(
-                    {
-                        "source": pdf_path.name,
-                        "page": page_num + 1,
-                        "text": snippet,
-                    }
-                )
+    for page, raw_text in pages:
+        if not merge_pages:
+            yield from closed(flush(carry_overlap=False))
+        for starts_paragraph, text, tokens in _sentence_units(raw_text, chunk_tokens):
+            if fresh and starts_paragraph and current_tokens >= chunk_tokens * 3 // 4:
+                yield from closed(flush(carry_overlap=False))
+            elif current_tokens + tokens > chunk_tokens:
+                if fresh:
+                    yield from closed(flush(carry_overlap=True))
+                if current_tokens + tokens > chunk_tokens:
+                    current, current_tokens = [], 0
+            current.append((page, text, tokens))
+            current_tokens += tokens
+            fresh += 1
+    yield from closed(flush(carry_overlap=False))
 
+
+def chunk_document(source: str, pages: list[tuple[int, str]], **chunking) -> list[dict]:
+    """Chunk one document given as [(page_number, raw_text), ...]."""
+    return list(iter_document_chunks(source, pages, **chunking))
+
+
+def chunk_page(source: str, page: int, raw_text: str):
+    """Break one page of text into fixed 900-character chunks (legacy slicer)."""
+    text = " ".join(raw_text.split())
+    if not text:
+        return []
+
+    # Break long pages into smaller chunks
+    max_len = 900  # characters
+    return [
+        {
+            "source": source,
+            "page": page,
+            "text": text[start:start + max_len],
+        }
+        for start in range(0, len(text), max_len)
+    ]
+
+
+def group_pages(extracted):
+    """Group extract_pages() output into (source, [(page, raw_text), ...])."""
+    for source, rows in groupby(extracted, key=itemgetter(0)):
+        yield source, [(page, raw_text) for _source, page, raw_text in rows]
+
+
+def extract_text_from_pdfs(
+    kb_dir: Path,
+    workers: int | None = None,
+    chunking: dict | None = None,
+    cache: PageTextCache | None = None,
+):
+    """Read all PDFs and return a list of {'source', 'page', 'text'} chunks."""
+    chunks, _page_counts = extract_chunks(
+        sorted(kb_dir.glob("*.pdf")), workers=workers, chunking=chunking, cache=cache
+    )
     return chunks
 
 
-def build_index():
-    if not KB_DIR.exists():
-        raise FileNotFoundError(f"knowledge_base folder not found at {KB_DIR}")
+def extract_chunks(
+    pdf_paths: list[Path],
+    workers: int | None = None,
+    chunking: dict | None = None,
+    cache: PageTextCache | None = None,
+):
+    """Extract and chunk the given PDFs. Returns (chunks, {source: page_count})."""
+    chunking = chunking or CHUNKING_DEFAULTS
+    chunks = []
+    page_counts: dict[str, int] = {}
+    for source, pages in group_pages(extract_pages(pdf_paths, workers=workers, cache=cache)):
+        page_counts[source] = len(pages)
+        chunks.extend(chunk_document(source, pages, **chunking))
+    return chunks, page_counts
 
-    print("Reading PDFs...")
-    chunks = extract_text_from_pdfs(KB_DIR)
-    texts = [c["text"] for c in chunks]
 
+# =========================
+# DEDUP (MinHash / LSH)
+# =========================
+MINHASH_PRIME = (1 << 32) + 15
+WORD = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str, size: int) -> np.ndarray:
+    """Sorted unique CRC32 hashes of the lowercased word size-grams of text."""
+    words = WORD.findall(text.lower())
+    grams = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))] if words else []
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+class MinHasher:
+    """num_perm universal hash functions (a * x + b) mod p, fixed by seed."""
+
+    def __init__(self, num_perm: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        return ((self.a * shingles[None, :] + self.b) % MINHASH_PRIME).min(axis=1)
+
+
+def _location(chunk: dict) -> dict:
+    location = {"source": chunk["source"], "page": chunk["page"]}
+    if "page_end" in chunk:
+        location["page_end"] = chunk["page_end"]
+    return location
+
+
+def dedup_chunks(
+    chunks: list[dict],
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    bands: int = 16,
+    shingle_words: int = 5,
+) -> tuple[list[dict], list[dict]]:
+    """
+    Fold near-duplicate chunks into the first occurrence. Returns (kept,
+    dropped). Every kept chunk that absorbed duplicates lists their
+    locations under "also", so no source page loses its provenance.
+
+    LSH bands of the MinHash signature only propose candidates; each one is
+    confirmed with the exact Jaccard similarity of the shingle sets.
+    """
+    rows = num_perm // bands
+    hasher = MinHasher(rows * bands)
+    buckets: dict[tuple[int, bytes], list[int]] = {}
+    kept: list[dict] = []
+    kept_shingles: list[np.ndarray] = []
+    dropped: list[dict] = []
+
+    for chunk in chunks:
+        shingles = shingle_hashes(chunk["text"], shingle_words)
+        if not len(shingles):
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+            continue
+
+        signature = hasher.signature(shingles)
+        keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        match, seen = None, set()
+        for key in keys:
+            for j in buckets.get(key, ()):
+                if j in seen:
+                    continue
+                seen.add(j)
+                other = kept_shingles[j]
+                common = len(np.intersect1d(shingles, other, assume_unique=True))
+                if common / (len(shingles) + len(other) - common) >= threshold:
+                    match = j
+                    break
+            if match is not None:
+                break
+
+        if match is None:
+            for key in keys:
+                buckets.setdefault(key, []).append(len(kept))
+            kept.append(chunk)
+            kept_shingles.append(shingles)
+        else:
+            canonical = kept[match]
+            canonical["also"] = [*canonical.get("also", ()), _location(chunk), *chunk.get("also", ())]
+            dropped.append(chunk)
+    return kept, dropped
+
+
+def _report_dedup(n_before: int, dropped: list[dict], counter: CountVectorizer, matrix, counts) -> dict:
+    """Print and return how much the matrix shrank."""
+    dropped_nnz = counter.transform([c["text"] for c in dropped]).nnz if dropped else 0
+    # Row-major and term-major copies: values + int32 indices + int32 counts each.
+    bytes_per_nnz = 2 * (matrix.data.itemsize + 4 + counts.data.itemsize)
+    before = matrix.nnz + dropped_nnz
+    print(
+        f"Dedup: {n_before} -> {n_before - len(dropped)} chunks (-{len(dropped) / max(1, n_before):.1%}), "
+        f"matrix nnz {before} -> {matrix.nnz} (-{dropped_nnz / max(1, before):.1%}), "
+        f"~{dropped_nnz * bytes_per_nnz / 1e6:.1f} MB less matrix + postings data"
+    )
+    return {"chunks_removed": len(dropped), "nnz_removed": int(dropped_nnz)}
+
+
+# =========================
+# MANIFEST (incremental rebuilds)
+# =========================
+def load_manifest(index_dir: Path = INDEX_DIR) -> dict | None:
+    """
+    Return the manifest written by the last build, or None if there is no
+    usable previous build to splice into.
+
+    kb_index/manifest.json records, per document: its content hash, page count
+    and the [chunk_start, chunk_end) range its chunks occupy in the index.
+    """
+    manifest = kb_store.read_manifest(index_dir)
+    if not manifest or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def collect_chunks(
+    pdf_paths: list[Path],
+    workers: int | None = None,
+    full: bool = False,
+    chunking: dict | None = None,
+    cache: PageTextCache | None = None,
+    index_dir: Path = INDEX_DIR,
+):
+    """
+    Return (chunks, manifest_documents) for the given PDFs.
+
+    Unless full is set, documents whose content hash matches the previous
+    manifest are not re-read: their chunks are spliced from the existing
+    index, and only added or changed documents are re-extracted. A change of
+    chunking settings invalidates every document, but then the page cache
+    still spares unchanged PDFs from pypdf.
+    """
+    chunking = chunking or CHUNKING_DEFAULTS
+    hashes = {p.name: file_sha256(p) for p in pdf_paths}
+    manifest = None if full else load_manifest(index_dir)
+    if manifest and manifest.get("chunking") != chunking:
+        print("Chunking settings changed since the last build; re-chunking every document.")
+        manifest = None
+    if manifest and manifest.get("dedup"):
+        # Deduplicated chunks no longer sit in per-document ranges.
+        print("Previous build was deduplicated; re-chunking every document.")
+        manifest = None
+
+    previous_chunks = []
+    unchanged: set[str] = set()
+    if manifest:
+        previous_docs = manifest["documents"]
+        unchanged = {
+            name for name, digest in hashes.items()
+            if previous_docs.get(name, {}).get("sha256") == digest
+        }
+        if unchanged:
+            previous_chunks = kb_store.load_index(index_dir)["chunks"]
+
+        added = sorted(set(hashes) - set(previous_docs))
+        changed = sorted((set(hashes) & set(previous_docs)) - unchanged)
+        deleted = sorted(set(previous_docs) - set(hashes))
+        print(
+            f"Manifest: {len(unchanged)} unchanged, {len(added)} added, "
+            f"{len(changed)} changed, {len(deleted)} deleted."
+        )
+        for label, names in (("added", added), ("changed", changed), ("deleted", deleted)):
+            for name in names:
+                print(f"  {label}: {name}")
+
+    to_extract = [p for p in pdf_paths if p.name not in unchanged]
+    fresh_chunks, page_counts = ([], {})
+    if to_extract:
+        print(f"Reading {len(to_extract)} PDF(s) with {workers or os.cpu_count() or 1} worker(s)...")
+        fresh_chunks, page_counts = extract_chunks(to_extract, workers=workers, chunking=chunking, cache=cache)
+
+    fresh_by_source: dict[str, list[dict]] = {}
+    for c in fresh_chunks:
+        fresh_by_source.setdefault(c["source"], []).append(c)
+
+    chunks = []
+    documents = {}
+    for pdf_path in sorted(pdf_paths):
+        name = pdf_path.name
+        if name in unchanged:
+            previous = manifest["documents"][name]
+            doc_chunks = previous_chunks[previous["chunk_start"]:previous["chunk_end"]]
+            pages = previous["pages"]
+        else:
+            doc_chunks = fresh_by_source.get(name, [])
+            pages = page_counts.get(name, 0)
+
+        documents[name] = {
+            "sha256": hashes[name],
+            "pages": pages,
+            "chunk_start": len(chunks),
+            "chunk_end": len(chunks) + len(doc_chunks),
+        }
+        chunks.extend(doc_chunks)
+
+    return chunks, documents
+
+
+# =========================
+# VECTORIZING
+# =========================
+def vectorize(texts: list[str], pruning: dict | None = None):
+    """
+    Returns (counter, vectorizer, matrix, counts): TF-IDF rows plus the raw
+    term counts BM25 needs, from one tokenization pass. This is
+    TfidfVectorizer.fit_transform split in two, so the matrix is identical.
+    """
+    counter = CountVectorizer(stop_words="english", **(pruning or {}))
+    counts = counter.fit_transform(texts)
+    transformer = TfidfTransformer().fit(counts)
+    matrix = transformer.transform(counts)
+    vectorizer = TfidfVectorizer(stop_words="english", vocabulary=counter.vocabulary_)
+    vectorizer.idf_ = transformer.idf_
+    return counter, vectorizer, matrix, counts
+
+
+def pruned_terms(doc_freq: Counter, n_docs: int, min_df=1, max_df=1.0, max_features: int | None = None) -> list[str]:
+    """
+    The vocabulary CountVectorizer would keep, from document frequencies
+    alone (streaming build). max_features ranks terms by document frequency
+    here, where CountVectorizer ranks them by total count.
+    """
+    min_count = min_df if isinstance(min_df, int) else min_df * n_docs
+    max_count = max_df if isinstance(max_df, int) else max_df * n_docs
+    terms = [t for t, df in doc_freq.items() if min_count <= df <= max_count]
+    if max_features is not None and len(terms) > max_features:
+        terms = sorted(terms, key=lambda t: (-doc_freq[t], t))[:max_features]
+    return sorted(terms)
+
+
+def _report_vocabulary(vectorizer, matrix, pruning: dict | None):
+    if pruning and pruning != PRUNING_DEFAULTS:
+        print(f"Vocabulary pruned with {pruning}: {len(vectorizer.vocabulary_)} terms, {matrix.nnz} non-zeros.")
+
+
+# =========================
+# LSA (dense vectors)
+# =========================
+def fit_lsa(matrix, dims: int, ivf_lists: int = 0, block_rows: int = 65536) -> dict:
+    """
+    Latent semantic analysis: a rank-`dims` TruncatedSVD of the TF-IDF
+    matrix. Chunks that use related vocabulary ("terminated", "let go",
+    "dismissal") end up close together even without shared terms. Chunk
+    vectors are L2-normalized float32, so cosine is a dot product; queries
+    are projected with the same components at request time.
+
+    With ivf_lists > 0 the vectors are also clustered into that many IVF
+    inverted lists for approximate search.
+    """
+    dims = min(dims, min(matrix.shape) - 1)
+    print(f"Building LSA projection ({dims} dims)...")
+    started = time.perf_counter()
+    svd = TruncatedSVD(n_components=dims, algorithm="randomized", n_iter=5, random_state=0)
+    svd.fit(matrix)
+
+    vectors = np.empty((matrix.shape[0], dims), dtype=np.float32)
+    for start in range(0, matrix.shape[0], block_rows):
+        end = min(start + block_rows, matrix.shape[0])
+        vectors[start:end] = normalize(svd.transform(matrix[start:end]))
+
+    explained = float(svd.explained_variance_ratio_.sum())
+    print(f"LSA: {explained:.1%} of variance kept, {time.perf_counter() - started:.1f}s")
+    lsa = {
+        "components": svd.components_.astype(np.float32),
+        "vectors": vectors,
+        "info": {"explained_variance": round(explained, 4)},
+    }
+
+    if ivf_lists:
+        started = time.perf_counter()
+        lsa["ivf"] = build_ivf(vectors, ivf_lists, block_rows=block_rows)
+        sizes = np.diff(lsa["ivf"]["offsets"])
+        print(
+            f"IVF: {len(sizes)} lists, {sizes.mean():.0f} chunks per list on average "
+            f"(largest {sizes.max()}), {time.perf_counter() - started:.1f}s"
+        )
+    return lsa
+
+
+# =========================
+# BUILD
+# =========================
+def build_index(
+    workers: int | None = None,
+    full: bool = False,
+    chunking: dict | None = None,
+    cache: PageTextCache | None = None,
+    lsa_dims: int = 0,
+    ivf_lists: int = 0,
+    kb_dir: Path = KB_DIR,
+    index_dir: Path = INDEX_DIR,
+    dedup: dict | None = None,
+    pruning: dict | None = None,
+    values: str = "float64",
+):
+    """
+    Build and publish an index of kb_dir's PDFs. With dedup (DEDUP_DEFAULTS
+    shape), near-duplicate chunks are folded together before vectorizing;
+    unchanged documents are then re-chunked from the page cache instead of
+    spliced from the previous index. pruning (PRUNING_DEFAULTS shape) limits
+    the vocabulary; values is the on-disk encoding of TF-IDF weights
+    (kb_store.VALUE_ENCODINGS).
+    """
+    if not kb_dir.exists():
+        raise FileNotFoundError(f"knowledge_base folder not found at {kb_dir}")
+
+    chunking = chunking or CHUNKING_DEFAULTS
+    chunks, documents = collect_chunks(
+        sorted(kb_dir.glob("*.pdf")),
+        workers=workers,
+        full=full or bool(dedup),
+        chunking=chunking,
+        cache=cache,
+        index_dir=index_dir,
+    )
     print(f"Loaded {len(chunks)} text chunks from PDFs.")
 
+    n_before, dropped = len(chunks), []
+    if dedup:
+        started = time.perf_counter()
+        chunks, dropped = dedup_chunks(chunks, **dedup)
+        print(f"Near-duplicate scan: {time.perf_counter() - started:.1f}s")
+    texts = [c["text"] for c in chunks]
+
     print("Building TF-IDF index...")
-    vectorizer = TfidfVectorizer(stop_words="english")
-    matrix = vectorizer.fit_transform(texts)
+    counter, vectorizer, matrix, counts = vectorize(texts, pruning)
+    _report_vocabulary(vectorizer, matrix, pruning)
 
-    data = {
-        "chunks": chunks,
-        "vectorizer": vectorizer,
-        "matrix": matrix,
-    }
+    manifest = {"version": MANIFEST_VERSION, "chunking": chunking, "documents": documents}
+    if pruning:
+        manifest["pruning"] = pruning
+    if dedup:
+        manifest["dedup"] = {**dedup, **_report_dedup(n_before, dropped, counter, matrix, counts)}
+
+    lsa = fit_lsa(matrix, lsa_dims, ivf_lists=ivf_lists) if lsa_dims else None
+
+    version = kb_store.write_index(
+        index_dir, chunks, vectorizer, matrix, manifest=manifest, counts=counts, lsa=lsa, values=values
+    )
+
+    print(f"Knowledge base index {version} saved to {index_dir}")
+    _prune_page_cache(cache)
+    _report_peak_rss()
+
+
+def build_index_streaming(
+    chunking: dict | None = None,
+    workers: int | None = None,
+    cache: PageTextCache | None = None,
+    block_size: int = STREAM_BLOCK_CHUNKS,
+    lsa_dims: int = 0,
+    ivf_lists: int = 0,
+    kb_dir: Path = KB_DIR,
+    index_dir: Path = INDEX_DIR,
+    pruning: dict | None = None,
+    values: str = "float64",
+):
+    """
+    Bounded-memory build for very large corpora. Always a full rebuild.
+
+    Pass 1 streams pages -> chunks straight into the index files on disk in
+    blocks and counts document frequencies. Pass 2 reads the chunk text back
+    from the memory-mapped files and vectorizes it block by block, appending
+    matrix rows to disk. Only the term -> document-frequency table grows with
+    the corpus (with its vocabulary, not its size); chunk dicts, the text list
+    and the matrix are never held in memory as a whole.
+    """
+    if not kb_dir.exists():
+        raise FileNotFoundError(f"knowledge_base folder not found at {kb_dir}")
+
+    chunking = chunking or CHUNKING_DEFAULTS
+    pdf_paths = {p.name: p for p in sorted(kb_dir.glob("*.pdf"))}
+    writer = kb_store.IndexWriter(index_dir, values=values)
+    analyzer = TfidfVectorizer(stop_words="english").build_analyzer()
+    doc_freq: Counter[str] = Counter()
+    documents = {}
+    stats: dict[int, list[float]] = {}
+
+    print(f"Streaming {len(pdf_paths)} PDF(s) with {workers or os.cpu_count() or 1} worker(s)...")
+    pages = iter_pages(list(pdf_paths.values()), workers=workers, stats=stats, cache=cache)
+    for source, rows in groupby(pages, key=itemgetter(0)):
+        chunk_start = writer.n_chunks
+        block = []
+        doc_pages = ((page, raw_text) for _source, page, raw_text in rows)
+        for chunk in iter_document_chunks(source, doc_pages, **chunking):
+            doc_freq.update(set(analyzer(chunk["text"])))
+            block.append(chunk)
+            if len(block) >= block_size:
+                writer.add_chunks(block)
+                block = []
+        writer.add_chunks(block)
+
+        pdf_path = pdf_paths[source]
+        documents[source] = {
+            "sha256": file_sha256(pdf_path),
+            "pages": page_count(pdf_path, cache),
+            "chunk_start": chunk_start,
+            "chunk_end": writer.n_chunks,
+        }
+    _report_worker_stats(stats)
+    print(f"Pass 1: {writer.n_chunks} chunks written, {len(doc_freq)} terms counted.")
+
+    # Same vocabulary order and smoothed idf that TfidfVectorizer.fit computes.
+    terms = pruned_terms(doc_freq, writer.n_chunks, **(pruning or {}))
+    df = np.fromiter((doc_freq[t] for t in terms), dtype=np.float64, count=len(terms))
+    del doc_freq
+    vocabulary = {t: i for i, t in enumerate(terms)}
+    vectorizer = TfidfVectorizer(stop_words="english", vocabulary=vocabulary)
+    vectorizer.idf_ = np.log((1 + writer.n_chunks) / (1 + df)) + 1
+    counter = CountVectorizer(stop_words="english", vocabulary=vocabulary)
+    transformer = TfidfTransformer()
+    transformer.idf_ = vectorizer.idf_
+
+    print("Pass 2: building TF-IDF rows...")
+    chunks = writer.chunks()
+    for start in range(0, len(chunks), block_size):
+        texts = [chunks.text(i) for i in range(start, min(start + block_size, len(chunks)))]
+        counts = counter.transform(texts)
+        writer.add_rows(transformer.transform(counts), counts=counts)
+
+    if lsa_dims:
+        lsa = fit_lsa(writer.matrix(len(terms)), lsa_dims, ivf_lists=ivf_lists, block_rows=block_size)
+        writer.add_lsa(lsa["components"], lsa["vectors"], lsa["info"])
+        if "ivf" in lsa:
+            writer.add_ivf(lsa["ivf"]["centroids"], lsa["ivf"]["offsets"], lsa["ivf"]["order"])
+
+    manifest = {"version": MANIFEST_VERSION, "chunking": chunking, "documents": documents}
+    if pruning:
+        manifest["pruning"] = pruning
+    version = writer.finish(vectorizer, manifest=manifest)
+
+    print(f"Knowledge base index {version} saved to {index_dir}")
+    _prune_page_cache(cache)
+    _report_peak_rss()
 
-    with open(INDEX_PATH, "wb") as f:
-        pickle.dump(data, f)
 
-    print(f"Knowledge base index saved to {INDEX_PATH}")
+def _prune_page_cache(cache: PageTextCache | None):
+    """Drop cached pages of PDFs that are gone, from the global corpus and every company's."""
+    if cache:
+        cache.prune({file_sha256(p) for p in KB_DIR.rglob("*.pdf")})
+
+
+def company_ids() -> list[str]:
+    """Companies with a corpus folder under knowledge_base/companies/."""
+    if not COMPANIES_KB_DIR.exists():
+        return []
+    return sorted(p.name for p in COMPANIES_KB_DIR.iterdir() if p.is_dir() and kb_store.is_company_id(p.name))
+
+
+def company_dirs(company_id: str) -> tuple[Path, Path]:
+    """(corpus folder, index segment folder) of one company."""
+    if not kb_store.is_company_id(company_id):
+        raise ValueError(f"Invalid company id {company_id!r}: use letters, digits, '.', '_' or '-'")
+    return COMPANIES_KB_DIR / company_id, TENANTS_INDEX_DIR / company_id
+
+
+def _report_peak_rss():
+    if resource is None:
+        return
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    peak_mb = peak / (1 << 20) if os.uname().sysname == "Darwin" else peak / 1024
+    print(f"Peak RSS: {peak_mb:.0f} MB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the Kinneckt HR knowledge base index.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used for PDF text extraction (default: CPU count, 1 disables the pool).",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the previous build's manifest and re-extract every PDF.",
+    )
+    parser.add_argument(
+        "--chunker",
+        choices=("sentence", "fixed"),
+        default=CHUNKING_DEFAULTS["chunker"],
+        help="sentence: sentence/paragraph-aware packing; fixed: legacy 900-character slices.",
+    )
+    parser.add_argument(
+        "--chunk-tokens",
+        type=int,
+        default=CHUNKING_DEFAULTS["chunk_tokens"],
+        help="Target chunk size in estimated LLM tokens (sentence chunker).",
+    )
+    parser.add_argument(
+        "--overlap-tokens",
+        type=int,
+        default=CHUNKING_DEFAULTS["overlap_tokens"],
+        help="Trailing tokens repeated at the start of the next chunk (sentence chunker).",
+    )
+    parser.add_argument(
+        "--no-merge-pages",
+        dest="merge_pages",
+        action="store_false",
+        help="Never let a chunk continue across a page break.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Bounded-memory two-pass build for very large corpora (always a full rebuild).",
+    )
+    parser.add_argument(
+        "--no-page-cache",
+        dest="page_cache",
+        action="store_false",
+        help=f"Always run pypdf instead of reusing extracted text from {PAGE_CACHE_PATH.name}.",
+    )
+    parser.add_argument(
+        "--lsa-dims",
+        type=int,
+        default=0,
+        help="Also store dense LSA chunk vectors with this many dimensions, e.g. 256 (0 = off).",
+    )
+    parser.add_argument(
+        "--ivf-lists",
+        type=int,
+        default=0,
+        help="Cluster the LSA vectors into this many IVF lists for approximate search, "
+        "about sqrt(chunks) (0 = off; needs --lsa-dims).",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Fold near-duplicate chunks (MinHash/LSH) into one, keeping every source page as provenance.",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEDUP_DEFAULTS["threshold"],
+        help="Word 5-gram Jaccard similarity at which two chunks count as duplicates.",
+    )
+    parser.add_argument(
+        "--company",
+        action="append",
+        default=[],
+        metavar="COMPANY_ID",
+        help=f"Build the segment of one company from {COMPANIES_KB_DIR.relative_to(BASE_DIR)}/<id>/ "
+        f"into {TENANTS_INDEX_DIR.name}/<id>/ instead of the global index. Repeatable.",
+    )
+    parser.add_argument(
+        "--all-companies",
+        action="store_true",
+        help="Build the segment of every company folder (not the global index).",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Store TF-IDF weights as float32 and term counts as uint16 (about half the matrix size).",
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Store TF-IDF weights as 8-bit levels of 1/255 (implies --compact).",
+    )
+    parser.add_argument(
+        "--min-df",
+        type=_df_bound,
+        default=PRUNING_DEFAULTS["min_df"],
+        help="Drop terms in fewer chunks than this (an int count, or a float fraction of the chunks).",
+    )
+    parser.add_argument(
+        "--max-df",
+        type=_df_bound,
+        default=PRUNING_DEFAULTS["max_df"],
+        help="Drop terms in more chunks than this (an int count, or a float fraction of the chunks).",
+    )
+    parser.add_argument(
+        "--max-features",
+        type=int,
+        default=PRUNING_DEFAULTS["max_features"],
+        help="Keep only this many of the most frequent terms.",
+    )
+    args = parser.parse_args()
+    if args.dedup and args.streaming:
+        parser.error("--dedup needs the in-memory build; it cannot be combined with --streaming")
+    return args
+
+
+def _df_bound(text: str) -> int | float:
+    """CountVectorizer's convention: "2" is a chunk count, "0.5" a fraction."""
+    return float(text) if "." in text or "e" in text.lower() else int(text)
+
+
+def pruning_from_args(args) -> dict | None:
+    pruning = {"min_df": args.min_df, "max_df": args.max_df, "max_features": args.max_features}
+    return None if pruning == PRUNING_DEFAULTS else pruning
+
+
+def values_from_args(args) -> str:
+    if args.quantize:
+        return "uint8"
+    return "float32" if args.compact else "float64"
+
+
+def chunking_from_args(args) -> dict:
+    return {
+        "chunker": args.chunker,
+        "chunk_tokens": args.chunk_tokens,
+        "overlap_tokens": args.overlap_tokens,
+        "merge_pages": args.merge_pages,
+    }
 
 
 if __name__ == "__main__":
-    build_index()
+    args = parse_args()
+    cache = PageTextCache() if args.page_cache else None
+    build = build_index_streaming if args.streaming else build_index
+    options = dict(
+        chunking=chunking_from_args(args),
+        workers=args.workers,
+        cache=cache,
+        lsa_dims=args.lsa_dims,
+        ivf_lists=args.ivf_lists,
+        pruning=pruning_from_args(args),
+        values=values_from_args(args),
+    )
+    if not args.streaming:
+        options["full"] = args.full
+        options["dedup"] = dict(DEDUP_DEFAULTS, threshold=args.dedup_threshold) if args.dedup else None
+
+    companies = company_ids() if args.all_companies else args.company
+    if args.all_companies or args.company:
+        for company_id in companies:
+            kb_dir, index_dir = company_dirs(company_id)
+            print(f"=== Company {company_id} ===")
+            build(kb_dir=kb_dir, index_dir=index_dir, **options)
+        if not companies:
+            print(f"No company folders under {COMPANIES_KB_DIR}")
+    else:
+        build(**options)
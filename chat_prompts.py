@@ -0,0 +1,187 @@
+"""
+Chat prompts, precompiled per (role, mode).
+
+The system message for each template is built once, at import, and always
+starts with the same text (identity, safety, style), followed by the role
+and then the mode instructions. Everything that changes per request goes
+after it: conversation history, then one user message with the company,
+the question and the KB snippets. Providers that cache prompt prefixes
+(Groq, OpenAI) can therefore reuse the system message across requests, and
+the shared opening across all templates.
+
+    python chat_prompts.py
+
+prints the estimated tokens of each template and how many of them every
+template shares. Live cacheable shares are under "llm_prompt" in
+/admin/metrics.
+"""
+
+from kb_snippets import estimate_tokens
+
+# Common to every template, so it is the prefix of every prompt.
+BASE_PROMPT = """
+You are Kinneckt, an HR Assistant.
+
+You do NOT give legal advice.
+You do NOT decide who is right or wrong.
+You focus on clarity, behavior, communication, and next steps.
+
+Safety:
+If user describes harassment, discrimination, threats, violence, self-harm, stalking,
+or protected class concerns, advise escalation to HR/legal/emergency services as appropriate,
+and remind: "This is not legal advice."
+
+Style:
+Warm, calm, neutral, professional, high EQ.
+Use short headers and clear bullets.
+"""
+
+ROLE_ALIASES = {
+    "hr": ("hr", "people ops", "people_ops", "people"),
+    "manager": ("manager", "leader", "supervisor"),
+    "employee": ("employee", "individual contributor", "staff"),
+}
+
+ROLE_INSTRUCTIONS = {
+    "hr": (
+        "The user is in HR / People Ops / Leadership. "
+        "Prioritize structure, documentation, scripts, action plans, and follow-up steps."
+    ),
+    "manager": (
+        "The user is a manager or team lead. "
+        "Help them structure conversations, ask good questions, and prevent escalation."
+    ),
+    "employee": (
+        "The user is an employee. Help them describe what’s happening neutrally, "
+        "explain impact, and ask for support."
+    ),
+    "unknown": "The user’s role is not clear. Ask if they are HR, manager, or employee and adapt accordingly.",
+}
+
+MODE_INSTRUCTIONS = {
+    "chat": "Normal chat mode.",
+    "mediation": (
+        "The user requested a structured mediation plan. "
+        "Use this exact structure:\n"
+        "1. Risk & Role Notes\n"
+        "2. Neutral Situation Summary\n"
+        "3. Key Issues Identified\n"
+        "4. Mediation Meeting Agenda\n"
+        "5. Suggested Scripts for the Mediator\n"
+        "6. Suggested Agreements\n"
+        "7. Follow-Up Plan\n"
+        "8. HR Documentation Summary (if appropriate)\n"
+        "Make it detailed and copy-paste friendly."
+    ),
+}
+
+USER_TEMPLATE = """
+Company (context only): {company_id}
+
+User message:
+\"\"\"{user_message}\"\"\"
+
+HR reference snippets:
+{context_text}
+"""
+
+NO_SNIPPETS = "No HR snippets retrieved."
+# Earlier turns sent with each message, and KB snippets per prompt
+HISTORY_TURNS = 6
+MAX_SNIPPETS = 3
+
+
+def role_key(role: str) -> str:
+    """Template role of a request's role ("hr", "manager", "employee" or "unknown")."""
+    role = (role or "").lower()
+    for key, aliases in ROLE_ALIASES.items():
+        if role in aliases:
+            return key
+    return "unknown"
+
+
+def mode_key(mode: str) -> str:
+    return "mediation" if (mode or "chat").lower() == "mediation" else "chat"
+
+
+def compile_system_prompt(role: str, mode: str) -> str:
+    return (
+        BASE_PROMPT
+        + f"\nRole behavior:\n{ROLE_INSTRUCTIONS[role]}\n"
+        + f"\nMode instructions:\n{MODE_INSTRUCTIONS[mode]}\n"
+    )
+
+
+# (role key, mode key) -> system message, built once.
+SYSTEM_PROMPTS = {
+    (role, mode): compile_system_prompt(role, mode) for role in ROLE_INSTRUCTIONS for mode in MODE_INSTRUCTIONS
+}
+
+
+def system_prompt(role: str, mode: str) -> str:
+    """The precompiled system message for a request's role and mode."""
+    return SYSTEM_PROMPTS[(role_key(role), mode_key(mode))]
+
+
+def format_snippets(kb_snippets: list[dict]) -> str:
+    context_parts = []
+    for snip in kb_snippets[:MAX_SNIPPETS]:
+        pages = f"page {snip.get('page','?')}"
+        if "page_end" in snip:
+            pages = f"pages {snip['page']}-{snip['page_end']}"
+        context_parts.append(f"From {snip.get('source','unknown')} ({pages}): {snip.get('text','')}")
+    return "\n\n".join(context_parts) if context_parts else NO_SNIPPETS
+
+
+def build_messages(
+    user_message: str,
+    role: str,
+    company_id: str,
+    kb_snippets: list[dict],
+    history: list[dict],
+    mode: str = "chat",
+) -> list[dict]:
+    """Groq messages for one chat turn: the template's system message, then history, then the turn."""
+    messages = [{"role": "system", "content": system_prompt(role, mode)}]
+    for m in history[-HISTORY_TURNS:]:
+        if m.get("role") in ("user", "assistant"):
+            messages.append({"role": m["role"], "content": m["content"]})
+    messages.append(
+        {
+            "role": "user",
+            "content": USER_TEMPLATE.format(
+                company_id=company_id, user_message=user_message, context_text=format_snippets(kb_snippets)
+            ),
+        }
+    )
+    return messages
+
+
+def shared_prefix(texts: list[str]) -> str:
+    """Longest common prefix of texts."""
+    first, last = min(texts), max(texts)
+    n = 0
+    while n < len(first) and first[n] == last[n]:
+        n += 1
+    return first[:n]
+
+
+def template_report() -> list[dict]:
+    """Estimated tokens of each template's system message, and of the prefix all templates share."""
+    shared_tokens = estimate_tokens(shared_prefix(list(SYSTEM_PROMPTS.values())))
+    return [
+        {
+            "template": f"{role}/{mode}",
+            "system_tokens": estimate_tokens(prompt),
+            "shared_tokens": shared_tokens,
+        }
+        for (role, mode), prompt in SYSTEM_PROMPTS.items()
+    ]
+
+
+if __name__ == "__main__":
+    scaffold = estimate_tokens(USER_TEMPLATE.format(company_id="", user_message="", context_text=""))
+    print(f"{'template':<20} {'system tok':>11} {'shared by all':>14}")
+    for row in template_report():
+        print(f"{row['template']:<20} {row['system_tokens']:>11} {row['shared_tokens']:>14}")
+    print(f"\nPer-turn user message scaffold: {scaffold} tokens, plus the question and snippets.")
@@ -0,0 +1,516 @@
+"""
+Kinneckt backend self-checks.
+
+    python check_hr_backend.py [-k semantic]
+
+Fast checks of the in-process caches and ranking helpers on small synthetic
+data (no built index, no Groq key needed). Each check_* function asserts
+one behavior; -k runs only the checks whose name contains the given text.
+Exits non-zero when any check fails.
+
+store: _NpyAppender writes valid .npy files in pieces; _write_postings
+transposes the matrix on disk exactly, block by block; the streaming build
+writes the same index as the in-memory build (knowledge_base/ sample PDFs).
+
+dedup: near-duplicate chunks fold into the first one, keeping every source
+page under "also"; distinct and empty chunks stay.
+
+snippets: SnippetWindower keeps the sentences that match the query within
+its token budget, marks cuts with an ellipsis, leaves short texts alone.
+
+reply: reply_cache_key() shares entries between wordings of a role, mode
+or message that select the same prompt, and separates companies, snippets
+and later turns.
+
+semantic: SemanticCache hits (including reworded questions), misses,
+scopes, the shared-snippet and guard-term checks (negated and opposite
+questions), LRU and TTL eviction, false-hit reports.
+
+ttl: TTLCache LRU order, byte-budget eviction, oversized values, expiry.
+
+rrf: reciprocal rank fusion order, ties and top_k; HybridRetriever keeps
+to its budget when any ranker (the primary too) is late or queued.
+
+bm25: BM25Retriever batch and single-query scores agree; row_scores() and
+relevance() match search(); weights stored by the build match those computed
+at load.
+"""
+
+import argparse
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+import build_hr_kb
+import kb_store
+from kb_retrieval import BM25Retriever, HybridRetriever, reciprocal_rank_fusion, relevance
+from kb_snippets import ELLIPSIS, SnippetWindower, estimate_tokens
+from semantic_cache import SemanticCache, guard_terms
+from ttl_cache import MISSING, TTLCache
+
+# Two small PDFs of the bundled knowledge base, for the build checks.
+SAMPLE_PDFS = ["Complete_HR_Manual.pdf", "HR_Training_Resource.pdf"]
+
+QUESTIONS = [
+    "Can I be fired with notice?",
+    "Can I be fired without notice?",
+    "Can I take vacation before my probation ends?",
+    "Can I take vacation after my probation ends?",
+    "Should I report harassment to my manager?",
+    "Should I not report harassment to my manager?",
+    "How do I report harassment?",
+    "How do I report harassment at work",
+    "How many vacation days do I get?",
+    "How many sick days do I get?",
+    "How many vacation days do I get each year?",
+    "How do I request PTO?",
+    "How can I request PTO?",
+    "What is the harassment policy?",
+    "What's the policy on harassment?",
+]
+# Background text, so common workplace words get a low idf as in the real KB.
+FILLER = ["Rules that apply at work.", "Leave is counted by the year."] * 15
+
+
+# =========================
+# INDEX STORE AND BUILD
+# =========================
+def check_store_npy_appender():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "values.npy"
+        appender = kb_store._NpyAppender(path, np.int64)
+        appender.append([])
+        appender.append([1, 2, 3])
+        appender.append(np.arange(4, 70000))
+        appender.close()
+        appender.close()  # idempotent
+        values = np.load(path, mmap_mode="r")
+        assert values.dtype == np.int64 and np.array_equal(values, np.arange(1, 70000))
+
+        empty = kb_store._NpyAppender(Path(tmp) / "empty.npy", np.float32)
+        empty.close()
+        assert np.load(Path(tmp) / "empty.npy").shape == (0,)
+
+
+def check_store_write_postings_transposes():
+    rng = np.random.default_rng(1)
+    dense = rng.random((50, 30)) * (rng.random((50, 30)) < 0.15)
+    dense[7] = 0  # a chunk with no terms
+    dense[:, 4] = 0  # a term in no chunk
+    matrix = csr_matrix(dense)
+    counts = csr_matrix((rng.integers(1, 9, matrix.nnz).astype(np.int32), matrix.indices, matrix.indptr))
+    expected, expected_counts = matrix.T.tocsr(), counts.T.tocsr()
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        np.save(directory / "matrix_data.npy", matrix.data)
+        np.save(directory / "matrix_counts.npy", counts.data)
+        np.save(directory / "matrix_indices.npy", matrix.indices.astype(np.int32))
+        np.save(directory / "matrix_indptr.npy", matrix.indptr.astype(np.int64))
+        values = {"matrix_data": "postings_data", "matrix_counts": "postings_counts"}
+        kb_store._write_postings(directory, 50, 30, values, block_rows=7)
+        indptr = np.load(directory / "postings_indptr.npy")
+        indices = np.load(directory / "postings_indices.npy")
+        assert np.array_equal(indptr, expected.indptr) and np.array_equal(indices, expected.indices)
+        assert np.array_equal(np.load(directory / "postings_data.npy"), expected.data)
+        assert np.array_equal(np.load(directory / "postings_counts.npy"), expected_counts.data)
+
+
+def build_quietly(build, **options) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        build(workers=1, cache=None, **options)
+    return kb_store.load_index(options["index_dir"], mmap=False)
+
+
+def check_store_streaming_build_matches_in_memory():
+    with tempfile.TemporaryDirectory() as tmp:
+        kb_dir = Path(tmp) / "knowledge_base"
+        kb_dir.mkdir()
+        for name in SAMPLE_PDFS:
+            shutil.copy(build_hr_kb.KB_DIR / name, kb_dir / name)
+        memory = build_quietly(build_hr_kb.build_index, kb_dir=kb_dir, index_dir=Path(tmp) / "memory")
+        streamed = build_quietly(
+            build_hr_kb.build_index_streaming, kb_dir=kb_dir, index_dir=Path(tmp) / "streamed", block_size=4
+        )
+        assert len(memory["chunks"]) == len(streamed["chunks"]) > 4
+        for i in range(len(memory["chunks"])):
+            assert memory["chunks"][i] == streamed["chunks"][i], i
+        assert memory["vectorizer"].vocabulary_ == streamed["vectorizer"].vocabulary_
+        assert np.allclose(memory["vectorizer"].idf_, streamed["vectorizer"].idf_)
+        for name in ("matrix", "postings"):
+            a, b = memory[name], streamed[name]
+            assert np.array_equal(a.indptr, b.indptr) and np.array_equal(a.indices, b.indices), name
+            assert np.allclose(a.data, b.data), name
+        for name in ("chunk_length", "idf"):
+            assert np.allclose(memory["bm25"][name], streamed["bm25"][name]), name
+        for name in ("postings", "weights"):
+            assert np.allclose(memory["bm25"][name].data, streamed["bm25"][name].data), name
+
+
+def check_dedup_folds_near_duplicates():
+    policy = " ".join(f"Employees accrue vacation day {i} of the policy year" for i in range(6))
+    chunks = [
+        {"source": "a.pdf", "page": 1, "text": policy},
+        {"source": "b.pdf", "page": 3, "page_end": 4, "text": policy.replace("year", "period", 1)},
+        {"source": "c.pdf", "page": 9, "text": "Harassment reports go to HR within two days of the incident."},
+        {"source": "c.pdf", "page": 10, "text": "   "},
+        {"source": "d.pdf", "page": 2, "text": policy},
+    ]
+    kept, dropped = build_hr_kb.dedup_chunks([dict(c) for c in chunks], threshold=0.8)
+    assert [(c["source"], c["page"]) for c in kept] == [("a.pdf", 1), ("c.pdf", 9), ("c.pdf", 10)]
+    assert kept[0]["also"] == [{"source": "b.pdf", "page": 3, "page_end": 4}, {"source": "d.pdf", "page": 2}]
+    assert "also" not in kept[1] and len(dropped) == 2
+
+    kept, dropped = build_hr_kb.dedup_chunks([dict(c) for c in chunks], threshold=1.0)
+    assert len(kept) == 4 and [c["source"] for c in dropped] == ["d.pdf"]
+
+
+# =========================
+# SNIPPET WINDOWS
+# =========================
+def check_snippets_window():
+    filler = [f"Section {i} describes general workplace rules for all staff." for i in range(8)]
+    target = "Maternity leave lasts sixteen weeks at full pay."
+    text = " ".join(filler[:4] + [target] + filler[4:])
+    windower = SnippetWindower.from_vectorizer(TfidfVectorizer(stop_words="english").fit(filler + [target]), 40)
+
+    windowed = windower.window("How long is maternity leave?", text)
+    assert target in windowed and windowed.startswith(ELLIPSIS) and windowed.endswith(ELLIPSIS), windowed
+    assert estimate_tokens(windowed.strip(ELLIPSIS + " ")) <= 40
+    # No known query term: the opening of the chunk.
+    assert windower.window("zzz", text).startswith(filler[0])
+    # Within budget: unchanged.
+    assert windower.window("maternity leave", target) == target
+    # One run-on sentence: cut on words.
+    cut = windower.window("maternity", " ".join(["maternity"] * 200))
+    assert cut.endswith(ELLIPSIS) and estimate_tokens(cut) <= 42
+
+
+# =========================
+# REPLY CACHE
+# =========================
+def check_reply_cache_key():
+    # The Flask app module (no Groq key needed); imported here so other checks do not load it.
+    import kinneckt_hr_assistant_app as app
+
+    snippets = [{"source": "handbook.pdf", "page": 4, "text": "Vacation accrues monthly."}]
+    key = app.reply_cache_key("How many vacation days?", "HR", "chat", "acme", snippets, [])
+    assert key == app.reply_cache_key("  how many VACATION days ", "People Ops", "Chat", "acme", snippets, [])
+    assert key[1:3] == ("hr", "chat")
+    assert app.reply_cache_key("How many vacation days?", "Supervisor", "chat", "acme", snippets, []) != key
+    assert app.reply_cache_key("How many vacation days?", "hr", "mediation", "acme", snippets, []) != key
+    assert app.reply_cache_key("How many vacation days?", "hr", "chat", "beta", snippets, []) != key
+    edited = [{**snippets[0], "text": "Vacation accrues weekly."}]
+    assert app.reply_cache_key("How many vacation days?", "hr", "chat", "acme", edited, []) != key
+    # Unknown roles share one template, and so one entry.
+    assert app.reply_cache_key("Hi there", "intern", "chat", "acme", [], []) == app.reply_cache_key(
+        "Hi there", "", "chat", "acme", [], []
+    )
+    history = [{"role": "user", "content": "Hello"}]
+    assert app.reply_cache_key("How many vacation days?", "hr", "chat", "acme", snippets, history) is None
+
+
+# =========================
+# SEMANTIC CACHE
+# =========================
+class Encoder:
+    """TF-IDF question encoder shaped like the app's (kb_index vectorizer)."""
+
+    def __init__(self, texts: list[str]):
+        self.vectorizer = TfidfVectorizer(stop_words="english").fit(texts)
+        self.analyzer = self.vectorizer.build_analyzer()
+
+    def probe(self, question: str, scope=("acme", "employee", "chat", "v1"), snippets=("handbook.pdf",)) -> dict:
+        return {
+            "vector": self.vectorizer.transform([question]),
+            "scope": scope,
+            "question": question,
+            "guard": guard_terms(question, self.vectorizer.vocabulary_, self.analyzer),
+            "snippet_ids": frozenset(snippets),
+        }
+
+
+def check_semantic_paraphrase_hits():
+    enc = Encoder(QUESTIONS + FILLER)
+    cache = SemanticCache(threshold=0.85)
+    entry_id = cache.put(reply="answer", **enc.probe("How do I report harassment?"))
+    hit = cache.lookup(**enc.probe("How do I report harassment at work"))
+    assert hit is not None and hit["id"] == entry_id and hit["reply"] == "answer", hit
+    assert cache.threshold <= hit["similarity"] <= 1.0
+    assert cache.stats()["hits"] == 1
+
+
+def check_semantic_rewordings_hit():
+    enc = Encoder(QUESTIONS + FILLER)
+    for stored, asked in [
+        ("How do I request PTO?", "How can I request PTO?"),
+        ("What is the harassment policy?", "What's the policy on harassment?"),
+        ("How many vacation days do I get?", "How many vacation days do I get each year?"),
+    ]:
+        cache = SemanticCache(threshold=0.85)
+        cache.put(reply="answer", **enc.probe(stored))
+        assert cache.lookup(**enc.probe(asked)) is not None, (stored, asked)
+        assert cache.stats()["rejected_by_guards"] == 0
+    # Modals and quantifiers are not guarded: only the vectors decide these.
+    assert enc.probe("How much PTO do I get?")["guard"] == enc.probe("How many vacation days do I get?")["guard"]
+
+
+def check_semantic_unrelated_misses():
+    enc = Encoder(QUESTIONS + FILLER)
+    cache = SemanticCache(threshold=0.85)
+    cache.put(reply="vacation", **enc.probe("How many vacation days do I get?"))
+    assert cache.lookup(**enc.probe("How many sick days do I get?")) is None
+    assert cache.lookup(**enc.probe("How do I report harassment?")) is None
+    assert cache.stats()["misses"] == 2
+
+
+def check_semantic_negation_and_opposites_miss():
+    enc = Encoder(QUESTIONS + FILLER)
+    for stored, asked in [
+        ("Can I be fired with notice?", "Can I be fired without notice?"),
+        ("Can I take vacation before my probation ends?", "Can I take vacation after my probation ends?"),
+        ("Should I report harassment to my manager?", "Should I not report harassment to my manager?"),
+        ("Should I report harassment to my manager?", "Shouldn't I report harassment to my manager?"),
+    ]:
+        cache = SemanticCache(threshold=0.85)
+        stored_probe, asked_probe = enc.probe(stored), enc.probe(asked)
+        # The vectors alone cannot tell these apart...
+        sim = (stored_probe["vector"] @ asked_probe["vector"].T).toarray()[0, 0]
+        assert sim > 0.99, (stored, asked, sim)
+        # ...the guard terms can.
+        cache.put(reply="answer", **stored_probe)
+        assert cache.lookup(**asked_probe) is None, (stored, asked)
+        assert cache.stats()["rejected_by_guards"] == 1
+
+
+def check_semantic_scope_and_snippets():
+    enc = Encoder(QUESTIONS + FILLER)
+    cache = SemanticCache(threshold=0.85)
+    cache.put(reply="answer", **enc.probe("How do I report harassment?"))
+    asked = "How do I report harassment at work"
+    assert cache.lookup(**enc.probe(asked, scope=("other", "employee", "chat", "v1"))) is None
+    assert cache.lookup(**enc.probe(asked, scope=("acme", "employee", "chat", "v2"))) is None
+    assert cache.lookup(**enc.probe(asked, snippets=("other.pdf",))) is None
+    assert cache.lookup(**enc.probe(asked)) is not None
+
+    lenient = SemanticCache(threshold=0.85, require_shared_snippet=False)
+    lenient.put(reply="answer", **enc.probe("How do I report harassment?"))
+    assert lenient.lookup(**enc.probe(asked, snippets=("other.pdf",))) is not None
+
+
+def check_semantic_eviction_and_reports():
+    enc = Encoder(QUESTIONS + FILLER)
+    cache = SemanticCache(threshold=0.85, max_entries=2)
+    first = cache.put(reply="1", **enc.probe("How do I report harassment?"))
+    cache.put(reply="2", **enc.probe("How many vacation days do I get?"))
+    cache.lookup(**enc.probe("How do I report harassment at work"))  # first is now most recent
+    cache.put(reply="3", **enc.probe("How many sick days do I get?"))
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+    assert cache.lookup(**enc.probe("How many vacation days do I get?")) is None
+
+    assert cache.report_false_hit(first, note="check")
+    assert not cache.report_false_hit(first)
+    assert cache.lookup(**enc.probe("How do I report harassment at work")) is None
+    assert cache.clear("acme") == 1 and len(cache) == 0
+
+    expiring = SemanticCache(threshold=0.85, ttl_seconds=0.01)
+    expiring.put(reply="old", **enc.probe("How do I report harassment?"))
+    time.sleep(0.02)
+    assert expiring.lookup(**enc.probe("How do I report harassment?")) is None and len(expiring) == 0
+
+
+# =========================
+# TTL CACHE
+# =========================
+def check_ttl_lru_order():
+    cache = TTLCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # b is now least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.keys() == ["a", "c"] and cache.stats()["evictions"] == 1
+
+
+def check_ttl_byte_budget():
+    cache = TTLCache(max_entries=10, max_bytes=10, sizeof=len)
+    for key in "abc":
+        assert cache.put(key, "xxxx")
+    # 12 bytes > 10: the least recently used entry went.
+    assert cache.keys() == ["b", "c"] and cache.stats()["bytes"] == 8
+    cache.put("b", "x")
+    assert cache.stats()["bytes"] == 5
+
+
+def check_ttl_oversized():
+    cache = TTLCache(max_entries=10, max_bytes=10, sizeof=len)
+    cache.put("a", "xxxx")
+    assert not cache.put("huge", "x" * 11)
+    assert cache.keys() == ["a"] and cache.stats()["oversized"] == 1
+
+    pinned = TTLCache(max_entries=10, max_bytes=10, sizeof=len, keep_oversized=True)
+    pinned.put("a", "xxxx")
+    assert pinned.put("huge", "x" * 11)
+    assert pinned.keys() == ["huge"] and pinned.get("huge") == "x" * 11
+    pinned.put("b", "xx")
+    assert pinned.keys() == ["b"]
+
+    assert not TTLCache(max_entries=0).put("a", 1)
+
+
+def check_ttl_expiry():
+    cache = TTLCache(max_entries=10, ttl_seconds=0.01)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.02)
+    assert cache.get("a") is MISSING and cache.stats()["expirations"] == 1 and len(cache) == 0
+
+
+# =========================
+# RANK FUSION
+# =========================
+def check_rrf_order():
+    bm25 = [(10, 12.0), (11, 9.0), (12, 3.0)]
+    lsa = [(11, 0.9), (13, 0.8), (10, 0.1)]
+    fused = reciprocal_rank_fusion([bm25, lsa], top_k=4, k=60)
+    assert [row for row, _ in fused] == [11, 10, 13, 12], fused
+    assert np.isclose(fused[0][1], 1 / 62 + 1 / 61)
+
+
+def check_rrf_ties_and_top_k():
+    # Rows 1 and 2 tie (one first place each): first seen wins.
+    fused = reciprocal_rank_fusion([[(1, 5.0)], [(2, 0.5)]], top_k=2, k=60)
+    assert [row for row, _ in fused] == [1, 2]
+    assert len(reciprocal_rank_fusion([[(1, 1.0), (2, 1.0), (3, 1.0)]], top_k=2)) == 2
+    assert reciprocal_rank_fusion([], top_k=3) == []
+
+
+class SlowRanker:
+    """Ranker stub: returns hits after delay seconds."""
+
+    def __init__(self, name: str, hits: list, delay: float):
+        self.name, self.hits, self.delay = name, hits, delay
+
+    def transform(self, queries):
+        return queries
+
+    def search(self, q_vec, top_k):
+        time.sleep(self.delay)
+        return self.hits[:top_k]
+
+
+def check_rrf_hybrid_deadline():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        primary = SlowRanker("slow", [(1, 1.0)], delay=0.2)
+        hybrid = HybridRetriever([primary, SlowRanker("fast", [(2, 1.0)], 0.0)], pool, budget_ms=20)
+        started = time.perf_counter()
+        hits = hybrid.search(["q"], top_k=2)
+        assert time.perf_counter() - started < 0.15 and [row for row, _ in hits] == [2] and not hits.complete
+        time.sleep(0.25)  # the late primary finishes and is remembered
+        hits = hybrid.search(["q"], top_k=2)
+        assert [row for row, _ in hits] == [1, 2] and not hits.complete
+        stats = hybrid.stats()
+        assert stats["late"] == {"slow": 2} and stats["primary_from_cache"] == 1 and stats["over_budget"] == 0
+
+        # Nothing in time and nothing cached: wait for the first ranker rather than return nothing.
+        hybrid = HybridRetriever(
+            [SlowRanker("a", [(1, 1.0)], 0.05), SlowRanker("b", [(2, 1.0)], 0.2)], pool, budget_ms=10
+        )
+        hits = hybrid.search(["q"], top_k=2)
+        assert [row for row, _ in hits] == [1] and hybrid.stats()["over_budget"] == 1
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        hybrid = HybridRetriever(
+            [SlowRanker("first", [(1, 1.0)], 0.0), SlowRanker("second", [(2, 1.0)], 0.0)], pool, budget_ms=100
+        )
+        assert hybrid.search(["q"], top_k=2).complete
+        # Another query holds the only thread: both rankers wait in the queue past the budget.
+        pool.submit(time.sleep, 0.2)
+        hybrid.budget_ms = 20
+        hits = hybrid.search(["q"], top_k=2)
+        assert [row for row, _ in hits] == [1] and not hits.complete
+        assert hybrid.stats()["queued"] == {"first": 1, "second": 1}
+
+
+# =========================
+# BM25
+# =========================
+def check_bm25_batch_matches_single():
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(200)]
+    docs = [" ".join(rng.choice(words, size=rng.integers(5, 60))) for _ in range(300)]
+    counter = CountVectorizer().fit(docs)
+    counts = counter.transform(docs)
+    n_docs = counts.shape[0]
+    doc_freq = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+    for delta in (0.0, 1.0):
+        ranker = BM25Retriever(
+            counts.T.tocsr(),
+            np.asarray(counts.sum(axis=1)).ravel(),
+            idf,
+            delta=delta,
+            analyzer=counter.build_analyzer(),
+            vocabulary=counter.vocabulary_,
+        )
+        queries = [" ".join(rng.choice(words, size=3)) for _ in range(50)]
+        q_mat = ranker.transform(queries)
+        batch = ranker.search_batch(q_mat, top_k=5)
+        for i, query in enumerate(queries):
+            single = ranker.search(q_mat[i], top_k=5)
+            assert np.allclose([s for _, s in single], [s for _, s in batch[i]]), (query, single, batch[i])
+            rows = [row for row, _ in single]
+            assert np.allclose(ranker.row_scores(q_mat[i], rows), [s for _, s in single])
+            rated = relevance(ranker, query, rows)
+            assert np.all((rated > 0) & (rated <= 1)), rated
+
+
+def check_bm25_stored_weights_match_computed():
+    docs = ["Vacation days accrue monthly.", "Sick days need a doctor's note after three days.", "Report harassment."] * 5
+    vectorizer = TfidfVectorizer(stop_words="english").fit(docs)
+    counts = CountVectorizer(stop_words="english", vocabulary=vectorizer.vocabulary_).transform(docs)
+    chunks = [{"source": "handbook.pdf", "page": i + 1, "text": text} for i, text in enumerate(docs)]
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = Path(tmp) / "kb_index"
+        kb_store.write_index(index_dir, chunks, vectorizer, vectorizer.transform(docs), counts=counts)
+        index = kb_store.load_index(index_dir)
+        assert index["meta"]["bm25"] == kb_store.BM25_PARAMS
+        stored = BM25Retriever.from_index(index, **kb_store.BM25_PARAMS)
+        assert stored.heap_bytes == 0 and np.shares_memory(stored.weights.data, index["bm25"]["weights"].data)
+        computed = BM25Retriever.from_index(index, k1=1.5)
+        assert computed.heap_bytes == computed.weights.data.nbytes > 0
+        fresh = BM25Retriever(index["bm25"]["postings"], index["bm25"]["chunk_length"], index["bm25"]["idf"])
+        assert np.allclose(stored.weights.toarray(), fresh.weights.toarray())
+        del index, stored, computed, fresh
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kinneckt backend self-checks.")
+    parser.add_argument("-k", default="", help="Only checks whose name contains this text.")
+    args = parser.parse_args()
+
+    checks = [(name, fn) for name, fn in globals().items() if name.startswith("check_") and args.k in name]
+    failed = 0
+    for name, fn in checks:
+        try:
+            fn()
+            print(f"ok    {name}")
+        except Exception:
+            failed += 1
+            print(f"FAIL  {name}")
+            traceback.print_exc()
+    print(f"\n{len(checks) - failed}/{len(checks)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
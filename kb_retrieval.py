@@ -0,0 +1,619 @@
+"""
+Kinneckt KB retrieval engines.
+
+SparseRetriever: cosine top-k over the TF-IDF index. Chunk rows are stored
+L2-normalized (TfidfVectorizer's default), so cosine similarity is a plain
+dot product. Scoring walks only the postings of the query's terms (the
+transposed, term-major matrix) instead of the whole matrix, and the top-k
+is selected with argpartition instead of a full sort. search_batch() scores
+many queries with one sparse matrix multiply against the same postings.
+
+BM25Retriever: Okapi BM25 (optionally BM25+) over the raw term counts the
+index stores next to the TF-IDF matrix. Length normalization uses the
+stored per-chunk term counts, so long handbook passages are not penalized
+the way L2-normalized cosine penalizes them. The saturated, length-normalized
+weight of each posting does not depend on the query, so the build stores it
+(bm25_weights.npy, memory-mapped and shared like the rest of the index) and
+scoring is the same postings walk / sparse product as cosine. Only a ranker
+with other k1/b/delta than the build's computes its own copy at load.
+
+DenseRetriever: cosine over the LSA chunk vectors (build_hr_kb.py
+--lsa-dims). Queries are TF-IDF transformed, projected onto the LSA
+components and scored with one dense matrix-vector product.
+
+IVFRetriever: approximate DenseRetriever. Chunk vectors are clustered
+(spherical k-means, build_ivf) into inverted lists; a query scores the
+centroids, then only the chunks of its nprobe closest lists. nprobe trades
+recall for latency.
+
+HybridRetriever: runs several of the above concurrently on a thread pool
+(NumPy and SciPy release the GIL in their kernels) and fuses their rankings
+with reciprocal rank fusion, under a per-query time budget.
+
+All of them expose transform(queries) for the query vectors their search()
+takes, and max_score(q_vec), the best score search() could return for that
+query, so scores of any ranker can be read as a 0-1 relevance. The
+score-based rankers also have row_scores(q_vec, rows); relevance() uses it
+to rate a hybrid's fused hits by its primary ranker, because fused scores
+are rank-based (every ranker's first hit gets the same score).
+"""
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+from kb_store import bm25_weights
+from ttl_cache import MISSING, TTLCache
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the top_k highest scores, best first."""
+    if top_k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.intp)
+    if len(scores) > top_k:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def batch_top_k(q_mat, postings, top_k: int, block_size: int, scale: float = 1.0) -> list[list[tuple[int, float]]]:
+    """
+    Top-k of every row of q_mat against term-major postings. Each block of
+    queries is scored with a single (queries x terms) @ (terms x chunks)
+    sparse product; blocks bound the size of the intermediate score matrix.
+    """
+    q_mat = csr_matrix(q_mat)
+    results = []
+    for start in range(0, q_mat.shape[0], block_size):
+        scores = csr_matrix(q_mat[start:start + block_size] @ postings) * scale
+        for i in range(scores.shape[0]):
+            lo, hi = scores.indptr[i], scores.indptr[i + 1]
+            rows, values = scores.indices[lo:hi], scores.data[lo:hi]
+            best = top_k_indices(values, top_k)
+            results.append([(int(rows[j]), float(values[j])) for j in best])
+    return results
+
+
+def sum_by_row(row_parts: list, score_parts: list, n_rows: int) -> tuple[np.ndarray, np.ndarray]:
+    """Add up per-posting score contributions into (rows, scores)."""
+    if not row_parts:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+    rows = np.concatenate(row_parts)
+    contributions = np.concatenate(score_parts)
+    if len(rows) * 4 < n_rows:
+        # Few postings touched: aggregate just those rows.
+        touched, inverse = np.unique(rows, return_inverse=True)
+        return touched, np.bincount(inverse, weights=contributions)
+
+    # Common terms touch a large share of the corpus: a dense accumulator
+    # is cheaper than sorting the postings.
+    scores = np.bincount(rows, weights=contributions, minlength=n_rows)
+    touched = np.flatnonzero(scores)
+    return touched, scores[touched]
+
+
+class SparseRetriever:
+    """
+    Cosine top-k over an L2-normalized CSR chunk matrix.
+
+    postings is the same matrix in term-major layout (CSR of matrix.T); it is
+    built here when the index does not ship one. value_scale converts stored
+    values back to weights (quantized uint8 indexes store weight / scale).
+    """
+
+    name = "tfidf"
+
+    def __init__(
+        self,
+        matrix,
+        postings=None,
+        normalized: bool = True,
+        vectorizer=None,
+        value_scale: float = 1.0,
+    ):
+        matrix = csr_matrix(matrix)
+        if not normalized:
+            matrix = normalize(matrix, norm="l2", copy=True)
+            postings = None
+        self.matrix = matrix
+        self.n_rows = matrix.shape[0]
+        self.postings = csr_matrix(postings) if postings is not None else matrix.T.tocsr()
+        self.vectorizer = vectorizer
+        self.value_scale = value_scale
+
+    @classmethod
+    def from_index(cls, index: dict) -> "SparseRetriever":
+        meta = index.get("meta") or {}
+        return cls(
+            index["matrix"],
+            postings=index.get("postings"),
+            # Legacy pickles were always built with TfidfVectorizer's l2 norm.
+            normalized=meta.get("row_norm", "l2") == "l2",
+            vectorizer=index["vectorizer"],
+            value_scale=meta.get("value_scale", 1.0),
+        )
+
+    def transform(self, queries: list[str]):
+        return self.vectorizer.transform(queries)
+
+    def score(self, q_vec) -> tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) for every chunk that shares a term with the query."""
+        q_vec = csr_matrix(q_vec)
+        indptr, indices, data = self.postings.indptr, self.postings.indices, self.postings.data
+
+        row_parts, score_parts = [], []
+        for term, weight in zip(q_vec.indices, q_vec.data):
+            start, end = indptr[term], indptr[term + 1]
+            if start == end:
+                continue
+            row_parts.append(indices[start:end])
+            score_parts.append(data[start:end] * (weight * self.value_scale))
+        return sum_by_row(row_parts, score_parts, self.n_rows)
+
+    def search(self, q_vec, top_k: int = 3) -> list[tuple[int, float]]:
+        """[(row, score), ...] best first; rows with no shared term are never returned."""
+        rows, scores = self.score(q_vec)
+        best = top_k_indices(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def max_score(self, q_vec) -> float:
+        """Cosine of a chunk identical to the query."""
+        return 1.0
+
+    def row_scores(self, q_vec, rows) -> np.ndarray:
+        """Scores of the given chunk rows for one query."""
+        q_vec = csr_matrix(q_vec)
+        weights = self.postings[q_vec.indices][:, np.asarray(rows, dtype=np.intp)].toarray()
+        return (q_vec.data @ weights) * self.value_scale
+
+    def search_batch(self, q_mat, top_k: int = 3, block_size: int = 256) -> list[list[tuple[int, float]]]:
+        """search() for every row of q_mat, in sparse-product blocks (batch_top_k)."""
+        return batch_top_k(q_mat, self.postings, top_k, block_size, scale=self.value_scale)
+
+
+class BM25Retriever:
+    """
+    BM25 top-k over term-major raw counts.
+
+    postings: (terms x chunks) CSR of term frequencies; chunk_length: terms per
+    chunk; idf: per-term BM25 idf. delta > 0 gives BM25+, which adds a floor
+    for every matched term so very long chunks are not scored towards zero.
+
+    weights holds idf(t) * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl)) + delta)
+    for every posting, in the postings' layout (one value per stored count),
+    so a query's score is q_counts @ weights. Pass the index's stored weights
+    when they were built for the same k1, b and delta; otherwise they are
+    computed here, in memory (heap_bytes).
+    """
+
+    name = "bm25"
+
+    def __init__(
+        self,
+        postings,
+        chunk_length,
+        idf,
+        k1: float = 1.2,
+        b: float = 0.75,
+        delta: float = 0.0,
+        analyzer=None,
+        vocabulary=None,
+        weights=None,
+    ):
+        postings = csr_matrix(postings)
+        self.n_rows = postings.shape[1]
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.k1, self.b, self.delta = k1, b, delta
+        if weights is not None:
+            self.weights = csr_matrix(weights, copy=False)
+            self.heap_bytes = 0
+        else:
+            avg_length = float(np.mean(chunk_length, dtype=np.float64)) if len(chunk_length) else 1.0
+            term_idf = np.repeat(self.idf[: postings.shape[0]], np.diff(postings.indptr))
+            data = bm25_weights(postings.data, postings.indices, term_idf, chunk_length, avg_length, k1, b, delta)
+            self.weights = csr_matrix((data, postings.indices, postings.indptr), shape=postings.shape)
+            self.heap_bytes = data.nbytes
+        self.analyzer = analyzer
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_index(cls, index: dict, k1: float = 1.2, b: float = 0.75, delta: float = 0.0) -> "BM25Retriever":
+        bm25 = index.get("bm25")
+        if not bm25:
+            raise ValueError("index has no term counts for BM25; rebuild it with build_hr_kb.py")
+        vectorizer = index["vectorizer"]
+        stored = bm25.get("params") == {"k1": k1, "b": b, "delta": delta}
+        return cls(
+            bm25["postings"],
+            bm25["chunk_length"],
+            bm25["idf"],
+            k1=k1,
+            b=b,
+            delta=delta,
+            analyzer=vectorizer.build_analyzer(),
+            vocabulary=vectorizer.vocabulary_,
+            weights=bm25["weights"] if stored else None,
+        )
+
+    def transform(self, queries: list[str]):
+        """Query term counts, (queries x terms); out-of-vocabulary terms are dropped."""
+        indptr, indices, data = [0], [], []
+        for query in queries:
+            counts = Counter(self.vocabulary[t] for t in self.analyzer(query) if t in self.vocabulary)
+            terms = sorted(counts)
+            indices.extend(terms)
+            data.extend(counts[t] for t in terms)
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), indptr),
+            shape=(len(queries), len(self.idf)),
+        )
+
+    def score(self, q_vec) -> tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) for every chunk that shares a term with the query."""
+        q_vec = csr_matrix(q_vec)
+        indptr, indices, data = self.weights.indptr, self.weights.indices, self.weights.data
+
+        row_parts, score_parts = [], []
+        for term, q_count in zip(q_vec.indices, q_vec.data):
+            start, end = indptr[term], indptr[term + 1]
+            if start == end:
+                continue
+            row_parts.append(indices[start:end])
+            score_parts.append(data[start:end] * q_count)
+        return sum_by_row(row_parts, score_parts, self.n_rows)
+
+    def search(self, q_vec, top_k: int = 3) -> list[tuple[int, float]]:
+        """[(row, score), ...] best first; rows with no shared term are never returned."""
+        rows, scores = self.score(q_vec)
+        best = top_k_indices(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def max_score(self, q_vec) -> float:
+        """Score of a chunk in which every query term saturates (tf -> infinity)."""
+        q_vec = csr_matrix(q_vec)
+        return float(q_vec.data @ self.idf[q_vec.indices]) * (self.k1 + 1.0 + self.delta)
+
+    def row_scores(self, q_vec, rows) -> np.ndarray:
+        """Scores of the given chunk rows for one query (0 for rows sharing no term)."""
+        q_vec = csr_matrix(q_vec)
+        # Only the query's term rows of the weights, then only the asked-for chunks.
+        weights = self.weights[q_vec.indices][:, np.asarray(rows, dtype=np.intp)].toarray()
+        return q_vec.data @ weights
+
+    def search_batch(self, q_mat, top_k: int = 3, block_size: int = 256) -> list[list[tuple[int, float]]]:
+        """search() for every row of q_mat: q_counts @ weights in sparse-product blocks (batch_top_k)."""
+        return batch_top_k(q_mat, self.weights, top_k, block_size)
+
+
+class DenseRetriever:
+    """
+    Cosine top-k over L2-normalized dense chunk vectors (n_chunks x dims).
+    projection (n_terms x dims, the transposed SVD components) maps TF-IDF
+    query vectors into the same space.
+    """
+
+    name = "lsa"
+
+    def __init__(self, vectors, projection, vectorizer=None):
+        self.vectors = vectors
+        self.projection = projection
+        self.n_rows = len(vectors)
+        self.vectorizer = vectorizer
+
+    @classmethod
+    def from_index(cls, index: dict) -> "DenseRetriever":
+        lsa = index.get("lsa")
+        if not lsa:
+            raise ValueError("index has no LSA vectors; rebuild it with build_hr_kb.py --lsa-dims 256")
+        return cls(lsa["vectors"], lsa["projection"], vectorizer=index["vectorizer"])
+
+    def transform(self, queries: list[str]) -> np.ndarray:
+        """(queries x dims) float32, L2-normalized; all-zero for queries with no known term."""
+        q_mat = self.vectorizer.transform(queries)
+        projected = np.zeros((q_mat.shape[0], self.projection.shape[1]), dtype=np.float32)
+        for i in range(q_mat.shape[0]):
+            lo, hi = q_mat.indptr[i], q_mat.indptr[i + 1]
+            # Queries have a handful of terms: gather their rows, not a sparse x dense product.
+            projected[i] = q_mat.data[lo:hi] @ self.projection[q_mat.indices[lo:hi]]
+        return normalize(projected)
+
+    def search(self, q_vec, top_k: int = 3) -> list[tuple[int, float]]:
+        """[(row, score), ...] best first; only positive similarities are returned."""
+        q = np.asarray(q_vec, dtype=np.float32).reshape(-1)
+        if not q.any():
+            return []
+        scores = self.vectors @ q
+        best = top_k_indices(scores, top_k)
+        return [(int(i), float(scores[i])) for i in best if scores[i] > 0]
+
+    def max_score(self, q_vec) -> float:
+        """Cosine of a chunk vector pointing exactly along the query's."""
+        return 1.0
+
+    def row_scores(self, q_vec, rows) -> np.ndarray:
+        """Scores of the given chunk rows for one query."""
+        q = np.asarray(q_vec, dtype=np.float32).reshape(-1)
+        return np.asarray(self.vectors[np.asarray(rows, dtype=np.intp)] @ q, dtype=np.float64)
+
+    def search_batch(self, q_mat, top_k: int = 3, block_size: int = 256) -> list[list[tuple[int, float]]]:
+        """search() for every row of q_mat, one (block x dims) @ (dims x chunks) product per block."""
+        q_mat = np.asarray(q_mat, dtype=np.float32)
+        results = []
+        for start in range(0, len(q_mat), block_size):
+            block = q_mat[start:start + block_size]
+            scores = block @ self.vectors.T
+            for q, row_scores in zip(block, scores):
+                if not q.any():
+                    results.append([])
+                    continue
+                best = top_k_indices(row_scores, top_k)
+                results.append([(int(i), float(row_scores[i])) for i in best if row_scores[i] > 0])
+        return results
+
+
+def spherical_kmeans(vectors, n_clusters: int, iterations: int = 10, seed: int = 0, block_rows: int = 65536):
+    """k-means on L2-normalized rows with cosine assignment; returns normalized centroids."""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    centroids = np.array(vectors[np.sort(rng.choice(n, n_clusters, replace=False))], dtype=np.float32)
+    for _ in range(iterations):
+        sums = np.zeros_like(centroids)
+        counts = np.zeros(n_clusters, dtype=np.int64)
+        for start in range(0, n, block_rows):
+            block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+            labels = np.argmax(block @ centroids.T, axis=1)
+            members = csr_matrix(
+                (np.ones(len(block), dtype=np.float32), (labels, np.arange(len(block)))),
+                shape=(n_clusters, len(block)),
+            )
+            sums += members @ block
+            counts += np.bincount(labels, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists from random rows instead of letting them die.
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+        centroids = normalize(sums).astype(np.float32)
+    return centroids
+
+
+def build_ivf(
+    vectors,
+    n_lists: int,
+    iterations: int = 10,
+    train_size: int | None = None,
+    seed: int = 0,
+    block_rows: int = 65536,
+) -> dict:
+    """
+    Inverted-file index over dense, L2-normalized vectors.
+
+    Centroids are trained on a sample (train_size rows, default 64 per list),
+    then every row is assigned to its closest centroid. Returns
+    {"centroids": (n_lists x dims), "offsets": (n_lists + 1), "order": row ids
+    grouped by list}, so list l holds rows order[offsets[l]:offsets[l + 1]].
+    """
+    n = len(vectors)
+    n_lists = max(1, min(n_lists, n))
+    train_size = min(n, train_size or 64 * n_lists)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, train_size, replace=False))
+    centroids = spherical_kmeans(np.asarray(vectors[sample], dtype=np.float32), n_lists, iterations, seed, block_rows)
+
+    labels = np.empty(n, dtype=np.int32)
+    for start in range(0, n, block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+    order = np.argsort(labels, kind="stable").astype(np.int32)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+    return {"centroids": centroids, "offsets": offsets, "order": order}
+
+
+class IVFRetriever(DenseRetriever):
+    """DenseRetriever that only scores the nprobe inverted lists closest to the query."""
+
+    name = "lsa-ivf"
+
+    def __init__(self, vectors, projection, centroids, offsets, order, nprobe: int = 8, vectorizer=None):
+        super().__init__(vectors, projection, vectorizer=vectorizer)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets)
+        self.order = order
+        self.nprobe = max(1, min(nprobe, len(self.centroids)))
+
+    @classmethod
+    def from_index(cls, index: dict, nprobe: int = 8) -> "IVFRetriever":
+        lsa = index.get("lsa")
+        if not lsa or "ivf" not in lsa:
+            raise ValueError("index has no IVF lists; rebuild it with build_hr_kb.py --lsa-dims 256 --ivf-lists N")
+        ivf = lsa["ivf"]
+        return cls(
+            lsa["vectors"],
+            lsa["projection"],
+            ivf["centroids"],
+            ivf["offsets"],
+            ivf["order"],
+            nprobe=nprobe,
+            vectorizer=index["vectorizer"],
+        )
+
+    def candidates(self, q: np.ndarray) -> np.ndarray:
+        """Row ids in the nprobe lists whose centroids are closest to q."""
+        probe = top_k_indices(self.centroids @ q, self.nprobe)
+        return np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in probe])
+
+    def search(self, q_vec, top_k: int = 3) -> list[tuple[int, float]]:
+        """[(row, score), ...] best first, among the probed lists only."""
+        q = np.asarray(q_vec, dtype=np.float32).reshape(-1)
+        if not q.any():
+            return []
+        rows = self.candidates(q)
+        scores = self.vectors[rows] @ q
+        best = top_k_indices(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best if scores[i] > 0]
+
+    def search_batch(self, q_mat, top_k: int = 3, block_size: int = 256) -> list[list[tuple[int, float]]]:
+        q_mat = np.asarray(q_mat, dtype=np.float32)
+        return [self.search(q, top_k) for q in q_mat]
+
+
+def relevance(retriever, query: str, rows) -> np.ndarray:
+    """
+    0-1 relevance of chunk rows for query: score / max_score. A hybrid is
+    rated by its primary (first) ranker, since its fused scores only say
+    how the rankers ordered the rows, not how well any of them matched.
+    """
+    ranker = retriever.rankers[0] if isinstance(retriever, HybridRetriever) else retriever
+    q_vec = ranker.transform([query])
+    return ranker.row_scores(q_vec, rows) / (ranker.max_score(q_vec) or 1.0)
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[tuple[int, float]]], top_k: int, k: int = 60
+) -> list[tuple[int, float]]:
+    """
+    Fuse ranked lists: each row scores sum(1 / (k + rank)) over the lists it
+    appears in (rank from 1). Scales of the input scores do not matter, so
+    cosine, BM25 and dense similarities can be mixed. Ties keep first-seen order.
+    """
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (row, _score) in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    best = sorted(fused.items(), key=lambda item: -item[1])
+    return best[:top_k]
+
+
+class FusedHits(list):
+    """search() result of HybridRetriever; complete is False when a ranker was dropped."""
+
+    complete = True
+
+
+class HybridRetriever:
+    """
+    Reciprocal rank fusion over several retrievers.
+
+    Every ranker runs on executor, and whatever has not finished within
+    budget_ms of the start of the query is dropped: a dropped ranker keeps
+    running in its thread but its result is ignored, and one still waiting
+    for a pool thread is cancelled (stats: "late" and "queued"). The first
+    ranker is the primary: when it is late, its last result for the same
+    query (kept for primary_cache_size queries, also when it finishes after
+    the budget) stands in for it. Only when no ranker and no cached result is
+    in time does the query wait for the first ranker to finish
+    ("over_budget"), so a query never comes back empty because of the pool.
+    depth is how many candidates each ranker fuses.
+
+    executor should have a thread for every ranker of every query that can
+    run at once (request threads x rankers), or queries queue behind each
+    other and lose rankers under load.
+    """
+
+    name = "hybrid"
+
+    def __init__(
+        self,
+        rankers: list,
+        executor: Executor,
+        budget_ms: float = 50.0,
+        rrf_k: int = 60,
+        depth: int = 20,
+        primary_cache_size: int = 1024,
+    ):
+        self.rankers = rankers
+        self.name = "hybrid:" + "+".join(r.name for r in rankers)
+        self.executor = executor
+        self.budget_ms = budget_ms
+        self.rrf_k = rrf_k
+        self.depth = depth
+        self.primary_cache = TTLCache(max_entries=primary_cache_size)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.late = Counter()
+        self.queued = Counter()
+        self.primary_cached = 0
+        self.over_budget = 0
+
+    def transform(self, queries: list[str]) -> list[str]:
+        # Each ranker vectorizes for itself, inside its own task.
+        return list(queries)
+
+    def _run(self, ranker, queries: list[str], top_k: int):
+        return ranker.search(ranker.transform(queries), top_k)
+
+    def search(self, q_vec: list[str], top_k: int = 3) -> FusedHits:
+        """q_vec is transform()'s output for one query."""
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        depth = max(top_k, self.depth)
+        key = (tuple(q_vec), depth)
+        futures = [self.executor.submit(self._run, ranker, q_vec, depth) for ranker in self.rankers]
+
+        def remember(future):
+            if not future.cancelled() and future.exception() is None:
+                self.primary_cache.put(key, future.result())
+
+        futures[0].add_done_callback(remember)
+        done, not_done = wait(futures, timeout=max(0.0, deadline - time.perf_counter()))
+        ok = [f in done and f.exception() is None for f in futures]
+        primary = futures[0].result() if ok[0] else self.primary_cache.get(key)
+        rankings = [] if primary is MISSING else [primary]
+        rankings += [f.result() for f, finished in zip(futures[1:], ok[1:]) if finished]
+
+        over_budget = False
+        while not rankings and not_done:
+            over_budget = True
+            done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            rankings = [f.result() for f in futures if f in done and f.exception() is None]
+
+        late, queued = [], []
+        for ranker, future in zip(self.rankers, futures):
+            if future in not_done:
+                (queued if future.cancel() else late).append(ranker.name)
+            elif future.exception() is not None:
+                late.append(ranker.name)
+        with self._lock:
+            self.calls += 1
+            self.late.update(late)
+            self.queued.update(queued)
+            self.primary_cached += not ok[0] and primary is not MISSING
+            self.over_budget += over_budget
+
+        hits = FusedHits(reciprocal_rank_fusion(rankings, top_k, self.rrf_k))
+        hits.complete = all(ok)
+        return hits
+
+    def max_score(self, q_vec: list[str]) -> float:
+        """Fused score of a chunk every ranker puts first."""
+        return len(self.rankers) / (self.rrf_k + 1)
+
+    def search_batch(self, q_mat: list[str], top_k: int = 3) -> list[list[tuple[int, float]]]:
+        """
+        search() for many queries: every ranker runs its own search_batch
+        concurrently. Batches are offline work, so there is no time budget.
+        """
+        depth = max(top_k, self.depth)
+        futures = [self.executor.submit(r.search_batch, r.transform(q_mat), depth) for r in self.rankers]
+        per_ranker = [f.result() for f in futures]
+        return [reciprocal_rank_fusion(list(rankings), top_k, self.rrf_k) for rankings in zip(*per_ranker)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rankers": [r.name for r in self.rankers],
+                "budget_ms": self.budget_ms,
+                "queries": self.calls,
+                "late": dict(self.late),
+                "queued": dict(self.queued),
+                "primary_from_cache": self.primary_cached,
+                "over_budget": self.over_budget,
+            }
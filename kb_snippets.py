@@ -0,0 +1,124 @@
+"""
+Query-focused snippet windows for the chat prompt.
+
+Retrieval returns whole chunks (about 220 tokens each), but usually only a
+few of their sentences answer the question. SnippetWindower keeps, for each
+retrieved chunk, the run of consecutive sentences that covers the most
+query-term weight within a token budget, padded with neighbouring sentences
+while the budget allows, and drops the rest.
+
+Term weights are the index's idf values, from the same analyzer the index
+was built with, so a sentence matching a rare query term outranks one that
+only repeats common ones.
+"""
+
+import re
+
+# Sentence boundaries (shared with build_hr_kb.py's chunker).
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[\"“(\[]?[A-Z0-9])")
+LINE_BREAK = re.compile(r"\s*\n\s*")
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap LLM token estimate (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def text_sentences(text: str) -> list[str]:
+    """Sentences of a chunk; a line break also ends one."""
+    return [s for line in LINE_BREAK.split(text.strip()) for s in SENTENCE_BREAK.split(line) if s.strip()]
+
+
+def _cut_words(text: str, max_tokens: int) -> str:
+    """Longest word prefix of text within max_tokens."""
+    out, used = [], 0
+    for word in text.split():
+        cost = estimate_tokens(word) + 1
+        if out and used + cost > max_tokens:
+            break
+        out.append(word)
+        used += cost
+    return " ".join(out)
+
+
+class SnippetWindower:
+    """
+    analyzer: the index vectorizer's analyzer; vocabulary/idf: its term ->
+    column map and idf array. token_budget is per snippet; texts already
+    within it are returned unchanged.
+    """
+
+    def __init__(self, analyzer, vocabulary: dict, idf, token_budget: int = 120):
+        self.analyzer = analyzer
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.token_budget = token_budget
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer, token_budget: int = 120) -> "SnippetWindower":
+        return cls(vectorizer.build_analyzer(), vectorizer.vocabulary_, vectorizer.idf_, token_budget)
+
+    def query_weights(self, query: str) -> dict[str, float]:
+        """idf of each distinct query term the index knows."""
+        return {
+            term: float(self.idf[self.vocabulary[term]])
+            for term in set(self.analyzer(query))
+            if term in self.vocabulary
+        }
+
+    def best_window(self, sentences: list[str], weights: dict[str, float]) -> tuple[int, int]:
+        """
+        [start, end) of the consecutive sentences within token_budget that
+        cover the most query-term weight (each term counted once). Ties go to
+        the shorter, then the earlier window. Chunks hold a dozen or so
+        sentences, so trying every start is cheap.
+        """
+        terms = [set(self.analyzer(s)) & weights.keys() for s in sentences]
+        tokens = [estimate_tokens(s) + 1 for s in sentences]
+        best, best_key = (0, 1), None
+        for start in range(len(sentences)):
+            covered: set = set()
+            used = 0
+            for end in range(start + 1, len(sentences) + 1):
+                used += tokens[end - 1]
+                if used > self.token_budget and end > start + 1:
+                    break
+                covered |= terms[end - 1]
+                key = (sum(weights[t] for t in covered), -used)
+                if best_key is None or key > best_key:
+                    best, best_key = (start, end), key
+        return best
+
+    def window(self, query: str, text: str) -> str:
+        """text trimmed to the best-matching window, with … where text was cut."""
+        if estimate_tokens(text) <= self.token_budget:
+            return text
+        sentences = text_sentences(text)
+        weights = self.query_weights(query)
+        if not sentences:
+            return text
+        start, end = self.best_window(sentences, weights) if weights else (0, 1)
+
+        # Pad with neighbours, following context first, while they fit.
+        used = sum(estimate_tokens(s) + 1 for s in sentences[start:end])
+        while True:
+            if end < len(sentences) and used + estimate_tokens(sentences[end]) + 1 <= self.token_budget:
+                used += estimate_tokens(sentences[end]) + 1
+                end += 1
+            elif start > 0 and used + estimate_tokens(sentences[start - 1]) + 1 <= self.token_budget:
+                start -= 1
+                used += estimate_tokens(sentences[start]) + 1
+            else:
+                break
+
+        body = " ".join(sentences[start:end])
+        cut = end < len(sentences)
+        if estimate_tokens(body) > self.token_budget:
+            # A single run-on sentence (tables, lists): cut on words.
+            body, cut = _cut_words(body, self.token_budget), True
+        return (ELLIPSIS + " " if start > 0 else "") + body + (" " + ELLIPSIS if cut else "")
+
+    def apply(self, query: str, snippets: list[dict]) -> list[dict]:
+        """Copies of snippets with "text" windowed to the query."""
+        return [{**snip, "text": self.window(query, snip.get("text", ""))} for snip in snippets]
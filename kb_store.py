@@ -0,0 +1,712 @@
+"""
+Kinneckt KB index store.
+
+A built index is a directory of flat arrays instead of one pickle:
+
+    kb_index/
+      meta.json              format, build version, sources, vectorizer params
+      manifest.json          per-document hashes and chunk ranges (build_hr_kb.py)
+      matrix_data.npy        CSR TF-IDF matrix, one row per chunk
+      matrix_indices.npy
+      matrix_indptr.npy
+      matrix_counts.npy      int32 raw term counts, same sparsity as matrix_data
+                             (uint16, saturating, in compact indexes)
+      postings_data.npy      the same matrix term-major (CSR of matrix.T),
+      postings_indices.npy   so retrieval can walk one term's chunks at a time
+      postings_indptr.npy
+      postings_counts.npy    matrix_counts in postings order (BM25 term frequencies)
+      chunk_length.npy       float32 analyzed terms per chunk (BM25 length norm)
+      bm25_idf.npy           float64 BM25 idf per term
+      bm25_weights.npy       BM25 weight of every posting for meta["bm25"]'s k1, b
+                             and delta (float32 in compact indexes)
+      lsa_projection.npy     float32 (n_terms x dims) LSA term vectors, optional
+      lsa_vectors.npy        float32 (n_chunks x dims) L2-normalized chunk vectors
+      ivf_centroids.npy      float32 (n_lists x dims) IVF coarse quantizer, optional
+      ivf_offsets.npy        int64, n_lists + 1 offsets into ivf_order.npy
+      ivf_order.npy          int32 chunk ids grouped by inverted list
+      vocabulary_offsets.npy int64, n_terms + 1 byte offsets into vocabulary.npy
+      vocabulary.npy         uint8 UTF-8 terms, position == matrix column
+      idf.npy
+      chunk_source.npy       int32 index into meta["sources"]
+      chunk_page.npy         int32 page number (first page of the chunk)
+      chunk_page_end.npy     int32 last page, for chunks that cross a page break
+      chunk_text_offsets.npy int64, n_chunks + 1 byte offsets into chunk_text.npy
+      chunk_text.npy         uint8 UTF-8 text of all chunks, concatenated
+      chunk_also_offsets.npy int64, n_chunks + 1 offsets into chunk_also.npy
+      chunk_also.npy         int32 (source, page, page_end) triples, flattened:
+                             where near-duplicates folded into a chunk came from
+
+The global index lives in kb_index/; per-company segments use the same
+layout under kb_tenants/<company_id>/.
+
+meta["values"] records how matrix/postings values are stored: "float64"
+(as fitted), "float32", or "uint8" quantized as round(value * 255), in which
+case scores are multiplied back by meta["value_scale"].
+
+Everything is opened with np.load(mmap_mode="r"), so loading is close to
+free and every worker process shares the same pages through the OS cache.
+"""
+
+import json
+import os
+import re
+import shutil
+import struct
+import time
+import uuid
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+
+# TfidfVectorizer parameters that affect how queries are transformed.
+# Fit-time options (min_df, max_features, ...) are baked into the vocabulary.
+VECTORIZER_PARAMS = (
+    "lowercase",
+    "stop_words",
+    "token_pattern",
+    "ngram_range",
+    "norm",
+    "use_idf",
+    "smooth_idf",
+    "sublinear_tf",
+)
+
+
+# Storage of TF-IDF values: build_hr_kb.py --compact (float32) / --quantize (uint8)
+VALUE_ENCODINGS = ("float64", "float32", "uint8")
+UINT8_SCALE = 1.0 / 255
+
+# BM25 parameters the stored posting weights are computed for (the app's
+# defaults); a ranker with other parameters computes its own at load.
+BM25_PARAMS = {"k1": 1.2, "b": 0.75, "delta": 0.0}
+
+
+def _save_strings(directory: Path, name: str, strings) -> None:
+    """Store strings as one UTF-8 byte array plus an int64 offsets array."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(directory / f"{name}_offsets.npy", offsets)
+    np.save(directory / f"{name}.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+
+def _decode(offsets, blob, i: int) -> str:
+    start, end = int(offsets[i]), int(offsets[i + 1])
+    return blob[start:end].tobytes().decode("utf-8")
+
+
+class ChunkTable(Sequence):
+    """Read-only list of chunk dicts backed by memory-mapped arrays."""
+
+    def __init__(
+        self,
+        sources: list[str],
+        source_ids,
+        pages,
+        page_ends,
+        text_offsets,
+        text_bytes,
+        also_offsets=None,
+        also=None,
+    ):
+        self.sources = sources
+        self.source_ids = source_ids
+        self.pages = pages
+        self.page_ends = page_ends
+        self.text_offsets = text_offsets
+        self.text_bytes = text_bytes
+        self.also_offsets = also_offsets
+        self.also = also
+
+    def also_pages(self, i: int) -> list[dict]:
+        """Other (source, page) locations of text deduplicated into chunk i."""
+        if self.also_offsets is None:
+            return []
+        start, end = int(self.also_offsets[i]), int(self.also_offsets[i + 1])
+        locations = []
+        for source_id, page, page_end in np.asarray(self.also[start:end]).reshape(-1, 3).tolist():
+            location = {"source": self.sources[source_id], "page": page}
+            if page_end != page:
+                location["page_end"] = page_end
+            locations.append(location)
+        return locations
+
+    def __len__(self):
+        return len(self.source_ids)
+
+    def text(self, i: int) -> str:
+        return _decode(self.text_offsets, self.text_bytes, i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("chunk index out of range")
+        chunk = {
+            "source": self.sources[int(self.source_ids[i])],
+            "page": int(self.pages[i]),
+            "text": self.text(i),
+        }
+        if self.page_ends[i] != self.pages[i]:
+            chunk["page_end"] = int(self.page_ends[i])
+        also = self.also_pages(i)
+        if also:
+            chunk["also"] = also
+        return chunk
+
+
+def new_version() -> str:
+    """Build identifier: sortable UTC timestamp plus a random suffix."""
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+
+
+def _vectorizer_meta(vectorizer: TfidfVectorizer) -> dict:
+    params = vectorizer.get_params()
+    meta = {name: params[name] for name in VECTORIZER_PARAMS}
+    meta["ngram_range"] = list(meta["ngram_range"])
+    if meta["stop_words"] is not None and not isinstance(meta["stop_words"], str):
+        meta["stop_words"] = sorted(meta["stop_words"])
+    return meta
+
+
+class _NpyAppender:
+    """
+    Append-only 1-D .npy file. Values go straight to disk; the header (which
+    holds the final length) is filled in by close(), so arrays of unknown
+    size can be written without holding them in memory.
+    """
+
+    HEADER_BYTES = 128
+
+    def __init__(self, path: Path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._file = open(path, "wb")
+        self._file.write(b"\0" * self.HEADER_BYTES)
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self.count += len(values)
+
+    def close(self):
+        if self._file.closed:
+            return
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+            np.lib.format.dtype_to_descr(self.dtype),
+            self.count,
+        )
+        header = header.ljust(self.HEADER_BYTES - 11) + "\n"
+        self._file.seek(0)
+        self._file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+        self._file.close()
+
+
+class IndexWriter:
+    """
+    Write an index directory piece by piece: chunks with add_chunks(), matrix
+    rows with add_rows(), then finish() to write the vocabulary and metadata
+    and publish. Nothing is accumulated in memory except the list of source
+    names, so a corpus of any size can be written in blocks.
+    """
+
+    def __init__(self, index_dir: Path, values: str = "float64"):
+        if values not in VALUE_ENCODINGS:
+            raise ValueError(f"values must be one of {VALUE_ENCODINGS}, not {values!r}")
+        self.values = values
+        self.index_dir = Path(index_dir)
+        self.tmp_dir = self.index_dir.with_name(f"{self.index_dir.name}.tmp-{os.getpid()}")
+        if self.tmp_dir.exists():
+            shutil.rmtree(self.tmp_dir)
+        self.tmp_dir.mkdir(parents=True)
+
+        self.sources: list[str] = []
+        self._source_ids: dict[str, int] = {}
+        self._chunk_files = {
+            "chunk_source": _NpyAppender(self.tmp_dir / "chunk_source.npy", np.int32),
+            "chunk_page": _NpyAppender(self.tmp_dir / "chunk_page.npy", np.int32),
+            "chunk_page_end": _NpyAppender(self.tmp_dir / "chunk_page_end.npy", np.int32),
+            "chunk_text_offsets": _NpyAppender(self.tmp_dir / "chunk_text_offsets.npy", np.int64),
+            "chunk_text": _NpyAppender(self.tmp_dir / "chunk_text.npy", np.uint8),
+            "chunk_also_offsets": _NpyAppender(self.tmp_dir / "chunk_also_offsets.npy", np.int64),
+            "chunk_also": _NpyAppender(self.tmp_dir / "chunk_also.npy", np.int32),
+        }
+        self._chunk_files["chunk_text_offsets"].append([0])
+        self._chunk_files["chunk_also_offsets"].append([0])
+
+        self._matrix_files: dict[str, _NpyAppender] = {}
+        self._has_counts: bool | None = None
+        self._lsa: dict | None = None
+        self._nnz = 0
+        self.n_chunks = 0
+        self.n_rows = 0
+
+    def add_chunks(self, chunks: list[dict]):
+        files = self._chunk_files
+        source_ids = np.empty(len(chunks), dtype=np.int32)
+        pages = np.empty(len(chunks), dtype=np.int32)
+        page_ends = np.empty(len(chunks), dtype=np.int32)
+        also_counts = np.zeros(len(chunks), dtype=np.int64)
+        also = []
+        encoded = []
+        for i, c in enumerate(chunks):
+            source_ids[i] = self._source_id(c["source"])
+            pages[i] = c["page"]
+            page_ends[i] = c.get("page_end", c["page"])
+            encoded.append(c["text"].encode("utf-8"))
+            for location in c.get("also", ()):
+                page = location["page"]
+                also.extend((self._source_id(location["source"]), page, location.get("page_end", page)))
+                also_counts[i] += 1
+
+        text_end = files["chunk_text"].count
+        files["chunk_source"].append(source_ids)
+        files["chunk_page"].append(pages)
+        files["chunk_page_end"].append(page_ends)
+        files["chunk_text_offsets"].append(text_end + np.cumsum([len(b) for b in encoded], dtype=np.int64))
+        files["chunk_text"].append(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        also_end = files["chunk_also"].count // 3
+        files["chunk_also_offsets"].append(3 * (also_end + np.cumsum(also_counts)))
+        files["chunk_also"].append(np.asarray(also, dtype=np.int32))
+        self.n_chunks += len(chunks)
+
+    def _source_id(self, source: str) -> int:
+        if source not in self._source_ids:
+            self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return self._source_ids[source]
+
+    def chunks(self) -> ChunkTable:
+        """Close the chunk files and reopen them memory-mapped for reading."""
+        for appender in self._chunk_files.values():
+            appender.close()
+        return _open_chunk_table(self.tmp_dir, self.sources, mmap_mode="r")
+
+    def add_rows(self, matrix, counts=None):
+        """
+        Append CSR rows, in the same order as the chunks. counts, when given,
+        are the raw term counts the TF-IDF rows were computed from (same
+        shape and sparsity); they enable BM25 ranking.
+        """
+        matrix = csr_matrix(matrix)
+        matrix.sort_indices()
+        if self._has_counts is None:
+            self._has_counts = counts is not None
+        elif self._has_counts != (counts is not None):
+            raise ValueError("counts must be given for every block of rows or for none")
+        compact = self.values != "float64"
+        if not self._matrix_files:
+            self._matrix_files = {
+                "matrix_data": _NpyAppender(self.tmp_dir / "matrix_data.npy", np.dtype(self.values)),
+                "matrix_indices": _NpyAppender(self.tmp_dir / "matrix_indices.npy", np.int32),
+                "matrix_indptr": _NpyAppender(self.tmp_dir / "matrix_indptr.npy", np.int64),
+            }
+            self._matrix_files["matrix_indptr"].append([0])
+            if counts is not None:
+                self._matrix_files["matrix_counts"] = _NpyAppender(
+                    self.tmp_dir / "matrix_counts.npy", np.uint16 if compact else np.int32
+                )
+                self._matrix_files["chunk_length"] = _NpyAppender(self.tmp_dir / "chunk_length.npy", np.float32)
+        if counts is not None:
+            counts = csr_matrix(counts)
+            counts.sort_indices()
+            if not (np.array_equal(counts.indptr, matrix.indptr) and np.array_equal(counts.indices, matrix.indices)):
+                raise ValueError("counts do not have the same sparsity as the TF-IDF rows")
+            term_counts = counts.data
+            if compact:
+                # BM25 saturates long before a term repeats 65535 times in a chunk.
+                term_counts = np.minimum(term_counts, np.iinfo(np.uint16).max)
+            self._matrix_files["matrix_counts"].append(term_counts)
+            self._matrix_files["chunk_length"].append(np.asarray(counts.sum(axis=1)).ravel())
+        values = matrix.data
+        if self.values == "uint8":
+            # Never round a stored weight down to 0: that would change the sparsity.
+            values = np.clip(np.rint(values / UINT8_SCALE), 1, 255)
+        self._matrix_files["matrix_data"].append(values)
+        self._matrix_files["matrix_indices"].append(matrix.indices)
+        self._matrix_files["matrix_indptr"].append(self._nnz + matrix.indptr[1:])
+        self._nnz += matrix.nnz
+        self.n_rows += matrix.shape[0]
+
+    def matrix(self, n_terms: int) -> csr_matrix:
+        """Close the matrix files and reopen the rows written so far memory-mapped."""
+        for appender in self._matrix_files.values():
+            appender.close()
+
+        def arr(name: str):
+            return np.load(self.tmp_dir / f"{name}.npy", mmap_mode="r")
+
+        return csr_matrix(
+            (arr("matrix_data"), arr("matrix_indices"), arr("matrix_indptr")),
+            shape=(self.n_rows, n_terms),
+            copy=False,
+        )
+
+    def add_lsa(self, components, vectors, info: dict | None = None):
+        """Store a dense LSA projection: components (dims x terms), vectors (chunks x dims)."""
+        if len(vectors) != self.n_chunks:
+            raise ValueError(f"{len(vectors)} LSA vectors for {self.n_chunks} chunks")
+        # Term-major, so projecting a query gathers just its terms' rows.
+        projection = np.ascontiguousarray(np.asarray(components, dtype=np.float32).T)
+        np.save(self.tmp_dir / "lsa_projection.npy", projection)
+        np.save(self.tmp_dir / "lsa_vectors.npy", np.asarray(vectors, dtype=np.float32))
+        self._lsa = {"dims": int(np.shape(components)[0]), **(info or {})}
+
+    def add_ivf(self, centroids, offsets, order, info: dict | None = None):
+        """Store IVF inverted lists over the LSA vectors (see kb_retrieval.build_ivf)."""
+        if self._lsa is None:
+            raise ValueError("add_lsa() must come before add_ivf()")
+        np.save(self.tmp_dir / "ivf_centroids.npy", np.asarray(centroids, dtype=np.float32))
+        np.save(self.tmp_dir / "ivf_offsets.npy", np.asarray(offsets, dtype=np.int64))
+        np.save(self.tmp_dir / "ivf_order.npy", np.asarray(order, dtype=np.int32))
+        self._lsa["ivf"] = {"lists": int(len(centroids)), **(info or {})}
+
+    def finish(self, vectorizer: TfidfVectorizer, manifest: dict | None = None) -> str:
+        """Write vocabulary and metadata, publish the directory, return its version."""
+        if self.n_rows != self.n_chunks:
+            raise ValueError(f"{self.n_rows} matrix rows written for {self.n_chunks} chunks")
+        for appender in [*self._chunk_files.values(), *self._matrix_files.values()]:
+            appender.close()
+
+        vocabulary = vectorizer.get_feature_names_out()
+        _save_strings(self.tmp_dir, "vocabulary", vocabulary)
+        np.save(self.tmp_dir / "idf.npy", vectorizer.idf_)
+        values = {"matrix_data": "postings_data"}
+        if self._has_counts:
+            values["matrix_counts"] = "postings_counts"
+        _write_postings(self.tmp_dir, self.n_rows, len(vocabulary), values)
+        if self._has_counts:
+            df = np.diff(np.load(self.tmp_dir / "postings_indptr.npy"))
+            np.save(self.tmp_dir / "bm25_idf.npy", bm25_idf(df, self.n_rows))
+            _write_bm25_weights(self.tmp_dir, np.float64 if self.values == "float64" else np.float32)
+
+        version = new_version()
+        meta = {
+            "format": FORMAT_VERSION,
+            "version": version,
+            "n_chunks": self.n_chunks,
+            "n_terms": len(vocabulary),
+            "sources": self.sources,
+            "vectorizer": _vectorizer_meta(vectorizer),
+            "row_norm": vectorizer.norm,
+            "values": self.values,
+            "value_scale": UINT8_SCALE if self.values == "uint8" else 1.0,
+        }
+        if self._has_counts:
+            meta["bm25"] = dict(BM25_PARAMS)
+        if self._lsa:
+            meta["lsa"] = self._lsa
+        with open(self.tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        if manifest is not None:
+            with open(self.tmp_dir / "manifest.json", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+
+        publish(self.tmp_dir, self.index_dir)
+        return version
+
+
+def bm25_idf(df, n_docs: int) -> np.ndarray:
+    """Okapi BM25 idf in the non-negative form used by Lucene."""
+    df = np.asarray(df, dtype=np.float64)
+    return np.log1p((n_docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_weights(
+    counts, rows, term_idf, chunk_length, avg_length: float, k1: float, b: float, delta: float
+) -> np.ndarray:
+    """
+    BM25(+) weight of postings: idf(t) * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl)) + delta),
+    for term counts of chunk rows, each with its term's idf.
+    """
+    tf = np.asarray(counts, dtype=np.float64)
+    length = np.asarray(chunk_length, dtype=np.float64)[np.asarray(rows)]
+    return term_idf * (tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * length / avg_length)) + delta)
+
+
+def _write_bm25_weights(directory: Path, dtype, block: int = 1 << 22):
+    """bm25_weights.npy for BM25_PARAMS, in postings order, computed in blocks of postings."""
+    counts = np.load(directory / "postings_counts.npy", mmap_mode="r")
+    rows = np.load(directory / "postings_indices.npy", mmap_mode="r")
+    indptr = np.load(directory / "postings_indptr.npy")
+    idf = np.load(directory / "bm25_idf.npy")
+    chunk_length = np.load(directory / "chunk_length.npy")
+    avg_length = float(np.mean(chunk_length, dtype=np.float64)) if len(chunk_length) else 1.0
+
+    out = np.lib.format.open_memmap(directory / "bm25_weights.npy", mode="w+", dtype=dtype, shape=(len(counts),))
+    for start in range(0, len(counts), block):
+        end = min(start + block, len(counts))
+        terms = np.searchsorted(indptr, np.arange(start, end), side="right") - 1
+        out[start:end] = bm25_weights(
+            counts[start:end], rows[start:end], idf[terms], chunk_length, avg_length, **BM25_PARAMS
+        )
+    out.flush()
+    del out
+
+
+def _write_postings(
+    directory: Path,
+    n_rows: int,
+    n_terms: int,
+    values: dict[str, str] | None = None,
+    block_rows: int = 65536,
+):
+    """
+    Write the term-major copy of the on-disk matrix (CSR of matrix.T).
+
+    A counting sort over row blocks: column counts give each term's slot
+    range, then every block scatters its entries into place. Rows are visited
+    in order, so each term's posting list comes out sorted by chunk. values
+    maps each row-major data array to its term-major output; all of them
+    share matrix_indices/matrix_indptr and are permuted together.
+    """
+    values = values or {"matrix_data": "postings_data"}
+    sources = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in values}
+    indices = np.load(directory / "matrix_indices.npy", mmap_mode="r")
+    indptr = np.load(directory / "matrix_indptr.npy", mmap_mode="r")
+    nnz = len(indices)
+
+    counts = np.zeros(n_terms, dtype=np.int64)
+    for start in range(0, n_rows, block_rows):
+        lo, hi = indptr[start], indptr[min(start + block_rows, n_rows)]
+        counts += np.bincount(indices[lo:hi], minlength=n_terms)
+    postings_indptr = np.zeros(n_terms + 1, dtype=np.int64)
+    np.cumsum(counts, out=postings_indptr[1:])
+
+    outputs = {
+        name: np.lib.format.open_memmap(directory / f"{out}.npy", mode="w+", dtype=sources[name].dtype, shape=(nnz,))
+        for name, out in values.items()
+    }
+    out_rows = np.lib.format.open_memmap(directory / "postings_indices.npy", mode="w+", dtype=np.int32, shape=(nnz,))
+    cursor = postings_indptr[:-1].copy()
+    for start in range(0, n_rows, block_rows):
+        end = min(start + block_rows, n_rows)
+        lo, hi = indptr[start], indptr[end]
+        cols = np.asarray(indices[lo:hi])
+        rows = np.repeat(np.arange(start, end, dtype=np.int32), np.diff(indptr[start:end + 1]))
+        order = np.argsort(cols, kind="stable")
+        cols = cols[order]
+        block_counts = np.bincount(cols, minlength=n_terms)
+        rank = np.arange(len(cols)) - (np.cumsum(block_counts) - block_counts)[cols]
+        positions = cursor[cols] + rank
+        for name, out_data in outputs.items():
+            out_data[positions] = np.asarray(sources[name][lo:hi])[order]
+        out_rows[positions] = rows[order]
+        cursor += block_counts
+
+    for out_data in outputs.values():
+        out_data.flush()
+    out_rows.flush()
+    del outputs, out_rows
+    np.save(directory / "postings_indptr.npy", postings_indptr)
+
+
+def write_index(
+    index_dir: Path,
+    chunks: list[dict],
+    vectorizer: TfidfVectorizer,
+    matrix,
+    manifest: dict | None = None,
+    counts=None,
+    lsa: dict | None = None,
+    values: str = "float64",
+) -> str:
+    """
+    Write an index directory and publish it atomically. Returns its version.
+
+    The new index is written next to index_dir and then swapped in with
+    renames, so a reader never sees a half-written directory.
+    """
+    writer = IndexWriter(index_dir, values=values)
+    writer.add_chunks(chunks)
+    writer.add_rows(matrix, counts=counts)
+    if lsa:
+        writer.add_lsa(lsa["components"], lsa["vectors"], lsa.get("info"))
+        if lsa.get("ivf"):
+            ivf = lsa["ivf"]
+            writer.add_ivf(ivf["centroids"], ivf["offsets"], ivf["order"], ivf.get("info"))
+    return writer.finish(vectorizer, manifest=manifest)
+
+
+def publish(tmp_dir: Path, index_dir: Path):
+    """Swap a freshly written directory into place."""
+    old_dir = index_dir.with_name(f"{index_dir.name}.old-{os.getpid()}")
+    if index_dir.exists():
+        os.rename(index_dir, old_dir)
+    os.rename(tmp_dir, index_dir)
+    if old_dir.exists():
+        # Processes that still have the old arrays mapped keep reading them
+        # until they unmap; removing the directory entry is safe on POSIX.
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+COMPANY_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def is_company_id(company_id: str) -> bool:
+    """company_id is safe to use as a directory name (no separators, no '..')."""
+    return bool(COMPANY_ID.match(company_id or "")) and ".." not in company_id
+
+
+def index_size(index_dir: Path) -> int:
+    """Bytes on disk: the most an opened index can pull into memory."""
+    return sum(p.stat().st_size for p in Path(index_dir).iterdir() if p.is_file())
+
+
+def read_meta(index_dir: Path) -> dict | None:
+    try:
+        with open(Path(index_dir) / META_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_manifest(index_dir: Path) -> dict | None:
+    try:
+        with open(Path(index_dir) / "manifest.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_vectorizer(params: dict, vocabulary: dict[str, int], idf) -> TfidfVectorizer:
+    """Recreate a fitted TfidfVectorizer for query transforms."""
+    params = dict(params)
+    params["ngram_range"] = tuple(params["ngram_range"])
+    vectorizer = TfidfVectorizer(vocabulary=vocabulary, **params)
+    vectorizer.idf_ = np.asarray(idf)
+    return vectorizer
+
+
+def _open_chunk_table(index_dir: Path, sources: list[str], mmap_mode) -> ChunkTable:
+    def arr(name: str):
+        return np.load(index_dir / f"{name}.npy", mmap_mode=mmap_mode)
+
+    return ChunkTable(
+        sources=sources,
+        source_ids=arr("chunk_source"),
+        pages=arr("chunk_page"),
+        page_ends=arr("chunk_page_end"),
+        text_offsets=arr("chunk_text_offsets"),
+        text_bytes=arr("chunk_text"),
+        # Indexes written before deduplication have no provenance arrays.
+        also_offsets=arr("chunk_also_offsets") if (index_dir / "chunk_also.npy").exists() else None,
+        also=arr("chunk_also") if (index_dir / "chunk_also.npy").exists() else None,
+    )
+
+
+class IndexChangedError(RuntimeError):
+    """The index directory was replaced while it was being opened."""
+
+
+def load_index(index_dir: Path, mmap: bool = True, attempts: int = 3) -> dict:
+    """
+    Open an index directory. Returns the same shape as the old pickle:
+    {"chunks", "vectorizer", "matrix"} plus "postings", "bm25" (None for
+    indexes built without term counts; with "weights" and their "params"
+    when the build stored BM25 weights), "lsa" (None unless built with
+    --lsa-dims), "version" and "meta".
+
+    A build may publish a new index while this runs; if meta.json no longer
+    names the version that was opened, the arrays may come from two builds,
+    so the load is retried.
+    """
+    index_dir = Path(index_dir)
+    for attempt in range(1, attempts + 1):
+        try:
+            index = _load_index_once(index_dir, mmap)
+        except FileNotFoundError:
+            # publish() briefly leaves no live directory between its renames.
+            if attempt == attempts:
+                raise
+            time.sleep(0.1)
+            continue
+        current = read_meta(index_dir)
+        if current and current.get("version") == index["version"]:
+            return index
+        time.sleep(0.1)
+    raise IndexChangedError(f"{index_dir} kept changing while it was being loaded")
+
+
+def _load_index_once(index_dir: Path, mmap: bool) -> dict:
+    meta = read_meta(index_dir)
+    if meta is None:
+        raise FileNotFoundError(f"{index_dir / META_FILE} not found")
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format {meta.get('format')!r} in {index_dir}")
+
+    mmap_mode = "r" if mmap else None
+
+    def arr(name: str):
+        return np.load(index_dir / f"{name}.npy", mmap_mode=mmap_mode)
+
+    n_chunks, n_terms = meta["n_chunks"], meta["n_terms"]
+    matrix = csr_matrix(
+        (arr("matrix_data"), arr("matrix_indices"), arr("matrix_indptr")),
+        shape=(n_chunks, n_terms),
+        copy=False,
+    )
+    chunks = _open_chunk_table(index_dir, meta["sources"], mmap_mode)
+    bounds = arr("vocabulary_offsets").tolist()
+    blob = arr("vocabulary").tobytes()
+    vocabulary = {blob[bounds[i]:bounds[i + 1]].decode("utf-8"): i for i in range(n_terms)}
+    vectorizer = build_vectorizer(meta["vectorizer"], vocabulary, arr("idf"))
+
+    postings = None
+    if (index_dir / "postings_indptr.npy").exists():
+        postings = csr_matrix(
+            (arr("postings_data"), arr("postings_indices"), arr("postings_indptr")),
+            shape=(n_terms, n_chunks),
+            copy=False,
+        )
+
+    bm25 = None
+    if postings is not None and (index_dir / "postings_counts.npy").exists():
+        bm25 = {
+            "postings": csr_matrix(
+                (arr("postings_counts"), postings.indices, postings.indptr),
+                shape=(n_terms, n_chunks),
+                copy=False,
+            ),
+            "chunk_length": arr("chunk_length"),
+            "idf": arr("bm25_idf"),
+        }
+        if meta.get("bm25") and (index_dir / "bm25_weights.npy").exists():
+            bm25["params"] = meta["bm25"]
+            bm25["weights"] = csr_matrix(
+                (arr("bm25_weights"), postings.indices, postings.indptr),
+                shape=(n_terms, n_chunks),
+                copy=False,
+            )
+
+    lsa = None
+    if meta.get("lsa") and (index_dir / "lsa_projection.npy").exists():
+        lsa = {"projection": arr("lsa_projection"), "vectors": arr("lsa_vectors")}
+        if meta["lsa"].get("ivf") and (index_dir / "ivf_order.npy").exists():
+            lsa["ivf"] = {
+                "centroids": arr("ivf_centroids"),
+                "offsets": arr("ivf_offsets"),
+                "order": arr("ivf_order"),
+            }
+
+    return {
+        "chunks": chunks,
+        "vectorizer": vectorizer,
+        "matrix": matrix,
+        "postings": postings,
+        "bm25": bm25,
+        "lsa": lsa,
+        "version": meta["version"],
+        "meta": meta,
+    }
@@ -2,19 +2,40 @@
 Kinneckt HR Assistant Backend (Flask)
 - Groq LLM + Retrieval (KB) + Session Memory
 - Mobile endpoint: POST /api/chat
+- Streaming chat (server-sent events): POST /api/chat/stream
+- Bulk KB search: POST /api/search/batch
+- Metrics (JSON): GET /admin/metrics
+- KB hot reload: POST /admin/reload-kb (also polled every KB_RELOAD_INTERVAL s)
+- Per-company KB segments (kb_tenants/<company_id>/), searched with the global KB;
+  private to callers holding the company's token
+- Chat prompts carry only the best-matching sentences of each KB snippet
+- Small talk skips the KB; weak snippets are dropped before the prompt
+- First-turn replies cached per company (same question + same KB snippets)
+- Reworded first-turn questions answered from a semantic cache (TF-IDF similarity, audited)
+- Chat prompts from precompiled per-(role, mode) templates with a fixed, cacheable prefix
 - Web UI: GET /
-- Admin dashboard: GET /admin
+- Admin dashboard: GET /admin (all /admin routes need ADMIN_TOKEN, or localhost)
 - Health check: GET /health
 - Creator attribution: answers "who created this app" etc.
 """
 
 import os
+import re
+import hmac
+import json
+import hashlib
+import time
 import uuid
 import pickle
+import statistics
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 
 # --- Optional CORS (recommended for mobile) ---
 try:
@@ -24,18 +45,122 @@ except Exception:
     CORS_AVAILABLE = False
 
 # --- Groq + retrieval ---
+import numpy as np
 from groq import Groq
-from sklearn.metrics.pairwise import cosine_similarity
+import kb_store
+from kb_retrieval import (
+    BM25Retriever,
+    DenseRetriever,
+    HybridRetriever,
+    IVFRetriever,
+    SparseRetriever,
+    reciprocal_rank_fusion,
+    relevance as kb_relevance,
+)
+import chat_prompts
+from kb_snippets import SnippetWindower, estimate_tokens
+from semantic_cache import SemanticCache, guard_terms
+from ttl_cache import MISSING, TTLCache
 
 
 # =========================
 # CONFIG
 # =========================
 BASE_DIR = Path(__file__).resolve().parent
-INDEX_PATH = BASE_DIR / "kb_index.pkl"
+INDEX_DIR = BASE_DIR / "kb_index"
+LEGACY_INDEX_PATH = BASE_DIR / "kb_index.pkl"
+TENANTS_INDEX_DIR = BASE_DIR / "kb_tenants"
 
 GROQ_MODEL = os.environ.get("GROQ_MODEL", "llama-3.3-70b-versatile")
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
+# Groq API endpoint override (e.g. a local stub for load tests)
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL") or None
+
+# Limits for POST /api/search/batch
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get("SEARCH_BATCH_MAX_QUERIES", 1000))
+SEARCH_MAX_TOP_K = int(os.environ.get("SEARCH_MAX_TOP_K", 20))
+
+# search_kb result cache (per worker process)
+KB_QUERY_CACHE_SIZE = int(os.environ.get("KB_QUERY_CACHE_SIZE", 2048))
+KB_QUERY_CACHE_TTL = float(os.environ.get("KB_QUERY_CACHE_TTL", 3600))
+
+# Ranking for search_kb: "bm25", "tfidf" (cosine), "lsa" (dense LSA
+# vectors, needs build_hr_kb.py --lsa-dims) or "hybrid" (KB_HYBRID_RANKERS
+# fused with reciprocal rank fusion). Falls back to tfidf when the index
+# lacks what the ranker needs.
+KB_RANKER = os.environ.get("KB_RANKER", "bm25").strip().lower()
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+BM25_DELTA = float(os.environ.get("BM25_DELTA", 0))  # > 0 = BM25+
+# lsa: inverted lists probed per query when the index has IVF lists
+# (build_hr_kb.py --ivf-lists); 0 = always exact
+KB_IVF_NPROBE = int(os.environ.get("KB_IVF_NPROBE", 8))
+# hybrid: rankers to fuse (all run on a thread pool; any that miss the
+# budget are dropped, the first falling back to its last result for the same
+# query), RRF constant and candidates taken from each ranker
+KB_HYBRID_RANKERS = [
+    r.strip().lower() for r in os.environ.get("KB_HYBRID_RANKERS", "bm25,lsa").split(",") if r.strip()
+]
+KB_SEARCH_BUDGET_MS = float(os.environ.get("KB_SEARCH_BUDGET_MS", 50))
+KB_RRF_K = int(os.environ.get("KB_RRF_K", 60))
+KB_HYBRID_DEPTH = int(os.environ.get("KB_HYBRID_DEPTH", 20))
+# Request threads per worker that search at once (gunicorn --threads, or the
+# async app's KB_RETRIEVAL_THREADS): the ranker pool gets this many threads
+# per hybrid ranker, so no query's rankers wait behind another query's
+KB_SEARCH_THREADS = int(os.environ.get("KB_SEARCH_THREADS", 8))
+
+# LLM reply cache for first-turn questions (per worker process): entries,
+# seconds an answer stays valid, and memory cap (LRU-evicted); 0 entries = off
+REPLY_CACHE_SIZE = int(os.environ.get("REPLY_CACHE_SIZE", 1024))
+REPLY_CACHE_TTL = float(os.environ.get("REPLY_CACHE_TTL", 6 * 3600))
+REPLY_CACHE_MB = float(os.environ.get("REPLY_CACHE_MB", 16))
+
+# Semantic reply cache, behind the exact one: a reworded first-turn question
+# at least SEMANTIC_CACHE_THRESHOLD cosine-similar to an answered one gets
+# that answer. Questions are encoded with the KB index ("tfidf", or "lsa"
+# when the index has LSA vectors: catches synonyms, but also near-misses
+# like vacation vs sick days). Entries (LRU-evicted; 0 = off), seconds an
+# answer stays valid, whether both questions must share a KB snippet (1/0),
+# and a JSON Lines log of every semantic hit for false-hit review (off by
+# default: it stores employees' questions; keep it outside the app directory)
+SEMANTIC_CACHE_SIZE = int(os.environ.get("SEMANTIC_CACHE_SIZE", 512))
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.85))
+SEMANTIC_CACHE_ENCODER = os.environ.get("SEMANTIC_CACHE_ENCODER", "tfidf").strip().lower()
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", 6 * 3600))
+SEMANTIC_CACHE_SHARED_SNIPPET = bool(int(os.environ.get("SEMANTIC_CACHE_SHARED_SNIPPET", 1)))
+SEMANTIC_CACHE_AUDIT_LOG = os.environ.get("SEMANTIC_CACHE_AUDIT_LOG", "")
+
+# Company segments kept open per worker: LRU-evicted past this many, or past
+# this much index data on disk (what their memory maps can pull in) plus what
+# their rankers hold in memory
+KB_TENANT_MAX_SEGMENTS = int(os.environ.get("KB_TENANT_MAX_SEGMENTS", 64))
+KB_TENANT_MEMORY_MB = float(os.environ.get("KB_TENANT_MEMORY_MB", 512))
+# Company segments are private: a request naming a company that has one must
+# carry that company's token (X-Company-Token header or "company_token" in
+# the body), the hex HMAC-SHA256 of the company_id under KB_TENANT_SECRET
+# (see company_token()). Unset = no request can use a company segment.
+KB_TENANT_SECRET = os.environ.get("KB_TENANT_SECRET", "")
+
+# /admin routes: callers must send ADMIN_TOKEN (X-Admin-Token header or
+# "Authorization: Bearer <token>"); unset = only direct local connections
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# KB context for /api/chat: at most KB_CONTEXT_MAX_SNIPPETS snippets, none
+# covering less than KB_MIN_COVERAGE of the message's terms (idf-weighted,
+# 0-1) and none below KB_RELATIVE_SCORE x the relevance of the best snippet
+# from the same index (score / the best score the ranker could give the
+# message; for hybrid ranking, its first ranker's), so a clear best match
+# goes to the LLM alone
+KB_CONTEXT_MAX_SNIPPETS = int(os.environ.get("KB_CONTEXT_MAX_SNIPPETS", 3))
+KB_MIN_COVERAGE = float(os.environ.get("KB_MIN_COVERAGE", 0.5))
+KB_RELATIVE_SCORE = float(os.environ.get("KB_RELATIVE_SCORE", 0.7))
+
+# Estimated tokens kept from each KB snippet in the chat prompt: the
+# sentences that best match the message (0 = send whole chunks)
+KB_SNIPPET_TOKENS = int(os.environ.get("KB_SNIPPET_TOKENS", 120))
+
+# Seconds between checks for a newly published index (0 = only POST /admin/reload-kb)
+KB_RELOAD_INTERVAL = float(os.environ.get("KB_RELOAD_INTERVAL", 30))
 
 app = Flask(__name__)
 
@@ -45,13 +170,75 @@ if CORS_AVAILABLE:
     CORS(app)
 
 # Groq client (only if key exists)
-client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+client = Groq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL) if GROQ_API_KEY else None
 if client:
     print("[LLM] Groq client initialized.")
 else:
     print("[LLM] WARNING: GROQ_API_KEY missing. /api/chat will return an error.")
 
+# Readers take a local reference (index = kb_index) and never lock, so a
+# reload only has to replace this reference; requests already running finish
+# on the index they started with.
 kb_index = None
+# Threads are started lazily on first use, i.e. inside each gunicorn worker.
+ranker_pool = ThreadPoolExecutor(
+    max_workers=max(1, KB_SEARCH_THREADS * len(KB_HYBRID_RANKERS)), thread_name_prefix="kb-ranker"
+)
+kb_load_lock = threading.Lock()
+kb_status = {"pid": None, "reloads": 0, "loaded_at": None, "last_error": None}
+# Estimated prompt tokens of chat snippets before/after windowing
+snippet_stats = {"snippets": 0, "tokens_in": 0, "tokens_out": 0}
+# Chat messages by what KB context they got (see retrieve_context)
+context_stats = {"messages": 0, "small_talk": 0, "no_relevant_snippets": 0, "snippets_sent": 0}
+# /api/chat/stream: outcome counts, plus the latest time-to-first-token and
+# full-reply durations (ms from request arrival) for percentiles
+stream_stats = {"streams": 0, "completed": 0, "disconnected": 0, "errors": 0}
+stream_ttft_ms = deque(maxlen=1000)
+stream_duration_ms = deque(maxlen=1000)
+# Estimated prompt tokens per chat template ("role/mode"): the precompiled
+# system message (a cacheable prefix) and everything after it
+prompt_stats: dict[str, dict] = {}
+
+# Keyed by (index version, ranker, normalized query, top_k), so results from a
+# previous index can never be served after it is replaced.
+kb_query_cache = TTLCache(max_entries=KB_QUERY_CACHE_SIZE, ttl_seconds=KB_QUERY_CACHE_TTL)
+
+# Keyed by reply_cache_key(): company, role, mode, normalized message and the
+# exact snippets sent, so a KB change that alters the context is a miss.
+reply_cache = TTLCache(
+    max_entries=max(1, REPLY_CACHE_SIZE),
+    ttl_seconds=REPLY_CACHE_TTL,
+    max_bytes=int(REPLY_CACHE_MB * (1 << 20)),
+)
+# Chat turns that could not use the reply cache because earlier turns shape the answer
+reply_cache_skipped = {"later_turns": 0}
+
+# Scoped by (company, role, mode, index version): question vectors from
+# another index version are not comparable.
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=max(1, SEMANTIC_CACHE_SIZE),
+    ttl_seconds=SEMANTIC_CACHE_TTL,
+    require_shared_snippet=SEMANTIC_CACHE_SHARED_SNIPPET,
+    audit_path=SEMANTIC_CACHE_AUDIT_LOG or None,
+)
+
+# company_id -> opened segment (same shape as kb_index, plus "bytes").
+# Segments load on a company's first request; dropping one from the cache
+# is enough to release it, requests still using it keep their reference.
+# A segment larger than the whole memory budget stays as the only one open
+# rather than being reloaded from disk on every request.
+tenant_segments = TTLCache(
+    max_entries=KB_TENANT_MAX_SEGMENTS,
+    max_bytes=int(KB_TENANT_MEMORY_MB * (1 << 20)),
+    sizeof=lambda segment: segment["bytes"],
+    keep_oversized=True,
+)
+tenant_load_lock = threading.Lock()
+# company_id -> whether kb_tenants/ has a segment for it, so companies without
+# one (most requests: "default") cost neither a stat nor a segment cache miss.
+# Cleared by refresh_tenants(); a new segment is seen within KB_RELOAD_INTERVAL.
+tenant_presence = TTLCache(max_entries=4096, ttl_seconds=KB_RELOAD_INTERVAL or None)
 
 # In-memory sessions
 # sessions[session_id] = {
@@ -66,43 +253,424 @@ sessions: dict[str, dict] = {}
 # =========================
 # KB LOAD + SEARCH
 # =========================
-def load_kb():
-    global kb_index
-    if INDEX_PATH.exists():
-        with open(INDEX_PATH, "rb") as f:
-            kb_index = pickle.load(f)
-        print(f"[KB] Loaded knowledge base from {INDEX_PATH}")
+def available_kb_version() -> str | None:
+    """Version of the index on disk, without loading it."""
+    meta = kb_store.read_meta(INDEX_DIR)
+    if meta:
+        return meta.get("version")
+    if LEGACY_INDEX_PATH.exists():
+        return f"legacy-{LEGACY_INDEX_PATH.stat().st_mtime_ns}"
+    return None
+
+
+def open_kb() -> dict | None:
+    """Load and warm up the index on disk. Does not touch kb_index."""
+    if kb_store.read_meta(INDEX_DIR):
+        # Memory-mapped: near-instant, and shared across gunicorn workers.
+        index = kb_store.load_index(INDEX_DIR)
+    elif LEGACY_INDEX_PATH.exists():
+        version = f"legacy-{LEGACY_INDEX_PATH.stat().st_mtime_ns}"
+        with open(LEGACY_INDEX_PATH, "rb") as f:
+            index = pickle.load(f)
+        index["version"] = version
+    else:
+        return None
+    return prepare_index(index)
+
+
+def prepare_index(index: dict) -> dict:
+    """Attach the retriever and query analyzer, and warm the index up."""
+    index["retriever"] = make_retriever(index)
+    index["analyzer"] = index["vectorizer"].build_analyzer()
+    index["max_idf"] = float(np.max(index["vectorizer"].idf_))
+    index["windower"] = SnippetWindower.from_vectorizer(index["vectorizer"], token_budget=KB_SNIPPET_TOKENS)
+    index["question_encoder"] = make_question_encoder(index)
+    # One probe query pages in the postings and the chunk table, so the first
+    # real request on a new index is not the one paying for page faults.
+    probe = index["retriever"].transform(["employee leave policy"])
+    for row, _score in index["retriever"].search(probe, 3):
+        index["chunks"][row]
+    return index
+
+
+def build_ranker(index: dict, name: str):
+    """One ranker over index, or None (with a warning) when the index cannot support it."""
+    if name == "tfidf":
+        return SparseRetriever.from_index(index)
+    if name == "bm25":
+        if index.get("bm25"):
+            ranker = BM25Retriever.from_index(index, k1=BM25_K1, b=BM25_B, delta=BM25_DELTA)
+            if ranker.heap_bytes:
+                print(
+                    f"[KB] BM25 weights computed in memory ({ranker.heap_bytes / (1 << 20):.1f} MB per worker): "
+                    f"the index stores them for {index['bm25'].get('params') or 'no parameters'}, not "
+                    f"BM25_K1={BM25_K1:g}, BM25_B={BM25_B:g}, BM25_DELTA={BM25_DELTA:g}"
+                )
+            return ranker
+        print("[KB] WARNING: index has no BM25 term counts. Rebuild with: python build_hr_kb.py")
+    elif name == "lsa":
+        if index.get("lsa"):
+            if KB_IVF_NPROBE > 0 and "ivf" in index["lsa"]:
+                return IVFRetriever.from_index(index, nprobe=KB_IVF_NPROBE)
+            return DenseRetriever.from_index(index)
+        print("[KB] WARNING: index has no LSA vectors. Rebuild with: python build_hr_kb.py --lsa-dims 256")
     else:
-        kb_index = None
-        print(f"[KB] WARNING: {INDEX_PATH} not found. Run: python build_hr_kb.py")
+        print(f"[KB] WARNING: unknown ranker {name!r}.")
+    return None
+
+
+def make_question_encoder(index: dict):
+    """texts -> L2-normalized vectors for the semantic reply cache."""
+    if SEMANTIC_CACHE_ENCODER == "lsa":
+        if index.get("lsa"):
+            return DenseRetriever.from_index(index).transform
+        print("[KB] WARNING: index has no LSA vectors; the semantic reply cache uses tfidf.")
+    return index["vectorizer"].transform
+
+
+def make_retriever(index: dict):
+    names = KB_HYBRID_RANKERS if KB_RANKER == "hybrid" else [KB_RANKER]
+    rankers = [r for r in (build_ranker(index, name) for name in names) if r is not None]
+    if not rankers:
+        print("[KB] Using tfidf ranking.")
+        return SparseRetriever.from_index(index)
+    if len(rankers) == 1:
+        return rankers[0]
+    return HybridRetriever(
+        rankers, ranker_pool, budget_ms=KB_SEARCH_BUDGET_MS, rrf_k=KB_RRF_K, depth=KB_HYBRID_DEPTH
+    )
 
 
-def search_kb(query: str, top_k: int = 3):
-    if not kb_index or not query.strip():
-        return []
+def load_kb(force: bool = True) -> bool:
+    """
+    Load the index on disk and swap it in. With force=False nothing happens
+    when the loaded version is already current. A missing or unreadable index
+    never replaces one that is already loaded. Returns True on a swap.
+    """
+    global kb_index
+    with kb_load_lock:
+        current = kb_index
+        if not force and current and current["version"] == available_kb_version():
+            return False
+
+        started = time.perf_counter()
+        try:
+            index = open_kb()
+        except Exception as e:
+            kb_status["last_error"] = str(e)
+            print(f"[KB] ERROR loading knowledge base: {e}" + ("; keeping the current index" if current else ""))
+            return False
+        if index is None:
+            print(f"[KB] WARNING: {INDEX_DIR} not found. Run: python build_hr_kb.py")
+            return False
+
+        kb_index = index
+        kb_query_cache.clear()
+        if current:
+            kb_status["reloads"] += 1
+        kb_status["loaded_at"] = datetime.utcnow().isoformat() + "Z"
+        kb_status["last_error"] = None
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if index["version"].startswith("legacy-"):
+        print(f"[KB] Loaded legacy knowledge base from {LEGACY_INDEX_PATH}. Rebuild with: python build_hr_kb.py")
+    else:
+        print(
+            f"[KB] {'Reloaded' if current else 'Loaded'} knowledge base {index['version']} from {INDEX_DIR} "
+            f"({len(index['chunks'])} chunks, {elapsed_ms:.0f} ms)"
+        )
+    return True
+
+
+def tenant_index_dir(company_id: str | None) -> Path | None:
+    if not company_id or not kb_store.is_company_id(company_id):
+        return None
+    return TENANTS_INDEX_DIR / company_id
+
+
+def has_tenant_segment(company_id: str | None) -> bool:
+    index_dir = tenant_index_dir(company_id)
+    if index_dir is None:
+        return False
+    present = tenant_presence.get(company_id)
+    if present is MISSING:
+        present = (index_dir / kb_store.META_FILE).exists()
+        tenant_presence.put(company_id, present)
+    return present
+
+
+def company_token(company_id: str) -> str:
+    """Token that lets a client use company_id's segment (hand it to that company)."""
+    return hmac.new(KB_TENANT_SECRET.encode(), company_id.encode(), hashlib.sha256).hexdigest()
+
+
+def request_company_token(data: dict, headers) -> str:
+    return str(headers.get("X-Company-Token") or data.get("company_token") or "").strip()
+
+
+def company_access_error(company_id: str | None, token: str) -> str | None:
+    """Why this caller may not act as company_id, or None: companies with a segment need its token."""
+    if not has_tenant_segment(company_id):
+        return None
+    if KB_TENANT_SECRET and token and hmac.compare_digest(token, company_token(company_id)):
+        return None
+    return f"A valid company token is required for company_id {company_id!r}."
+
+
+def get_tenant_index(company_id: str | None) -> dict | None:
+    """The company's segment, opened on first use; None when it has none."""
+    if not has_tenant_segment(company_id):
+        return None
+    segment = tenant_segments.get(company_id)
+    if segment is not MISSING:
+        return segment
+    index_dir = tenant_index_dir(company_id)
+
+    with tenant_load_lock:
+        segment = tenant_segments.pop(company_id, MISSING)
+        if segment is MISSING:
+            started = time.perf_counter()
+            try:
+                segment = prepare_index(kb_store.load_index(index_dir))
+            except Exception as e:
+                print(f"[KB] ERROR loading segment of company {company_id}: {e}")
+                return None
+            segment["bytes"] = kb_store.index_size(index_dir) + heap_bytes(segment["retriever"])
+            print(
+                f"[KB] Loaded segment of company {company_id} {segment['version']} "
+                f"({len(segment['chunks'])} chunks, {(time.perf_counter() - started) * 1000:.0f} ms)"
+            )
+            if segment["bytes"] > tenant_segments.max_bytes:
+                print(
+                    f"[KB] WARNING: segment of company {company_id} ({segment['bytes'] / (1 << 20):.0f} MB) "
+                    f"exceeds KB_TENANT_MEMORY_MB={KB_TENANT_MEMORY_MB:g}; it replaces all other open segments"
+                )
+        tenant_segments.put(company_id, segment)
+    return segment
+
+
+def heap_bytes(retriever) -> int:
+    """Memory a retriever allocated for itself, outside the index's memory maps."""
+    return sum(getattr(r, "heap_bytes", 0) for r in getattr(retriever, "rankers", [retriever]))
+
+
+def refresh_tenants(force: bool = False):
+    """Close segments that were rebuilt or deleted; the next request reopens them."""
+    tenant_presence.clear()
+    for company_id in tenant_segments.keys():
+        segment = tenant_segments.peek(company_id)
+        if segment is MISSING:
+            continue
+        meta = kb_store.read_meta(tenant_index_dir(company_id))
+        if force or not meta or meta.get("version") != segment["version"]:
+            tenant_segments.pop(company_id)
+
+
+def watch_kb():
+    """Background thread: pick up indexes published by build_hr_kb.py."""
+    while True:
+        time.sleep(KB_RELOAD_INTERVAL)
+        try:
+            load_kb(force=False)
+            refresh_tenants()
+        except Exception as e:
+            print("[KB] Reload check failed:", e)
+
+
+def start_kb():
+    """
+    Load the index and start the reload watcher, once per process. gunicorn
+    imports this module and forks workers without running __main__, so this
+    also runs from before_request in each worker.
+    """
+    if kb_status["pid"] == os.getpid():
+        return
+    with kb_load_lock:
+        if kb_status["pid"] == os.getpid():
+            return
+        kb_status["pid"] = os.getpid()
+    if kb_index is None:
+        load_kb()
+    if TENANTS_INDEX_DIR.exists() and not KB_TENANT_SECRET:
+        print("[KB] WARNING: KB_TENANT_SECRET not set; company segments in kb_tenants/ will not be served.")
+    if KB_RELOAD_INTERVAL > 0:
+        threading.Thread(target=watch_kb, name="kb-reload", daemon=True).start()
+
+
+def normalize_query(index: dict, query: str) -> str:
+    """
+    Cache key text: the query's analyzed terms, sorted. TF-IDF is a bag of
+    words, so queries that differ only in case, punctuation, stop words or
+    word order get identical results and share one cache entry.
+    """
+    return " ".join(sorted(index["analyzer"](query)))
 
-    vectorizer = kb_index["vectorizer"]
-    matrix = kb_index["matrix"]
-    chunks = kb_index["chunks"]
 
-    q_vec = vectorizer.transform([query])
-    sims = cosine_similarity(q_vec, matrix)[0]
-    top_indices = sims.argsort()[::-1][:top_k]
+def search_segment(index: dict, queries: list[str], top_k: int) -> list[list[tuple[int, float]]]:
+    """
+    [(row, score), ...] per query from one index. Cache misses are scored
+    together (one sparse matrix multiply for tfidf), and added to the cache.
+    """
+    retriever = index["retriever"]
+    keys = [(index["version"], retriever.name, normalize_query(index, q), top_k) for q in queries]
+    hits = [kb_query_cache.get(key) for key in keys]
+    missing = [i for i, h in enumerate(hits) if h is MISSING]
+    if len(missing) == 1:
+        i = missing[0]
+        hits[i] = retriever.search(retriever.transform([queries[i]]), top_k)
+        # A hybrid result missing a ranker that ran out of time is served
+        # but not cached, so the next identical query gets the full fusion.
+        if getattr(hits[i], "complete", True):
+            kb_query_cache.put(keys[i], hits[i])
+    elif missing:
+        q_mat = retriever.transform([queries[i] for i in missing])
+        for i, result in zip(missing, retriever.search_batch(q_mat, top_k)):
+            hits[i] = result
+            kb_query_cache.put(keys[i], result)
+    return hits
+
+
+def search_kb_batch(
+    queries: list[str], top_k: int = 3, company_id: str | None = None, relevance: bool = False
+):
+    """
+    search_kb() for many queries. A batch call also warms the query cache for
+    /api/chat. With relevance, each result also carries "relevance", score
+    divided by the best score its ranker could give that query (0-1, but
+    normalized per index: compare it only within a segment; a hybrid's
+    primary ranker, see kb_retrieval.relevance), "coverage" (see
+    query_coverage) and "segment": "company" or "global", the index it came
+    from.
+
+    With a company that has its own segment, the segment and the global
+    index are searched separately and their rankings merged with reciprocal
+    rank fusion (their scores come from different vocabularies and are not
+    comparable); on ties the company's own chunks come first.
+    """
+    segments = [s for s in (get_tenant_index(company_id), kb_index) if s]
+    if not segments:
+        return [[] for _ in queries]
+    per_segment = [search_segment(index, queries, top_k) for index in segments]
 
     results = []
-    for idx in top_indices:
-        c = chunks[int(idx)]
-        results.append(
-            {
-                "source": c.get("source", "unknown"),
-                "page": c.get("page", "?"),
-                "text": c.get("text", ""),
-                "score": float(sims[int(idx)]),
-            }
-        )
+    for i in range(len(queries)):
+        if len(segments) == 1:
+            merged = [(0, row, score) for row, score in per_segment[0][i]]
+        else:
+            scores = {}
+            rankings = []
+            for s_idx, hits in enumerate(per_segment):
+                rankings.append([((s_idx, row), score) for row, score in hits[i]])
+                scores.update({(s_idx, row): score for row, score in hits[i]})
+            merged = [(key[0], key[1], scores[key]) for key, _rrf in reciprocal_rank_fusion(rankings, top_k)]
+        if relevance:
+            rated = {}
+            for s_idx, index in enumerate(segments):
+                rows = [row for seg, row, _score in merged if seg == s_idx]
+                if rows:
+                    rated.update(zip(((s_idx, r) for r in rows), kb_relevance(index["retriever"], queries[i], rows)))
+            covered = query_coverage(segments, queries[i], [(s_idx, row) for s_idx, row, _score in merged])
+        formatted = []
+        for s_idx, row, score in merged:
+            result = format_kb_result(segments[s_idx]["chunks"][row], score)
+            if relevance:
+                result["relevance"] = round(float(rated[(s_idx, row)]), 4)
+                result["coverage"] = round(covered[(s_idx, row)], 4)
+                result["segment"] = "global" if segments[s_idx] is kb_index else "company"
+            formatted.append(result)
+        results.append(formatted)
     return results
 
 
+def query_coverage(segments: list[dict], query: str, hits: list[tuple[int, int]]) -> dict:
+    """
+    (segment, row) -> share of query's terms the chunk contains, each term
+    weighted by its idf in that segment (a term the segment lacks weighs
+    its highest idf). Terms no searched index knows are left out. Unlike
+    relevance, this reads the same in every segment and for every query:
+    0.5 means half the message's informative words are in the chunk.
+    """
+    terms = {t for index in segments for t in index["analyzer"](query) if t in index["vectorizer"].vocabulary_}
+    covered = {}
+    for s_idx, index in enumerate(segments):
+        vocabulary, idf = index["vectorizer"].vocabulary_, index["vectorizer"].idf_
+        cols = np.array([vocabulary.get(t, -1) for t in terms], dtype=np.int64)
+        weights = np.where(cols >= 0, idf[np.maximum(cols, 0)], index["max_idf"]) if len(cols) else cols
+        total = float(weights.sum()) or 1.0
+        matrix = index["matrix"]
+        for seg, row in hits:
+            if seg == s_idx:
+                present = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+                covered[(seg, row)] = float(weights[np.isin(cols, present)].sum()) / total
+    return covered
+
+
+def search_kb(query: str, top_k: int = 3, company_id: str | None = None, relevance: bool = False):
+    if not query.strip():
+        return []
+    return search_kb_batch([query], top_k=top_k, company_id=company_id, relevance=relevance)[0]
+
+
+def format_kb_result(c: dict, score: float) -> dict:
+    result = {
+        "source": c.get("source", "unknown"),
+        "page": c.get("page", "?"),
+        "text": c.get("text", ""),
+        "score": score,
+    }
+    if "page_end" in c:
+        result["page_end"] = c["page_end"]
+    if "also" in c:
+        # Same passage elsewhere in the corpus (folded by build_hr_kb.py --dedup).
+        result["also"] = c["also"]
+    return result
+
+
+def retrieve_context(message: str, company_id: str | None = None) -> list[dict]:
+    """
+    KB snippets worth sending to the LLM with message: none for small talk;
+    otherwise up to KB_CONTEXT_MAX_SNIPPETS, none below KB_MIN_COVERAGE and
+    none below KB_RELATIVE_SCORE x the best relevance in its own segment.
+    Scores and relevance are not compared across segments: company and
+    global hits come from different indexes, so the best company hit that
+    covers the message is always kept.
+    """
+    context_stats["messages"] += 1
+    if is_small_talk(message):
+        context_stats["small_talk"] += 1
+        return []
+    hits = search_kb(message, top_k=KB_CONTEXT_MAX_SNIPPETS, company_id=company_id, relevance=True)
+    hits = [h for h in hits if h["coverage"] >= KB_MIN_COVERAGE]
+    best = {}
+    for h in hits:
+        best[h["segment"]] = max(best.get(h["segment"], 0.0), h["relevance"])
+    hits = [h for h in hits if h["relevance"] >= KB_RELATIVE_SCORE * best[h["segment"]]]
+    if not hits:
+        context_stats["no_relevant_snippets"] += 1
+    context_stats["snippets_sent"] += len(hits)
+    return hits
+
+
+def window_snippets(query: str, snippets: list[dict], company_id: str | None = None) -> list[dict]:
+    """
+    Trim each snippet to the sentences that best match query
+    (KB_SNIPPET_TOKENS), with the term weights of the index it came from:
+    company_id's segment for "segment": "company" hits, else the global KB.
+    """
+    index = kb_index
+    if not snippets or not index or KB_SNIPPET_TOKENS <= 0:
+        return snippets
+    segment = get_tenant_index(company_id) if any(s.get("segment") == "company" for s in snippets) else None
+    windowed = []
+    for snip in snippets:
+        source = segment if segment and snip.get("segment") == "company" else index
+        windowed.append({**snip, "text": source["windower"].window(query, snip.get("text", ""))})
+    snippet_stats["snippets"] += len(snippets)
+    snippet_stats["tokens_in"] += sum(estimate_tokens(s["text"]) for s in snippets)
+    snippet_stats["tokens_out"] += sum(estimate_tokens(s["text"]) for s in windowed)
+    return windowed
+
+
 # =========================
 # SESSION
 # =========================
@@ -149,52 +717,56 @@ def creator_reply() -> str:
 
 
 # =========================
-# ROLE + MODE INSTRUCTIONS
+# SMALL TALK
 # =========================
-def build_role_instructions(role: str) -> str:
-    role = (role or "").lower()
-    if role in ("hr", "people ops", "people_ops", "people"):
-        return (
-            "The user is in HR / People Ops / Leadership. "
-            "Prioritize structure, documentation, scripts, action plans, and follow-up steps."
-        )
-    if role in ("manager", "leader", "supervisor"):
-        return (
-            "The user is a manager or team lead. "
-            "Help them structure conversations, ask good questions, and prevent escalation."
-        )
-    if role in ("employee", "individual contributor", "staff"):
-        return (
-            "The user is an employee. Help them describe what’s happening neutrally, "
-            "explain impact, and ask for support."
-        )
-    return (
-        "The user’s role is not clear. Ask if they are HR, manager, or employee and adapt accordingly."
-    )
+# Messages that are only greetings, thanks or acknowledgements: nothing to
+# look up in the KB.
+SMALL_TALK_WORDS = {
+    "hi", "hello", "hey", "yo", "hiya", "thanks", "thank", "thx", "ty", "cheers",
+    "ok", "okay", "k", "kk", "cool", "great", "nice", "awesome", "perfect",
+    "got", "it", "sounds", "good", "morning", "afternoon", "evening", "night",
+    "bye", "goodbye", "see", "you", "later", "yes", "yeah", "yep", "no", "nope",
+    "sure", "lol", "haha", "so", "much", "very", "a", "lot", "again", "there",
+    "appreciate", "that", "all", "right", "alright", "understood", "makes", "sense", "is",
+}
 
 
-def build_mode_instructions(mode: str) -> str:
-    mode = (mode or "chat").lower()
-    if mode == "mediation":
-        return (
-            "The user requested a structured mediation plan. "
-            "Use this exact structure:\n"
-            "1. Risk & Role Notes\n"
-            "2. Neutral Situation Summary\n"
-            "3. Key Issues Identified\n"
-            "4. Mediation Meeting Agenda\n"
-            "5. Suggested Scripts for the Mediator\n"
-            "6. Suggested Agreements\n"
-            "7. Follow-Up Plan\n"
-            "8. HR Documentation Summary (if appropriate)\n"
-            "Make it detailed and copy-paste friendly."
-        )
-    return "Normal chat mode."
+def is_small_talk(text: str) -> bool:
+    """Greetings, thanks and acknowledgements only (or no words at all, e.g. emoji)."""
+    words = re.findall(r"[a-z]+", (text or "").lower().replace("'", ""))
+    return len(words) <= 8 and all(w in SMALL_TALK_WORDS for w in words)
 
 
 # =========================
 # GROQ RESPONSE
 # =========================
+MISSING_KEY_REPLY = "Server is missing GROQ_API_KEY. Add it in Render Environment Variables and redeploy."
+
+
+def build_chat_messages(
+    user_message: str,
+    role: str,
+    company_id: str,
+    kb_snippets: list[dict],
+    history: list[dict],
+    mode: str = "chat",
+) -> list[dict]:
+    """
+    Groq messages for one chat turn (shared by /api/chat and /api/chat/stream):
+    the precompiled system message of the (role, mode) template, then the
+    history and the turn, counted in prompt_stats.
+    """
+    messages = chat_prompts.build_messages(user_message, role, company_id, kb_snippets, history, mode)
+    stats = prompt_stats.setdefault(
+        f"{chat_prompts.role_key(role)}/{chat_prompts.mode_key(mode)}",
+        {"prompts": 0, "static_tokens": 0, "variable_tokens": 0},
+    )
+    stats["prompts"] += 1
+    stats["static_tokens"] += estimate_tokens(messages[0]["content"])
+    stats["variable_tokens"] += sum(estimate_tokens(m["content"]) for m in messages[1:])
+    return messages
+
+
 def generate_chat_reply(
     user_message: str,
     role: str,
@@ -205,65 +777,149 @@ def generate_chat_reply(
 ) -> str:
 
     if not client:
-        return "Server is missing GROQ_API_KEY. Add it in Render Environment Variables and redeploy."
-
-    role_instructions = build_role_instructions(role)
-    mode_instructions = build_mode_instructions(mode)
+        return MISSING_KEY_REPLY
 
-    context_parts = []
-    for snip in kb_snippets[:3]:
-        context_parts.append(
-            f"From {snip.get('source','unknown')} (page {snip.get('page','?')}): {snip.get('text','')}"
-        )
-    context_text = "\n\n".join(context_parts) if context_parts else "No HR snippets retrieved."
+    messages = build_chat_messages(user_message, role, company_id, kb_snippets, history, mode)
+    chat_completion = client.chat.completions.create(
+        model=GROQ_MODEL,
+        messages=messages,
+        temperature=0.4,
+    )
+    return chat_completion.choices[0].message.content
 
-    system_prompt = f"""
-You are Kinneckt, an HR Assistant.
 
-You do NOT give legal advice.
-You do NOT decide who is right or wrong.
-You focus on clarity, behavior, communication, and next steps.
+def stream_chat_reply(
+    user_message: str,
+    role: str,
+    company_id: str,
+    kb_snippets: list[dict],
+    history: list[dict],
+    mode: str = "chat",
+):
+    """generate_chat_reply() as a generator of text pieces, as Groq produces them."""
+    if not client:
+        yield MISSING_KEY_REPLY
+        return
 
-Safety:
-If user describes harassment, discrimination, threats, violence, self-harm, stalking,
-or protected class concerns, advise escalation to HR/legal/emergency services as appropriate,
-and remind: "This is not legal advice."
+    messages = build_chat_messages(user_message, role, company_id, kb_snippets, history, mode)
+    stream = client.chat.completions.create(
+        model=GROQ_MODEL,
+        messages=messages,
+        temperature=0.4,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
-Role behavior:
-{role_instructions}
 
-Mode instructions:
-{mode_instructions}
+# =========================
+# REPLY CACHE
+# =========================
+def reply_cache_key(
+    user_message: str, role: str, mode: str, company_id: str, kb_snippets: list[dict], prior_history: list[dict]
+) -> tuple | None:
+    """
+    Cache key of a chat turn, or None when it must go to the LLM: the cache
+    is off, or the session already has turns (the reply depends on them).
+    Snippets are identified by location and a checksum of the text sent.
+    """
+    if REPLY_CACHE_SIZE <= 0:
+        return None
+    if prior_history:
+        reply_cache_skipped["later_turns"] += 1
+        return None
+    message = " ".join(re.findall(r"\w+", user_message.lower()))
+    # The template role and mode, not the raw strings: variants that select
+    # the same prompt share entries.
+    template = (chat_prompts.role_key(role), chat_prompts.mode_key(mode))
+    return (company_id, *template, message, snippet_ids(kb_snippets))
+
+
+def snippet_ids(kb_snippets: list[dict]) -> tuple:
+    return tuple(
+        (s.get("source"), s.get("page"), zlib.crc32(s.get("text", "").encode("utf-8"))) for s in kb_snippets
+    )
 
-Style:
-Warm, calm, neutral, professional, high EQ.
-Use short headers and clear bullets.
-"""
 
-    user_content = f"""
-Company (context only): {company_id}
+def semantic_probe(user_message: str, key: tuple | None) -> dict | None:
+    """
+    What the semantic cache needs about a cacheable turn (key from
+    reply_cache_key): the message vector, its scope and its guard terms
+    (negations and other dropped stop words, unknown terms). None when the
+    cache is off or the index knows no term of the message (nothing to
+    compare).
+    """
+    index = kb_index
+    if key is None or SEMANTIC_CACHE_SIZE <= 0 or not index:
+        return None
+    vocabulary = index["vectorizer"].vocabulary_
+    if not any(t in vocabulary for t in index["analyzer"](user_message)):
+        return None
+    company_id, role, mode, _message, snippets = key
+    return {
+        "vector": index["question_encoder"]([user_message]),
+        "scope": (company_id, role, mode, index["version"]),
+        "question": user_message,
+        "guard": guard_terms(user_message, vocabulary, index["analyzer"]),
+        "snippet_ids": frozenset(snippets),
+    }
+
+
+def lookup_reply(user_message: str, key: tuple | None) -> dict:
+    """
+    Cached answer to a chat turn: {"reply": str or None, "key", "probe",
+    "semantic": None, or {id, similarity, matched_question} when the reply
+    came from a different question}. Pass the result to store_reply().
+    """
+    lookup = {"reply": None, "key": key, "probe": None, "semantic": None}
+    if key is None:
+        return lookup
+    reply = reply_cache.get(key)
+    if reply is not MISSING:
+        lookup["reply"] = reply
+        return lookup
+    lookup["probe"] = probe = semantic_probe(user_message, key)
+    if probe is not None:
+        hit = semantic_cache.lookup(**probe)
+        if hit is not None:
+            lookup["reply"] = hit["reply"]
+            lookup["semantic"] = {
+                "id": hit["id"],
+                "similarity": hit["similarity"],
+                "matched_question": hit["question"],
+            }
+    return lookup
 
-User message:
-\"\"\"{user_message}\"\"\"
 
-HR reference snippets:
-{context_text}
-"""
+def store_reply(lookup: dict, reply_text: str):
+    # Configuration errors are not answers.
+    if lookup["key"] is None or lookup["reply"] is not None or not reply_text or reply_text == MISSING_KEY_REPLY:
+        return
+    reply_cache.put(lookup["key"], reply_text)
+    if lookup["probe"] is not None:
+        semantic_cache.put(reply=reply_text, **lookup["probe"])
 
-    messages = [{"role": "system", "content": system_prompt}]
 
-    for m in history[-6:]:
-        if m.get("role") in ("user", "assistant"):
-            messages.append({"role": m["role"], "content": m["content"]})
+def clear_reply_cache(company_id: str | None = None) -> int:
+    """Drop cached replies of one company (all with None); returns how many."""
+    semantic_cache.clear(company_id)
+    if company_id is None:
+        n = len(reply_cache)
+        reply_cache.clear()
+        return n
+    stale = [key for key in reply_cache.keys() if key[0] == company_id]
+    for key in stale:
+        reply_cache.pop(key)
+    return len(stale)
 
-    messages.append({"role": "user", "content": user_content})
 
-    chat_completion = client.chat.completions.create(
-        model=GROQ_MODEL,
-        messages=messages,
-        temperature=0.4,
-    )
-    return chat_completion.choices[0].message.content
+def chat_response_body(reply_text: str, session_id: str, lookup: dict) -> dict:
+    """/api/chat body; a semantic hit names the question it answered, for false-hit reports."""
+    body = {"reply": reply_text, "session_id": session_id, "cached": lookup["reply"] is not None}
+    if lookup["semantic"]:
+        body["semantic_match"] = lookup["semantic"]
+    return body
 
 
 # =========================
@@ -286,13 +942,31 @@ PAGE_TEMPLATE = """
 document.getElementById('f').addEventListener('submit', async (e) => {
   e.preventDefault();
   const msg = document.getElementById('msg').value;
-  const res = await fetch('/api/chat', {
+  const out = document.getElementById('out');
+  out.textContent = '';
+  const res = await fetch('/api/chat/stream', {
     method: 'POST',
     headers: {'Content-Type': 'application/json'},
     body: JSON.stringify({message: msg, role:'employee', company_id:'default', mode:'chat'})
   });
-  const data = await res.json();
-  document.getElementById('out').textContent = data.reply;
+  // Server-sent events: show each {delta} as it arrives.
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const {value, done} = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, {stream: true});
+    const events = buffer.split('\\n\\n');
+    buffer = events.pop();
+    for (const ev of events) {
+      const line = ev.split('\\n').find(l => l.startsWith('data: '));
+      if (!line) continue;
+      const data = JSON.parse(line.slice(6));
+      if (data.delta) out.textContent += data.delta;
+      if (data.error) out.textContent += '\\n' + data.error;
+    }
+  }
 });
 </script>
 </body>
@@ -303,6 +977,28 @@ document.getElementById('f').addEventListener('submit', async (e) => {
 # =========================
 # ROUTES
 # =========================
+@app.before_request
+def ensure_kb_started():
+    start_kb()
+
+
+@app.before_request
+def require_admin():
+    if request.path.startswith("/admin") and not admin_allowed(request.headers, request.remote_addr):
+        return jsonify({"error": "Admin access only."}), 403
+
+
+def admin_allowed(headers, remote_addr: str | None) -> bool:
+    """
+    /admin access: the caller sent ADMIN_TOKEN or, when none is set, connected
+    directly from this machine (a proxy in between makes every caller local).
+    """
+    if ADMIN_TOKEN:
+        sent = headers.get("X-Admin-Token") or headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        return hmac.compare_digest(sent.encode(), ADMIN_TOKEN.encode())
+    return remote_addr in ("127.0.0.1", "::1") and "X-Forwarded-For" not in headers
+
+
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok", "time": datetime.utcnow().isoformat() + "Z"}), 200
@@ -315,6 +1011,10 @@ def home():
 
 @app.route("/admin", methods=["GET"])
 def admin_dashboard():
+    return render_admin_dashboard()
+
+
+def render_admin_dashboard() -> str:
     rows_html = []
     for sid, sess in sessions.items():
         role = sess.get("role", "unknown")
@@ -347,6 +1047,128 @@ def admin_dashboard():
     return html
 
 
+def latency_percentiles(samples_ms) -> dict | None:
+    """p50/p95/p99 of recent samples (ms), or None before the first one."""
+    samples = list(samples_ms)
+    if not samples:
+        return None
+    if len(samples) == 1:
+        samples = samples * 2
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": round(cuts[49], 1), "p95": round(cuts[94], 1), "p99": round(cuts[98], 1), "count": len(samples_ms)}
+
+
+def metrics_snapshot() -> dict:
+    """Body of GET /admin/metrics (also served by the async app)."""
+    index = kb_index
+    return {
+        "kb_version": index["version"] if index else None,
+        "kb_chunks": len(index["chunks"]) if index else 0,
+        "kb_ranker": index["retriever"].name if index else None,
+        "kb_hybrid": index["retriever"].stats() if index and hasattr(index["retriever"], "stats") else None,
+        "kb_loaded_at": kb_status["loaded_at"],
+        "kb_reloads": kb_status["reloads"],
+        "kb_last_error": kb_status["last_error"],
+        "kb_query_cache": kb_query_cache.stats(),
+        "kb_tenants": {"loaded": tenant_segments.keys(), **tenant_segments.stats()},
+        "kb_snippets": {"token_budget": KB_SNIPPET_TOKENS, **snippet_stats},
+        "reply_cache": {**reply_cache.stats(), "skipped": dict(reply_cache_skipped)},
+        "semantic_cache": {"encoder": SEMANTIC_CACHE_ENCODER, **semantic_cache.stats()},
+        "llm_prompt": {
+            template: {
+                **stats,
+                "cacheable_share": round(
+                    stats["static_tokens"] / ((stats["static_tokens"] + stats["variable_tokens"]) or 1), 4
+                ),
+            }
+            for template, stats in list(prompt_stats.items())
+        },
+        "llm_stream": {
+            **stream_stats,
+            "ttft_ms": latency_percentiles(stream_ttft_ms),
+            "duration_ms": latency_percentiles(stream_duration_ms),
+        },
+        "kb_context": {
+            "max_snippets": KB_CONTEXT_MAX_SNIPPETS,
+            "min_coverage": KB_MIN_COVERAGE,
+            "relative_score": KB_RELATIVE_SCORE,
+            **context_stats,
+        },
+    }
+
+
+def reload_kb_now(force: bool = False) -> dict:
+    """Body of POST /admin/reload-kb."""
+    reloaded = load_kb(force=force)
+    refresh_tenants(force=force)
+    index = kb_index
+    return {
+        "reloaded": reloaded,
+        "kb_version": index["version"] if index else None,
+        "error": kb_status["last_error"],
+    }
+
+
+def parse_chat_request(data: dict) -> tuple[str, str | None, str, str, str]:
+    """(message, session_id, role, company_id, mode) of a chat request body."""
+    user_message = (data.get("message") or "").strip()
+    session_id = data.get("session_id")
+    role = (data.get("role") or "unknown").strip()
+    company_id = (data.get("company_id") or "default").strip()
+    mode = (data.get("mode") or "chat").strip().lower()
+    return user_message, session_id, role, company_id, mode
+
+
+def report_false_hit(data: dict) -> dict:
+    """Body of POST /admin/semantic-cache/false-hit: evicts the entry and logs the report."""
+    try:
+        entry_id = int(data.get("id"))
+    except (TypeError, ValueError):
+        return {"evicted": False, "error": "id must be the semantic_match id of a chat reply"}
+    return {"evicted": semantic_cache.report_false_hit(entry_id, note=str(data.get("note") or "")), "id": entry_id}
+
+
+def record_first_token(started: float) -> float:
+    """Time to first token of a chat stream started at started (perf_counter), in ms."""
+    ttft_ms = (time.perf_counter() - started) * 1000
+    stream_ttft_ms.append(ttft_ms)
+    return ttft_ms
+
+
+def record_stream_end(outcome: str, started: float):
+    """Count a finished chat stream: "completed", "disconnected" or "errors"."""
+    stream_stats[outcome] += 1
+    if outcome == "completed":
+        stream_duration_ms.append((time.perf_counter() - started) * 1000)
+
+
+@app.route("/admin/metrics", methods=["GET"])
+def admin_metrics():
+    return jsonify(metrics_snapshot()), 200
+
+
+@app.route("/admin/reload-kb", methods=["POST"])
+def admin_reload_kb():
+    """Load a newly published index now instead of waiting for the watcher."""
+    data = request.get_json(silent=True) or {}
+    return jsonify(reload_kb_now(force=bool(data.get("force")))), 200
+
+
+@app.route("/admin/reply-cache/clear", methods=["POST"])
+def admin_clear_reply_cache():
+    """Forget cached replies, e.g. after a company's policies change: {"company_id"} or everything."""
+    data = request.get_json(silent=True) or {}
+    company_id = (data.get("company_id") or "").strip() or None
+    return jsonify({"cleared": clear_reply_cache(company_id), "company_id": company_id}), 200
+
+
+@app.route("/admin/semantic-cache/false-hit", methods=["POST"])
+def admin_semantic_false_hit():
+    """Report a wrong semantic cache answer: {"id"} (from semantic_match), optional "note"."""
+    data = request.get_json(silent=True) or {}
+    return jsonify(report_false_hit(data)), 200
+
+
 @app.route("/api/chat", methods=["POST"])
 def api_chat():
     try:
@@ -355,11 +1177,10 @@ def api_chat():
         print("[API] JSON parse error:", e)
         return jsonify({"reply": "I had trouble reading your request JSON."}), 400
 
-    user_message = (data.get("message") or "").strip()
-    session_id = data.get("session_id")
-    role = (data.get("role") or "unknown").strip()
-    company_id = (data.get("company_id") or "default").strip()
-    mode = (data.get("mode") or "chat").strip().lower()
+    user_message, session_id, role, company_id, mode = parse_chat_request(data)
+    denied = company_access_error(company_id, request_company_token(data, request.headers))
+    if denied:
+        return jsonify({"reply": denied}), 403
 
     # ✅ Creator question handled here (no app resubmission needed)
     if is_creator_question(user_message):
@@ -368,29 +1189,163 @@ def api_chat():
     # Create or get session
     session_id, sess = get_or_create_session(session_id, company_id, role)
 
+    # Retrieval (skipped for small talk, weak matches dropped), then only the
+    # passages of each snippet that match the message
+    kb_snips = retrieve_context(user_message, company_id=sess["company_id"])
+    kb_snips = window_snippets(user_message, kb_snips, company_id=sess["company_id"])
+
+    # First turns with the same question and context share one answer
+    cache_key = reply_cache_key(user_message, sess["role"], mode, sess["company_id"], kb_snips, sess["history"])
+
     # Store user message in memory
     sess["history"].append({"role": "user", "content": user_message})
 
-    # Retrieval
-    kb_snips = search_kb(user_message, top_k=3)
-
-    # LLM reply (mediation works if mode == "mediation")
-    reply_text = generate_chat_reply(
-        user_message=user_message,
-        role=sess["role"],
-        company_id=sess["company_id"],
-        kb_snippets=kb_snips,
-        history=sess["history"],
-        mode=mode,
-    )
+    # Exact question first, then a reworded one (semantic cache)
+    lookup = lookup_reply(user_message, cache_key)
+    reply_text = lookup["reply"]
+    if reply_text is None:
+        # LLM reply (mediation works if mode == "mediation")
+        reply_text = generate_chat_reply(
+            user_message=user_message,
+            role=sess["role"],
+            company_id=sess["company_id"],
+            kb_snippets=kb_snips,
+            history=sess["history"],
+            mode=mode,
+        )
+        store_reply(lookup, reply_text)
 
     # Store assistant message
     sess["history"].append({"role": "assistant", "content": reply_text})
 
-    return jsonify({"reply": reply_text, "session_id": session_id}), 200
+    return jsonify(chat_response_body(reply_text, session_id, lookup)), 200
+
+
+STREAM_ERROR_REPLY = "The assistant could not finish this reply. Please try again."
+
+
+def sse_event(data: dict, event: str | None = None) -> str:
+    """One server-sent event (data is sent as JSON)."""
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def api_chat_stream():
+    """
+    /api/chat, streamed as server-sent events: "meta" ({session_id}), then
+    unnamed events ({delta}) as Groq produces text, then "done" ({reply,
+    session_id, ttft_ms, cached[, semantic_match]}) or "error". The session history gets the turn only
+    when the reply is complete, so an abandoned stream leaves no half answer.
+    """
+    started = time.perf_counter()
+    try:
+        data = request.get_json(force=True) or {}
+    except Exception as e:
+        print("[API] JSON parse error:", e)
+        return jsonify({"error": "I had trouble reading your request JSON."}), 400
+
+    user_message, session_id, role, company_id, mode = parse_chat_request(data)
+    denied = company_access_error(company_id, request_company_token(data, request.headers))
+    if denied:
+        return jsonify({"error": denied}), 403
+
+    user_turn = {"role": "user", "content": user_message}
+    lookup = lookup_reply(user_message, None)
+    if is_creator_question(user_message):
+        # Answered here like /api/chat: no session, nothing stored.
+        sess, pieces = None, iter([creator_reply()])
+    else:
+        session_id, sess = get_or_create_session(session_id, company_id, role)
+        kb_snips = retrieve_context(user_message, company_id=sess["company_id"])
+        kb_snips = window_snippets(user_message, kb_snips, company_id=sess["company_id"])
+        cache_key = reply_cache_key(user_message, sess["role"], mode, sess["company_id"], kb_snips, sess["history"])
+        lookup = lookup_reply(user_message, cache_key)
+        if lookup["reply"] is not None:
+            pieces = iter([lookup["reply"]])
+        else:
+            pieces = stream_chat_reply(
+                user_message=user_message,
+                role=sess["role"],
+                company_id=sess["company_id"],
+                kb_snippets=kb_snips,
+                history=sess["history"] + [user_turn],
+                mode=mode,
+            )
+
+    def events():
+        stream_stats["streams"] += 1
+        yield sse_event({"session_id": session_id}, event="meta")
+        parts, ttft_ms = [], None
+        try:
+            for piece in pieces:
+                if ttft_ms is None:
+                    ttft_ms = record_first_token(started)
+                parts.append(piece)
+                yield sse_event({"delta": piece})
+        except GeneratorExit:
+            record_stream_end("disconnected", started)
+            raise
+        except Exception as e:
+            print("[LLM] Stream error:", e)
+            record_stream_end("errors", started)
+            yield sse_event({"error": STREAM_ERROR_REPLY}, event="error")
+            return
+
+        reply_text = "".join(parts)
+        if sess is not None:
+            sess["history"].extend([user_turn, {"role": "assistant", "content": reply_text}])
+        store_reply(lookup, reply_text)
+        record_stream_end("completed", started)
+        yield sse_event(
+            {**chat_response_body(reply_text, session_id, lookup), "ttft_ms": round(ttft_ms or 0.0, 1)},
+            event="done",
+        )
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        # No proxy buffering (nginx, Render), or the events arrive all at once.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/search/batch", methods=["POST"])
+def api_search_batch():
+    """Bulk KB search for evaluation and cache-warming jobs."""
+    try:
+        data = request.get_json(force=True) or {}
+    except Exception as e:
+        print("[API] JSON parse error:", e)
+        return jsonify({"error": "I had trouble reading your request JSON."}), 400
+
+    body, status = search_batch_response(data, request_company_token(data, request.headers))
+    return jsonify(body), status
+
+
+def search_batch_response(data: dict, token: str = "") -> tuple[dict, int]:
+    """(JSON body, status) of POST /api/search/batch; token: the caller's company token."""
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return {"error": "'queries' must be a list of strings."}, 400
+    if len(queries) > SEARCH_BATCH_MAX_QUERIES:
+        return {"error": f"At most {SEARCH_BATCH_MAX_QUERIES} queries per request."}, 400
+
+    try:
+        top_k = int(data.get("top_k", 3))
+    except (TypeError, ValueError):
+        return {"error": "'top_k' must be an integer."}, 400
+    top_k = max(1, min(top_k, SEARCH_MAX_TOP_K))
+
+    company_id = (data.get("company_id") or "").strip() or None
+    denied = company_access_error(company_id, token)
+    if denied:
+        return {"error": denied}, 403
+    results = search_kb_batch([q.strip() for q in queries], top_k=top_k, company_id=company_id)
+    return {"results": results, "top_k": top_k}, 200
 
 
 if __name__ == "__main__":
-    load_kb()
+    start_kb()
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
 
@@ -0,0 +1,301 @@
+"""
+Kinneckt HR Assistant Backend, async serving mode (Quart, ASGI)
+- Same routes, sessions, KB and prompts as kinneckt_hr_assistant_app.py
+- Groq calls go through AsyncGroq, so a request waiting on the LLM holds no
+  thread: one worker serves as many concurrent chats as Groq will take
+- KB retrieval (CPU-bound, sub-millisecond) runs on a small thread pool so
+  slow paths (hybrid budget waits, cold company segments) never stall the
+  event loop
+
+Run with:
+    uvicorn kinneckt_hr_assistant_async:app --host 0.0.0.0 --port $PORT --workers 2
+
+The Flask app stays the default; load_test_hr_api.py compares the two.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    from quart import Quart, Response, request, jsonify
+except ImportError as e:
+    raise ImportError("Async mode needs Quart and an ASGI server: pip install quart uvicorn") from e
+
+# --- Optional CORS (recommended for mobile) ---
+try:
+    from quart_cors import cors
+    CORS_AVAILABLE = True
+except Exception:
+    CORS_AVAILABLE = False
+
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+import kinneckt_hr_assistant_app as hr
+
+
+# =========================
+# CONFIG
+# =========================
+# Open connections to Groq per worker (each in-flight chat holds one)
+GROQ_MAX_CONNECTIONS = int(os.environ.get("GROQ_MAX_CONNECTIONS", 1000))
+# Threads per worker for KB retrieval and admin work
+KB_RETRIEVAL_THREADS = int(os.environ.get("KB_RETRIEVAL_THREADS", 4))
+
+app = Quart(__name__)
+
+if CORS_AVAILABLE:
+    app = cors(app, allow_origin="*")
+
+async_client = (
+    AsyncGroq(
+        api_key=hr.GROQ_API_KEY,
+        base_url=hr.GROQ_BASE_URL,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS, max_keepalive_connections=100)
+        ),
+    )
+    if hr.GROQ_API_KEY
+    else None
+)
+retrieval_pool = ThreadPoolExecutor(max_workers=KB_RETRIEVAL_THREADS, thread_name_prefix="kb-retrieval")
+
+
+def run_blocking(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) on the retrieval pool."""
+    return asyncio.get_running_loop().run_in_executor(retrieval_pool, lambda: fn(*args, **kwargs))
+
+
+def chat_context(user_message: str, company_id: str) -> list[dict]:
+    return hr.window_snippets(user_message, hr.retrieve_context(user_message, company_id=company_id), company_id)
+
+
+# =========================
+# GROQ RESPONSE
+# =========================
+async def generate_chat_reply(
+    user_message: str,
+    role: str,
+    company_id: str,
+    kb_snippets: list[dict],
+    history: list[dict],
+    mode: str = "chat",
+) -> str:
+    if not async_client:
+        return hr.MISSING_KEY_REPLY
+
+    messages = hr.build_chat_messages(user_message, role, company_id, kb_snippets, history, mode)
+    chat_completion = await async_client.chat.completions.create(
+        model=hr.GROQ_MODEL,
+        messages=messages,
+        temperature=0.4,
+    )
+    return chat_completion.choices[0].message.content
+
+
+async def stream_chat_reply(
+    user_message: str,
+    role: str,
+    company_id: str,
+    kb_snippets: list[dict],
+    history: list[dict],
+    mode: str = "chat",
+):
+    if not async_client:
+        yield hr.MISSING_KEY_REPLY
+        return
+
+    messages = hr.build_chat_messages(user_message, role, company_id, kb_snippets, history, mode)
+    stream = await async_client.chat.completions.create(
+        model=hr.GROQ_MODEL,
+        messages=messages,
+        temperature=0.4,
+        stream=True,
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def single_piece(text: str):
+    yield text
+
+
+# =========================
+# ROUTES
+# =========================
+@app.before_serving
+async def startup():
+    await run_blocking(hr.start_kb)
+
+
+@app.before_request
+async def require_admin():
+    if request.path.startswith("/admin") and not hr.admin_allowed(request.headers, request.remote_addr):
+        return jsonify({"error": "Admin access only."}), 403
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    return jsonify({"status": "ok", "time": datetime.utcnow().isoformat() + "Z"}), 200
+
+
+@app.route("/", methods=["GET"])
+async def home():
+    return hr.PAGE_TEMPLATE
+
+
+@app.route("/admin", methods=["GET"])
+async def admin_dashboard():
+    return hr.render_admin_dashboard()
+
+
+@app.route("/admin/metrics", methods=["GET"])
+async def admin_metrics():
+    return jsonify(hr.metrics_snapshot()), 200
+
+
+@app.route("/admin/reload-kb", methods=["POST"])
+async def admin_reload_kb():
+    data = await request.get_json(silent=True) or {}
+    return jsonify(await run_blocking(hr.reload_kb_now, force=bool(data.get("force")))), 200
+
+
+@app.route("/admin/reply-cache/clear", methods=["POST"])
+async def admin_clear_reply_cache():
+    data = await request.get_json(silent=True) or {}
+    company_id = (data.get("company_id") or "").strip() or None
+    return jsonify({"cleared": hr.clear_reply_cache(company_id), "company_id": company_id}), 200
+
+
+@app.route("/admin/semantic-cache/false-hit", methods=["POST"])
+async def admin_semantic_false_hit():
+    data = await request.get_json(silent=True) or {}
+    return jsonify(hr.report_false_hit(data)), 200
+
+
+@app.route("/api/chat", methods=["POST"])
+async def api_chat():
+    try:
+        data = await request.get_json(force=True) or {}
+    except Exception as e:
+        print("[API] JSON parse error:", e)
+        return jsonify({"reply": "I had trouble reading your request JSON."}), 400
+
+    user_message, session_id, role, company_id, mode = hr.parse_chat_request(data)
+    denied = await run_blocking(hr.company_access_error, company_id, hr.request_company_token(data, request.headers))
+    if denied:
+        return jsonify({"reply": denied}), 403
+
+    if hr.is_creator_question(user_message):
+        return jsonify({"reply": hr.creator_reply()}), 200
+
+    session_id, sess = hr.get_or_create_session(session_id, company_id, role)
+    kb_snips = await run_blocking(chat_context, user_message, sess["company_id"])
+    cache_key = hr.reply_cache_key(user_message, sess["role"], mode, sess["company_id"], kb_snips, sess["history"])
+    sess["history"].append({"role": "user", "content": user_message})
+
+    lookup = await run_blocking(hr.lookup_reply, user_message, cache_key)
+    reply_text = lookup["reply"]
+    if reply_text is None:
+        reply_text = await generate_chat_reply(
+            user_message=user_message,
+            role=sess["role"],
+            company_id=sess["company_id"],
+            kb_snippets=kb_snips,
+            history=sess["history"],
+            mode=mode,
+        )
+        hr.store_reply(lookup, reply_text)
+
+    sess["history"].append({"role": "assistant", "content": reply_text})
+
+    return jsonify(hr.chat_response_body(reply_text, session_id, lookup)), 200
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+async def api_chat_stream():
+    """Same events as the Flask /api/chat/stream."""
+    started = time.perf_counter()
+    try:
+        data = await request.get_json(force=True) or {}
+    except Exception as e:
+        print("[API] JSON parse error:", e)
+        return jsonify({"error": "I had trouble reading your request JSON."}), 400
+
+    user_message, session_id, role, company_id, mode = hr.parse_chat_request(data)
+    denied = await run_blocking(hr.company_access_error, company_id, hr.request_company_token(data, request.headers))
+    if denied:
+        return jsonify({"error": denied}), 403
+
+    user_turn = {"role": "user", "content": user_message}
+    lookup = hr.lookup_reply(user_message, None)
+    if hr.is_creator_question(user_message):
+        sess, pieces = None, single_piece(hr.creator_reply())
+    else:
+        session_id, sess = hr.get_or_create_session(session_id, company_id, role)
+        kb_snips = await run_blocking(chat_context, user_message, sess["company_id"])
+        cache_key = hr.reply_cache_key(user_message, sess["role"], mode, sess["company_id"], kb_snips, sess["history"])
+        lookup = await run_blocking(hr.lookup_reply, user_message, cache_key)
+        if lookup["reply"] is not None:
+            pieces = single_piece(lookup["reply"])
+        else:
+            pieces = stream_chat_reply(
+                user_message=user_message,
+                role=sess["role"],
+                company_id=sess["company_id"],
+                kb_snippets=kb_snips,
+                history=sess["history"] + [user_turn],
+                mode=mode,
+            )
+
+    async def events():
+        hr.stream_stats["streams"] += 1
+        yield hr.sse_event({"session_id": session_id}, event="meta")
+        parts, ttft_ms = [], None
+        try:
+            async for piece in pieces:
+                if ttft_ms is None:
+                    ttft_ms = hr.record_first_token(started)
+                parts.append(piece)
+                yield hr.sse_event({"delta": piece})
+        except (asyncio.CancelledError, GeneratorExit):
+            hr.record_stream_end("disconnected", started)
+            raise
+        except Exception as e:
+            print("[LLM] Stream error:", e)
+            hr.record_stream_end("errors", started)
+            yield hr.sse_event({"error": hr.STREAM_ERROR_REPLY}, event="error")
+            return
+
+        reply_text = "".join(parts)
+        if sess is not None:
+            sess["history"].extend([user_turn, {"role": "assistant", "content": reply_text}])
+        hr.store_reply(lookup, reply_text)
+        hr.record_stream_end("completed", started)
+        yield hr.sse_event(
+            {**hr.chat_response_body(reply_text, session_id, lookup), "ttft_ms": round(ttft_ms or 0.0, 1)},
+            event="done",
+        )
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None  # a long reply must not hit Quart's response timeout
+    return response
+
+
+@app.route("/api/search/batch", methods=["POST"])
+async def api_search_batch():
+    """Bulk KB search for evaluation and cache-warming jobs."""
+    try:
+        data = await request.get_json(force=True) or {}
+    except Exception as e:
+        print("[API] JSON parse error:", e)
+        return jsonify({"error": "I had trouble reading your request JSON."}), 400
+
+    body, status = await run_blocking(hr.search_batch_response, data, hr.request_company_token(data, request.headers))
+    return jsonify(body), status
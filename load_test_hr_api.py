@@ -0,0 +1,213 @@
+"""
+Concurrent-users load test: Flask (gunicorn) vs the async app (uvicorn).
+
+    python load_test_hr_api.py [--users 1 8 32 128] [--llm-latency-ms 800] [--duration 10]
+
+Each server runs as one worker process against a local stub of the Groq
+API (GROQ_BASE_URL) that answers after --llm-latency-ms, so the numbers
+measure how many chats a worker keeps in flight, not Groq. For every level
+of concurrent users, each user sends /api/chat requests back to back for
+--duration seconds. Reported: completed requests per second, p50/p95
+latency, and requests still unfinished when the level ended. A level is
+"served" when p95 stays under --slo-ms and nothing was left waiting; the
+last served level is the worker's concurrent-users capacity.
+
+Needs gunicorn, quart and uvicorn (requirements.txt) and httpx.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent
+
+SERVERS = {
+    "flask-sync": ["gunicorn", "-w", "1", "-k", "sync", "--timeout", "300", "kinneckt_hr_assistant_app:app"],
+    "flask-gthread-8": [
+        "gunicorn", "-w", "1", "-k", "gthread", "--threads", "8", "--timeout", "300", "kinneckt_hr_assistant_app:app",
+    ],
+    "async-uvicorn": ["uvicorn", "--workers", "1", "--log-level", "warning", "kinneckt_hr_assistant_async:app"],
+}
+
+MESSAGES = [
+    "How many vacation days do full-time employees get?",
+    "What is the disciplinary procedure for misconduct?",
+    "How do I report harassment by a coworker?",
+    "Can my manager change my schedule without notice?",
+    "How should I give feedback to an underperforming employee?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# =========================
+# GROQ STUB
+# =========================
+def start_groq_stub(latency_ms: float) -> ThreadingHTTPServer:
+    """OpenAI-compatible /chat/completions that answers after latency_ms."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(latency_ms / 1000)
+            reply = "Here are some next steps. This is not legal advice."
+            if body.get("stream"):
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"role": "assistant", "content": reply}, "finish_reason": None}],
+                }
+                payload = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+                content_type = "text/event-stream"
+            else:
+                payload = json.dumps(
+                    {
+                        "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                        "model": body.get("model"),
+                        "choices": [
+                            {"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}
+                        ],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                    }
+                ).encode()
+                content_type = "application/json"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.daemon_threads = True
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# =========================
+# LOAD
+# =========================
+def start_server(name: str, port: int, groq_url: str) -> subprocess.Popen:
+    cmd = SERVERS[name] + (["--port", str(port)] if name.startswith("async") else ["-b", f"127.0.0.1:{port}"])
+    env = dict(os.environ, GROQ_API_KEY="stub", GROQ_BASE_URL=groq_url, KB_RELOAD_INTERVAL="0")
+    return subprocess.Popen(
+        cmd, cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # A chat, not /health: the first chat loads the KB in this worker.
+            httpx.post(f"{base_url}/api/chat", json={"message": "warm up"}, timeout=30).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.3)
+    raise RuntimeError(f"server at {base_url} did not come up")
+
+
+async def run_level(base_url: str, users: int, duration: float) -> dict:
+    latencies, errors = [], 0
+    stop_at = time.perf_counter() + duration
+
+    async def user(i: int, client: httpx.AsyncClient):
+        nonlocal errors
+        session_id = None
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                r = await client.post(
+                    f"{base_url}/api/chat",
+                    json={"message": MESSAGES[i % len(MESSAGES)], "session_id": session_id, "role": "employee"},
+                )
+                r.raise_for_status()
+                session_id = r.json().get("session_id")
+                latencies.append((time.perf_counter() - started) * 1000)
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        tasks = [asyncio.create_task(user(i, client)) for i in range(users)]
+        done, pending = await asyncio.wait(tasks, timeout=duration + 5)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (float("nan"), float("nan"))
+    return {
+        "users": users,
+        "rps": len(latencies) / duration,
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "errors": errors,
+        "unfinished": len(pending),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chat users per worker: Flask vs async.")
+    parser.add_argument("--servers", nargs="+", choices=list(SERVERS), default=list(SERVERS))
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0, help="Stub Groq response time.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level.")
+    parser.add_argument("--slo-ms", type=float, default=None, help="p95 target (default: 2 x LLM latency).")
+    args = parser.parse_args()
+    slo_ms = args.slo_ms or 2 * args.llm_latency_ms
+
+    stub = start_groq_stub(args.llm_latency_ms)
+    groq_url = f"http://127.0.0.1:{stub.server_port}"
+    print(f"Groq stub at {groq_url} answering in {args.llm_latency_ms:.0f} ms; SLO p95 <= {slo_ms:.0f} ms\n")
+    header = f"{'server':<16} {'users':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7} {'unfinished':>11}"
+    print(header)
+    print("-" * len(header))
+
+    capacity = {}
+    for name in args.servers:
+        port = free_port()
+        proc = start_server(name, port, groq_url)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base_url)
+            capacity[name] = 0
+            for users in args.users:
+                r = asyncio.run(run_level(base_url, users, args.duration))
+                print(
+                    f"{name:<16} {r['users']:>6} {r['rps']:>8.1f} {r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} "
+                    f"{r['errors']:>7} {r['unfinished']:>11}"
+                )
+                if r["p95_ms"] <= slo_ms and not r["errors"] and not r["unfinished"]:
+                    capacity[name] = users
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    print("\nConcurrent users served within the SLO by one worker:")
+    for name, users in capacity.items():
+        print(f"  {name:<16} {users}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
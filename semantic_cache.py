@@ -0,0 +1,223 @@
+"""
+Semantic reply cache: serves a stored LLM answer for a new question that is
+close enough to one already answered, even when the wording differs.
+
+Questions are stored as L2-normalized vectors (the KB index's TF-IDF
+vectorizer, or its LSA projection) in one small in-memory matrix per scope
+(the caller's scope tuple, e.g. company, role, mode and index version;
+scope[0] is the company); a lookup is a single sparse/dense product against
+that matrix. A hit also requires:
+
+- the same guard terms (guard_terms()): negations and before/after words
+  the vectorizer drops but that change the question. Its English stop list
+  removes "not", "without", "before", "after" and the like, so "Can I be
+  fired without notice?" and "... with notice?" encode identically; and
+  terms the index does not know (a new benefit's name, a misspelling) are
+  dropped too;
+- overlapping KB snippets, when required: two questions answered from
+  unrelated passages are not the same question.
+
+Every semantic hit is appended to a JSON Lines audit log so false hits can
+be reviewed; report_false_hit() evicts a bad entry and logs the report.
+"""
+
+import itertools
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import issparse, vstack
+
+
+# Stop words that negate or order in time: a question that differs in one
+# of these is a different question. Modals, quantifiers and prepositions are
+# left out, so "How can I ..." still matches "How do I ...".
+GUARDED_STOP_WORDS = frozenset(
+    """
+    not no nor never none nothing nobody neither without except
+    before after until since
+    """.split()
+)
+WORD = re.compile(r"\w+(?:'\w+)?")
+
+
+def guard_terms(text: str, vocabulary: dict, analyzer) -> frozenset:
+    """
+    Words of text that two questions must share for a semantic hit: the
+    guarded stop words ("don't", "cannot" and the like count as "not"), and
+    analyzed terms outside vocabulary (the index's term -> column map).
+    """
+    words = {w.lower() for w in WORD.findall(text)}
+    guarded = {"not" if w.endswith("n't") or w == "cannot" else w for w in words} & GUARDED_STOP_WORDS
+    unknown = {t for t in analyzer(text) if t not in vocabulary}
+    return frozenset(guarded | unknown)
+
+
+def _stack(vectors: list):
+    if issparse(vectors[0]):
+        return vstack(vectors, format="csr")
+    return np.vstack(vectors)
+
+
+def _similarities(matrix, vec) -> np.ndarray:
+    if issparse(matrix):
+        return np.asarray((matrix @ vec.T).todense()).ravel()
+    return matrix @ np.asarray(vec).ravel()
+
+
+class SemanticCache:
+    """
+    Replies keyed by question vectors. Entries beyond max_entries are
+    evicted least recently used first; entries older than ttl_seconds are
+    ignored and dropped. Vectors from different index versions are not
+    comparable: put the version in the scope, old entries then age out.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        max_entries: int = 512,
+        ttl_seconds: float | None = None,
+        require_shared_snippet: bool = True,
+        audit_path: Path | None = None,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.require_shared_snippet = require_shared_snippet
+        self.audit_path = Path(audit_path) if audit_path else None
+        self._entries: OrderedDict = OrderedDict()  # id -> entry dict
+        self._matrices: dict = {}  # scope -> (matrix, [entry ids]); rebuilt lazily
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0  # above threshold, refused by a guard
+        self.evictions = 0
+        self.false_hits = 0
+
+    def _matrix(self, scope):
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [i for i, e in self._entries.items() if e["scope"] == scope]
+            cached = (_stack([self._entries[i]["vector"] for i in ids]) if ids else None, ids)
+            self._matrices[scope] = cached
+        return cached
+
+    def _drop(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._matrices.pop(entry["scope"], None)
+
+    def lookup(
+        self, vector, scope: tuple, question: str, guard: frozenset, snippet_ids: frozenset
+    ) -> dict | None:
+        """Best stored entry above threshold that passes the guards, or None."""
+        with self._lock:
+            if self.ttl_seconds is not None:
+                now = time.monotonic()
+                for entry_id in [i for i, e in self._entries.items() if now - e["stored_at"] > self.ttl_seconds]:
+                    self._drop(entry_id)
+            matrix, ids = self._matrix(scope)
+            if matrix is None:
+                self.misses += 1
+                return None
+            sims = _similarities(matrix, vector)
+            for pos in np.argsort(-sims, kind="stable"):
+                if sims[pos] < self.threshold:
+                    break
+                entry = self._entries[ids[pos]]
+                if entry["guard"] != guard or (
+                    self.require_shared_snippet and (entry["snippets"] or snippet_ids) and not entry["snippets"] & snippet_ids
+                ):
+                    self.rejected += 1
+                    continue
+                self._entries.move_to_end(ids[pos])
+                self.hits += 1
+                hit = {"id": ids[pos], "similarity": round(float(sims[pos]), 4), **entry}
+                self._audit("hit", {**self._describe(hit), "question": question})
+                return hit
+            self.misses += 1
+            return None
+
+    def put(
+        self, vector, scope: tuple, question: str, guard: frozenset, snippet_ids: frozenset, reply: str
+    ) -> int:
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "vector": vector,
+                "scope": scope,
+                "question": question,
+                "guard": guard,
+                "snippets": snippet_ids,
+                "reply": reply,
+                "stored_at": time.monotonic(),
+            }
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            return entry_id
+
+    def report_false_hit(self, entry_id: int, note: str = "") -> bool:
+        """Evict an entry that answered a question it should not have."""
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return False
+            self._drop(entry_id)
+            self.false_hits += 1
+            self._audit("false_hit", {**self._describe({"id": entry_id, **entry}), "note": note})
+            return True
+
+    def clear(self, company_id: str | None = None) -> int:
+        """Drop the entries of one company (scope[0]), or all of them."""
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if company_id is None or e["scope"][0] == company_id]
+            for entry_id in stale:
+                self._drop(entry_id)
+            return len(stale)
+
+    def _describe(self, entry: dict) -> dict:
+        return {
+            "id": entry["id"],
+            "scope": list(entry["scope"]),
+            "matched_question": entry["question"],
+            "similarity": entry.get("similarity"),
+            "threshold": self.threshold,
+        }
+
+    def _audit(self, event: str, record: dict):
+        if self.audit_path is None:
+            return
+        line = json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "event": event, **record})
+        try:
+            with open(self.audit_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print("[CACHE] WARNING: could not write semantic cache audit log:", e)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "require_shared_snippet": self.require_shared_snippet,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "rejected_by_guards": self.rejected,
+            "evictions": self.evictions,
+            "false_hits_reported": self.false_hits,
+            "audit_log": str(self.audit_path) if self.audit_path else None,
+        }
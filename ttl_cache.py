@@ -0,0 +1,133 @@
+"""
+Small thread-safe LRU cache with an optional TTL, used for the in-process
+caches of the Kinneckt backend (KB query results, tenant index segments,
+LLM replies).
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU cache bounded by entry count and, optionally, by approximate bytes.
+    Entries older than ttl_seconds are treated as misses and dropped.
+    Counters (hits, misses, evictions, expirations, oversized) feed stats().
+
+    A value larger than max_bytes on its own is not stored (put() returns
+    False), so it cannot flush everything else; with keep_oversized it is
+    stored as the only entry instead, for caches where reloading it on every
+    miss costs more than the budget overrun.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float | None = None,
+        max_bytes: int | None = None,
+        sizeof=None,
+        keep_oversized: bool = False,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or sys.getsizeof
+        self.keep_oversized = keep_oversized
+        self._data: OrderedDict = OrderedDict()  # key -> (value, stored_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.oversized = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, stored_at, size = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> bool:
+        """Store value under key, evicting LRU entries over budget; False when value was not stored."""
+        if self.max_entries <= 0:
+            return False
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if self.max_bytes is not None and size > self.max_bytes:
+                self.oversized += 1
+                if not self.keep_oversized:
+                    return False
+            self._data[key] = (value, time.monotonic(), size)
+            self._bytes += size
+            # The newest entry itself is never evicted here (see keep_oversized).
+            while len(self._data) > 1 and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _key, (_value, _stored_at, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+            return True
+
+    def peek(self, key, default=MISSING):
+        """Value for key without touching LRU order, counters or expiry."""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[0]
+
+    def pop(self, key, default=None):
+        """Remove key without counting a lookup; returns its value or default."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self._bytes -= entry[2]
+            return entry[0]
+
+    def keys(self) -> list:
+        """Snapshot of the keys, least recently used first."""
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes if self.max_bytes is not None else None,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "oversized": self.oversized,
+        }